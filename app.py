@@ -1,26 +1,194 @@
 import streamlit as st
-import subprocess
-import json
 import os
 import database
 from dotenv import load_dotenv
-import sys
 import pandas as pd
-import io
+from datetime import datetime, timedelta
 import json_to_csv
+import exporter
+import jobs
+import circuit
+import pacing
+import timings
+import writer
 
 # Load environment variables
 load_dotenv()
 
+JOBS_REFRESH_SECONDS = 2
+# Seconds the Dashboard's source health and run timings may be stale
+STATS_TTL_SECONDS = 60
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def cached_query(name, data_version, *args, **kwargs):
+    """
+    database.<name>(*args, **kwargs), cached per data version. Ingest,
+    enrichment and dedupe bump the version, so results are reused until the
+    data changes.
+    """
+    return getattr(database, name)(*args, **kwargs)
+
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=STATS_TTL_SECONDS)
+def cached_stats(name, data_version, *args):
+    """
+    <module>.<function>(*args) for the Dashboard's source health and run
+    timings, e.g. "timings.get_phase_stats". Runs, blocks and pace changes
+    do not all bump the data version, so results are also dropped after
+    STATS_TTL_SECONDS.
+    """
+    module, function = name.split(".")
+    return getattr(globals()[module], function)(*args)
+
+
+GRID_SORTS = {"Name": "name", "Rating": "rating", "Category": "category", "District": "location", "Newest": "newest"}
+GRID_PAGE_SIZES = [25, 50, 100]
+
+
+def show_vendor_grid(key, locations, categories, default_location=None):
+    """
+    Filterable, sortable vendor table. Only the rows of the current page are
+    queried and rendered.
+    """
+    version = database.get_data_version()
+    f_col1, f_col2, f_col3, f_col4 = st.columns(4)
+    with f_col1:
+        category = st.selectbox("Category", ["All"] + sorted(categories), key=f"{key}_category")
+    with f_col2:
+        location_options = ["All"] + locations
+        if default_location and default_location not in location_options:
+            location_options.append(default_location)
+        location = st.selectbox("District", location_options, key=f"{key}_location",
+                                index=location_options.index(default_location) if default_location else 0)
+    with f_col3:
+        min_rating = st.slider("Minimum rating", 0.0, 5.0, 0.0, 0.5, key=f"{key}_min_rating")
+    with f_col4:
+        phone = st.selectbox("Phone", ["Any", "With phone", "Without phone"], key=f"{key}_phone")
+    s_col1, s_col2, s_col3 = st.columns(3)
+    with s_col1:
+        sort = st.selectbox("Sort by", list(GRID_SORTS), key=f"{key}_sort")
+    with s_col2:
+        descending = st.toggle("Descending", value=sort in ("Rating", "Newest"), key=f"{key}_desc")
+    with s_col3:
+        page_size = st.selectbox("Rows per page", GRID_PAGE_SIZES, index=1, key=f"{key}_page_size")
+
+    filters = dict(
+        category=None if category == "All" else category,
+        location=None if location == "All" else location,
+        min_rating=min_rating or None,
+        with_phone={"Any": None, "With phone": True, "Without phone": False}[phone],
+    )
+    # Back to the first page whenever the filters or ordering change
+    view = (tuple(sorted(filters.items())), sort, descending, page_size)
+    if st.session_state.get(f"{key}_view") != view:
+        st.session_state[f"{key}_view"] = view
+        st.session_state[f"{key}_page"] = 0
+    page = st.session_state[f"{key}_page"]
+
+    rows, total = cached_query("get_vendor_page", version, page, page_size, GRID_SORTS[sort], descending, **filters)
+    pages = max(1, -(-total // page_size))
+    if not rows:
+        st.info("No vendors match these filters.")
+        return
+    st.dataframe(
+        pd.DataFrame(rows, columns=["ID", "Name", "Phone", "Address", "Category", "District", "Rating", "Summary"]),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    p_col1, p_col2, p_col3 = st.columns([1, 2, 1])
+    with p_col1:
+        if st.button("Previous", key=f"{key}_prev", disabled=page == 0):
+            st.session_state[f"{key}_page"] = page - 1
+            st.rerun()
+    with p_col2:
+        st.caption(f"Page {page + 1} of {pages} ({total} vendors)")
+    with p_col3:
+        if st.button("Next", key=f"{key}_next", disabled=page + 1 >= pages):
+            st.session_state[f"{key}_page"] = page + 1
+            st.rerun()
+
+
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "🔄", "succeeded": "✅", "failed": "❌", "cancelled": "⏹️"}
+
+
+def show_jobs():
+    # Sources that served a CAPTCHA or block page; their jobs wait for the breaker
+    for breaker in circuit.open_breakers():
+        st.warning(f"{breaker['source']} returned a {breaker['last_page_state']} page. "
+                   f"Its jobs are paused until {breaker['open_until']}.")
+
+    recent_jobs = jobs.get_jobs(limit=20)
+    if not recent_jobs:
+        st.info("No jobs yet. Start a search above.")
+        return
+
+    for job in recent_jobs:
+        icon = JOB_STATUS_ICONS.get(job["status"], "")
+        title = f"{icon} #{job['id']} {job['kind'].title()} {job['category']} in {job['location']} - {job['status']}"
+        if job["kind"] == "scrape" and job["vendors_found"]:
+            title += f" ({job['vendors_found']} vendors)"
+        if job["attempts"] > 1:
+            title += f" - attempt {job['attempts']}/{job['max_attempts']}"
+        with st.expander(title, expanded=job["status"] == "running"):
+            if job["progress"]:
+                st.caption(job["progress"])
+            if job["status"] == "queued" and job["error"] and job["available_at"]:
+                st.caption(f"Retrying after {job['available_at']}")
+            if job["status"] == "succeeded" and job["kind"] == "scrape":
+                st.write(f"**New:** {job['vendors_new']} | **Updated:** {job['vendors_changed']}")
+            if job["error"]:
+                st.error(job["error"][-500:])
+            if job["status"] in jobs.ACTIVE_STATUSES:
+                if st.button("Cancel", key=f"cancel_{job['id']}"):
+                    jobs.cancel_job(job["id"])
+
+            log = jobs.tail_log(job["log_path"])
+            if log:
+                st.code(log)
+
+            # Conversion of the scraper's JSON output. The download button is
+            # drawn by show_exports, outside this panel, which re-runs every
+            # few seconds and would drop it
+            json_file = job["output_file"]
+            if json_file and os.path.exists(json_file):
+                if st.button("Convert to CSV", key=f"btn_{job['id']}"):
+                    csv_file, msg = json_to_csv.convert_json_to_csv(json_file)
+                    if csv_file:
+                        st.session_state.setdefault("csv_exports", {})[job["id"]] = csv_file
+                        st.rerun()
+                    else:
+                        st.error(f"Error: {msg}")
+
+
+def show_exports():
+    # CSV files converted from the jobs panel
+    for job_id, csv_file in sorted(st.session_state.get("csv_exports", {}).items()):
+        try:
+            with open(csv_file, "r", encoding='utf-8') as f:
+                csv_data = f.read()
+        except OSError as e:
+            st.error(f"Error reading CSV: {e}")
+            continue
+        st.download_button(
+            label=f"Download CSV of job #{job_id}",
+            data=csv_data,
+            file_name=os.path.basename(csv_file),
+            mime='text/csv',
+            key=f"dl_{job_id}"
+        )
+
+
 def main():
     st.set_page_config(page_title="Marriage Vendor Scraper", layout="wide")
     
-    # Initialize session state for scraped files
-    if 'scraped_files' not in st.session_state:
-        st.session_state['scraped_files'] = []
-
     st.title("Marriage Vendor Scraper")
     st.markdown("Search for wedding and event vendors by location and category.")
+
+    database.init_db()
+    # Start the job workers with the app, so jobs left queued by a restart run without a new submit
+    jobs.get_manager()
     
     # Sidebar only for Settings if needed (currently empty as API Key is removed)
     # Keeping it just in case or removing if empty.
@@ -60,127 +228,17 @@ def main():
 
         st.markdown("---")
         
-        # Add Source Selection
-        # Add Source Selection - REMOVED Google Maps as primary source
-        # source = st.radio("Select Data Source", ["Justdial", "Google Maps"], horizontal=True)
-        source = "Justdial"
-
         if st.button("Search Vendors", type="primary"):
-            # Clear previous scraped files
-            st.session_state['scraped_files'] = []
-            
             if not state or not district:
                 st.error("Please provide both State and District.")
             elif not selected_categories:
                 st.error("Please select at least one category.")
             else:
-                st.info(f"Searching in **{district}, {state}** for: {', '.join(selected_categories)}")
-                
-                # Initialize DB
-                database.init_db()
-                database.init_logs_db()
-
+                location = f"{district}, {state}"
+                # Jobs run in the background; the panel below follows their progress
                 for category in selected_categories:
-                    st.write(f"Initiating scraper for: {category}...")
-                    
-                    location = f"{district}, {state}"
-                    
-                    # Construct command to run Python scraper
-                    script_name = "scraper_agent.py"
-                    cmd = [
-                        sys.executable, script_name,
-                        "--category", category,
-                        "--location", location
-                    ]
-                    
-                    try:
-                        # Run the command and capture output
-                        result = subprocess.run(cmd, capture_output=True, text=True)
-                        
-                        if result.returncode == 0:
-                            st.success(f"Successfully scraped data for {category}!")
-                            
-                            with st.expander("View Scraper Debug Logs", expanded=False):
-                                st.code(result.stdout)
-                                if result.stderr:
-                                    st.write("STDERR:")
-                                    st.code(result.stderr)
-                            
-                            # Load and display the JSON if created
-                            sanitized_category = category.replace(' ', '_')
-                            sanitized_location = location.replace(' ', '_').replace(',', '').replace('/', '_')
-                            json_file = f"vendors_{sanitized_category}_{sanitized_location}.json"
-                            
-                            # Track this file for conversion
-                            if json_file not in st.session_state['scraped_files']:
-                                st.session_state['scraped_files'].append(json_file)
-                            
-                            if os.path.exists(json_file):
-                                with open(json_file, "r", encoding="utf-8") as f:
-                                    data = json.load(f)
-                                    
-                                    # Save to Database
-                                    new_count = 0
-                                    for vendor in data.get("vendors", []):
-                                        added = database.add_vendor(
-                                            vendor.get("name"),
-                                            vendor.get("phone"),
-                                            vendor.get("address"),
-                                            category,
-                                            location
-                                        )
-                                        if added:
-                                            new_count += 1
-                                            
-                                    msg = f"Added {new_count} new vendors"
-                                    st.info(f"{msg} to the database.")
-                                    database.log_scraper_run(category, location, "Success", msg)
-                                    
-                                    st.subheader(f"Results for {category}")
-                                    for idx, vendor in enumerate(data.get("vendors", [])):
-                                        v_name = vendor.get("name", "Unknown")
-                                        v_phone = vendor.get("phone", "")
-                                        v_rating = vendor.get("rating", "N/A")
-                                        
-                                        with st.expander(f"{v_name} (Rating: {v_rating})"):
-                                            st.write(f"**Phone:** {v_phone}")
-                                            st.write(f"**Address:** {vendor.get('address', '')}")
-                        else:
-                            st.error(f"Error running scraper for {category}")
-                            st.code(result.stderr)
-                            database.log_scraper_run(category, location, "Failed", result.stderr[:200] if result.stderr else "Unknown Error")
-                            
-                    except Exception as e:
-                        st.error(f"An error occurred: {str(e)}")
-                        database.log_scraper_run(category, location, "Exception", str(e))
-        
-        # Display Conversion Tools if files are available
-        if st.session_state['scraped_files']:
-            st.markdown("### Convert Scraped Data")
-            for json_file in st.session_state['scraped_files']:
-                if os.path.exists(json_file):
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        st.text(f"File: {json_file}")
-                    with col2:
-                        if st.button(f"Convert to CSV", key=f"btn_{json_file}"):
-                            csv_file, msg = json_to_csv.convert_json_to_csv(json_file)
-                            if csv_file:
-                                st.success(f"Converted!")
-                                try:
-                                    with open(csv_file, "r", encoding='utf-8') as f:
-                                        csv_data = f.read()
-                                    st.download_button(
-                                        label="Download CSV",
-                                        data=csv_data,
-                                        file_name=os.path.basename(csv_file),
-                                        mime='text/csv',
-                                        key=f"dl_{json_file}"
-                                    )
-                                except Exception as e:
-                                    st.error(f"Error reading CSV: {e}")
-                            else:
-                                st.error(f"Error: {msg}")
+                    jobs.submit_job("scrape", category, location)
+                st.info(f"Queued searches in **{district}, {state}** for: {', '.join(selected_categories)}")
 
         st.markdown("---")
         st.markdown("### Data Enrichment")
@@ -190,32 +248,50 @@ def main():
              else:
                  location = f"{district}, {state}"
                  for category in selected_categories:
-                     st.info(f"Enriching {category} via Google Maps...")
-                     cmd = [sys.executable, "enrich_agent.py", "--category", category, "--location", location]
-                     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-                     
-                     # Stream output
-                     with st.expander(f"Enrichment Logs - {category}", expanded=True):
-                         container = st.empty()
-                         output = ""
-                         for line in proc.stdout:
-                             output += line
-                             container.code(output)
-                         proc.wait()
-                     
-                     st.success(f"Enrichment completed for {category}.")
-                
+                     jobs.submit_job("enrich", category, location)
+                 st.info(f"Queued enrichment for: {', '.join(selected_categories)}")
+
+        st.markdown("---")
+        st.markdown("### Jobs")
+        # Re-run only the jobs panel every couple of seconds, so the rest of
+        # the page stays usable while scrapers run
+        if hasattr(st, "fragment"):
+            st.fragment(run_every=JOBS_REFRESH_SECONDS)(show_jobs)()
+        else:
+            st.button("Refresh Jobs")
+            show_jobs()
+        show_exports()
+
+        st.markdown("---")
+        st.markdown("### Results")
+        version = database.get_data_version()
+        show_vendor_grid(
+            "search_grid",
+            cached_query("get_locations", version),
+            list(cached_query("get_vendor_counts_by_category", version)) or categories,
+            default_location=f"{district}, {state}" if state and district else None,
+        )
+
     with tab2:
         st.header("Dashboard")
         
         # Initialize DB ensures tables exist if running for first time
         database.init_db()
         
-        total = database.get_total_vendors()
-        st.metric("Total Vendors Found", total)
-        
+        version = database.get_data_version()
+
+        def query(name, *args):
+            return cached_query(name, version, *args)
+
+        total = query("get_total_vendors")
+        with_phone, _ = query("get_phone_coverage")
+        m_col1, m_col2 = st.columns(2)
+        m_col1.metric("Total Vendors Found", total)
+        m_col2.metric("Vendors with Phone", with_phone,
+                      f"{with_phone / total:.0%} coverage" if total else None, delta_color="off")
+
         st.subheader("Vendors by Category")
-        counts = database.get_vendor_counts_by_category()
+        counts = query("get_vendor_counts_by_category")
         
         if counts:
             st.bar_chart(counts)
@@ -223,38 +299,151 @@ def main():
             st.info("No vendor data available yet. Use the Search tab to find vendors.")
             
         st.subheader("Top 5 Districts")
-        top_districts = database.get_top_districts(5) if hasattr(database, 'get_top_districts') else None
+        top_districts = query("get_top_districts", 5)
         if top_districts:
             st.bar_chart(top_districts)
-        
+
+        breakdown = query("get_category_location_counts")
+        if breakdown:
+            with st.expander("Category x District breakdown"):
+                st.dataframe(
+                    pd.DataFrame(breakdown, columns=["Category", "District", "Vendors", "With Phone"]),
+                    hide_index=True
+                )
+
+        st.subheader("Changes in the Last 7 Days")
+        # Whole hours, so the window (and its cache key) moves once an hour
+        since = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d %H:00:00")
+        new_vendors = query("get_new_vendors_since", since)
+        changes = query("get_changes_since", since)
+        c_col1, c_col2 = st.columns(2)
+        c_col1.metric("New Vendors", len(new_vendors))
+        c_col2.metric("Updated Fields", len(changes))
+        if changes:
+            st.dataframe(
+                pd.DataFrame(changes, columns=["Run Started", "Vendor ID", "Name", "Category", "District",
+                                               "Field", "Old Value", "New Value"]),
+                hide_index=True
+            )
+
+        # Learned request pace and circuit breaker of each source (see pacing.py, circuit.py)
+        breakers = {breaker["source"]: breaker for breaker in cached_stats("circuit.get_breakers", version)}
+        source_rows = [{
+            "Source": row["source"],
+            "Pace": f"{row['pace']:.2f}x",
+            "Latency (s)": round(row["latency"], 1) if row["latency"] is not None else None,
+            "Speed-ups": row["speedups"],
+            "Slow-downs": row["slowdowns"],
+            "Last Decision": row["last_decision"],
+            "Circuit": breakers[row["source"]]["state"],
+            "Paused Until": breakers[row["source"]]["open_until"],
+        } for row in cached_stats("pacing.get_metrics", version)]
+        if source_rows:
+            with st.expander("Source health"):
+                st.dataframe(pd.DataFrame(source_rows), hide_index=True)
+
+        # The single database writer of this app's job workers (see writer.py)
+        writer_stats = writer.get_stats()
+        if writer_stats and writer_stats["transactions"]:
+            with st.expander("Database writer"):
+                w_col1, w_col2, w_col3, w_col4 = st.columns(4)
+                w_col1.metric("Queue depth", f"{writer_stats['depth']}/{writer_stats['capacity']}",
+                              f"max {writer_stats['max_depth']}", delta_color="off")
+                w_col2.metric("Commit p50", f"{writer_stats['commit_p50'] * 1000:.0f} ms",
+                              f"p90 {writer_stats['commit_p90'] * 1000:.0f} ms", delta_color="off")
+                w_col3.metric("Ops per transaction", f"{writer_stats['ops_per_transaction']:.1f}",
+                              f"{writer_stats['transactions']} transactions", delta_color="off")
+                w_col4.metric("Producer waits", writer_stats["producer_waits"],
+                              f"{writer_stats['producer_wait_seconds']:.1f}s blocked", delta_color="off")
+                if writer_stats["failed_ops"]:
+                    st.warning(f"{writer_stats['failed_ops']} writes failed.")
+
+        # Where runs spend their time, per phase, and how many vendors they get through (see timings.py)
+        phase_stats = cached_stats("timings.get_phase_stats", version, since)
+        if phase_stats:
+            st.subheader("Run Timings in the Last 7 Days")
+            phases = pd.DataFrame([{
+                "Source": row["source"],
+                "Phase": row["phase"],
+                "Spans": row["spans"],
+                "Runs": row["runs"],
+                "p50 (s)": round(row["p50"], 2),
+                "p90 (s)": round(row["p90"], 2),
+                "Max (s)": round(row["max"], 2),
+                "Total (min)": round(row["total"] / 60, 1),
+            } for row in phase_stats])
+            st.bar_chart(phases.assign(Phase=phases["Source"] + " " + phases["Phase"])
+                         .set_index("Phase")[["p50 (s)", "p90 (s)"]])
+            st.dataframe(phases, hide_index=True)
+
+            runs = cached_stats("timings.get_throughput", version, since)
+            throughput = pd.DataFrame([{
+                "Started": pd.to_datetime(run["started_at"]),
+                "Run": f"{run['source']} {run['kind']}",
+                "Vendors per Minute": run["items_per_minute"],
+            } for run in runs if run["items_per_minute"] is not None])
+            if not throughput.empty:
+                st.line_chart(throughput.pivot_table(index="Started", columns="Run", values="Vendors per Minute"))
+            counters = pd.DataFrame([{"Run": f"#{run['id']} {run['source']} {run['kind']}",
+                                      "Started": run["started_at"], "Category": run["category"],
+                                      "District": run["location"], "Status": run["status"], **run["counts"]}
+                                     for run in reversed(runs)])
+            with st.expander("Run counters"):
+                st.dataframe(counters, hide_index=True)
+
+        st.subheader("Browse Vendors")
+        if total:
+            show_vendor_grid("dashboard_grid", query("get_locations"), list(counts))
+        else:
+            st.info("No vendors stored yet.")
+
         st.subheader("Export Data")
-        df = database.get_all_vendors_df() if hasattr(database, 'get_all_vendors_df') else pd.DataFrame()
-        
-        if not df.empty:
-            col1, col2 = st.columns(2)
-            with col1:
-                st.download_button(
-                    label="Download as CSV",
-                    data=df.to_csv(index=False).encode('utf-8'),
-                    file_name='vendors.csv',
-                    mime='text/csv',
+        if total:
+            e_col1, e_col2, e_col3, e_col4 = st.columns(4)
+            with e_col1:
+                export_category = st.selectbox("Category", ["All"] + sorted(counts), key="export_category")
+            with e_col2:
+                export_location = st.selectbox("District", ["All"] + query("get_locations"), key="export_location")
+            with e_col3:
+                export_min_rating = st.slider("Minimum rating", 0.0, 5.0, 0.0, 0.5, key="export_min_rating")
+            with e_col4:
+                export_phone_only = st.checkbox("Only vendors with phone", key="export_phone_only")
+            export_format = st.radio("Format", ["CSV", "Excel", "Parquet"], horizontal=True, key="export_format")
+
+            if st.button("Prepare Export"):
+                fmt = {"CSV": "csv", "Excel": "xlsx", "Parquet": "parquet"}[export_format]
+                filters = dict(
+                    category=None if export_category == "All" else export_category,
+                    location=None if export_location == "All" else export_location,
+                    min_rating=export_min_rating or None,
+                    with_phone=True if export_phone_only else None,
                 )
-            with col2:
-                buffer = io.BytesIO()
-                try:
-                    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                        df.to_excel(writer, index=False, sheet_name='Vendors')
-                        
-                    st.download_button(
-                        label="Download as Excel",
-                        data=buffer,
-                        file_name='vendors.xlsx',
-                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                    )
-                except ModuleNotFoundError:
-                    st.warning("xlsxwriter not found. Please run `pip install xlsxwriter` to enable Excel export.")
-                except Exception as e:
-                    st.error(f"Error creating Excel file: {e}")
+                export_key = (version, fmt, tuple(sorted(filters.items())))
+                previous = st.session_state.get('export_file')
+                # Same data and filters as the last export: serve the file already spooled
+                if not (previous and previous[3] == export_key and os.path.exists(previous[0])):
+                    # Drop the previous spool file; only one export is kept per session
+                    st.session_state.pop('export_file', None)
+                    if previous and os.path.exists(previous[0]):
+                        os.remove(previous[0])
+                    try:
+                        path, row_count = exporter.spool_export(fmt, **filters)
+                        st.session_state['export_file'] = (path, fmt, row_count, export_key)
+                    except ModuleNotFoundError as e:
+                        st.warning(f"{e.name} not found. Please run `pip install {e.name}` to enable this export format.")
+                    except Exception as e:
+                        st.error(f"Error creating export: {e}")
+
+            if 'export_file' in st.session_state:
+                path, fmt, row_count, _ = st.session_state['export_file']
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        st.download_button(
+                            label=f"Download {row_count} vendors ({fmt})",
+                            data=f,
+                            file_name=f"vendors{exporter.FORMATS[fmt][1]}",
+                            mime=exporter.FORMATS[fmt][0],
+                        )
         else:
             st.info("No data to export.")
 
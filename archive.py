@@ -0,0 +1,165 @@
+import argparse
+import glob
+import os
+import uuid
+from datetime import datetime
+from urllib.parse import quote
+import normalize
+
+# Columnar archive of every scrape
+# Each run is appended as one Parquet file under
+#   scrape_archive/date=YYYY-MM-DD/location=<loc>/category=<cat>/part-*.parquet
+# (hive layout, values URI-encoded), so queries over months of runs only open
+# the partitions their filters select. compact() merges a partition's small
+# run files into one.
+
+ARCHIVE_DIR = "scrape_archive"
+
+PARTITION_FIELDS = ["date", "location", "category"]
+
+
+def archive_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("run_id", pa.int64()),
+        ("scraped_at", pa.timestamp("s")),
+        ("source", pa.string()),
+        ("name", pa.string()),
+        ("phone", pa.string()),
+        ("phone_e164", pa.string()),
+        ("address", pa.string()),
+        ("rating", pa.string()),
+        ("rating_value", pa.float64()),
+        ("snippet", pa.string()),
+    ])
+
+
+def partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([(field, pa.string()) for field in PARTITION_FIELDS]), flavor="hive")
+
+
+def partition_dir(date, location, category, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir,
+                        f"date={date}",
+                        f"location={quote(location, safe='')}",
+                        f"category={quote(category, safe='')}")
+
+
+def _write_atomic(table, path):
+    import pyarrow.parquet as pq
+
+    # Dot-prefixed temporary name: dataset discovery skips it, so readers never
+    # see a half-written file
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def append_run(vendors, category, location, source="justdial", run_id=None, scraped_at=None,
+               archive_dir=ARCHIVE_DIR):
+    """
+    Append one run's vendor dicts to the archive. Returns the file written,
+    or None if there was nothing to write.
+    """
+    import pyarrow as pa
+
+    if not vendors:
+        return None
+    scraped_at = (scraped_at or datetime.now()).replace(microsecond=0)
+    columns = {
+        "run_id": [run_id] * len(vendors),
+        "scraped_at": [scraped_at] * len(vendors),
+        "source": [source] * len(vendors),
+        "name": [v.get("name") for v in vendors],
+        "phone": [v.get("phone") for v in vendors],
+        "phone_e164": normalize.normalize_phones([v.get("phone") for v in vendors]),
+        "address": [v.get("address") for v in vendors],
+        "rating": [v.get("rating") for v in vendors],
+        "rating_value": [normalize.parse_rating(v.get("rating")) for v in vendors],
+        "snippet": [v.get("snippet") for v in vendors],
+    }
+    table = pa.Table.from_pydict(columns, schema=archive_schema())
+
+    directory = partition_dir(scraped_at.strftime("%Y-%m-%d"), location, category, archive_dir)
+    os.makedirs(directory, exist_ok=True)
+    return _write_atomic(table, os.path.join(directory, f"part-{run_id or 'x'}-{uuid.uuid4().hex[:8]}.parquet"))
+
+
+def compact(archive_dir=ARCHIVE_DIR, before=None, min_files=2):
+    """
+    Merge the run files of each partition into a single file.
+    before: only compact dates earlier than this "YYYY-MM-DD" (skip today's
+    partitions that are still being appended to).
+    Returns the number of partitions compacted.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    compacted = 0
+    for directory in sorted(glob.glob(os.path.join(archive_dir, "date=*", "location=*", "category=*"))):
+        date = os.path.basename(os.path.dirname(os.path.dirname(directory)))[len("date="):]
+        if before and date >= before:
+            continue
+        parts = sorted(glob.glob(os.path.join(directory, "*.parquet")))
+        if len(parts) < min_files:
+            continue
+        merged = pa.concat_tables([pq.read_table(part) for part in parts])
+        merged = merged.sort_by([("scraped_at", "ascending"), ("name", "ascending")])
+        _write_atomic(merged, os.path.join(directory, f"compacted-{uuid.uuid4().hex[:8]}.parquet"))
+        for part in parts:
+            os.remove(part)
+        compacted += 1
+    return compacted
+
+
+def query(start_date=None, end_date=None, category=None, location=None, columns=None, filter=None,
+          archive_dir=ARCHIVE_DIR):
+    """
+    Read archived rows as a pyarrow Table. Date/category/location filters are
+    applied to the partition paths, so non-matching partitions are never
+    opened. filter is an optional extra pyarrow.dataset expression on the
+    data columns (e.g. ds.field("rating_value") >= 4).
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(archive_dir, format="parquet", partitioning=partitioning())
+    expression = None
+    conditions = []
+    if start_date:
+        conditions.append(ds.field("date") >= start_date)
+    if end_date:
+        conditions.append(ds.field("date") <= end_date)
+    if category:
+        conditions.append(ds.field("category") == category)
+    if location:
+        conditions.append(ds.field("location") == location)
+    if filter is not None:
+        conditions.append(filter)
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain and query the Parquet scrape archive.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact_parser = sub.add_parser("compact", help="Merge small run files per partition")
+    compact_parser.add_argument("--before", default=datetime.now().strftime("%Y-%m-%d"),
+                                help="Only compact dates before this (default: today)")
+    query_parser = sub.add_parser("query", help="Print archived rows")
+    query_parser.add_argument("--since")
+    query_parser.add_argument("--until")
+    query_parser.add_argument("--category")
+    query_parser.add_argument("--location")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        print(f"Compacted {compact(before=args.before)} partitions.")
+    else:
+        table = query(args.since, args.until, args.category, args.location)
+        print(table.to_pandas().to_string() if table.num_rows else "No archived rows match.")
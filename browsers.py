@@ -0,0 +1,95 @@
+import argparse
+import os
+
+# Browser profiles
+# How the scrapers launch Chromium. "desktop" is the headful 1366x768 window
+# they have always used; it needs a display. "server" is for display-less
+# worker boxes: headless, a smaller viewport, one renderer process with site
+# isolation off, no GPU, images, extensions or background services, and a
+# cap on each renderer's JavaScript heap. Each scraper keeps its own launch
+# arguments and stealth init scripts, which apply under every profile. The
+# profile is picked per source: BROWSER_PROFILE_<SOURCE> (for example
+# BROWSER_PROFILE_GOOGLE_MAPS=desktop), else BROWSER_PROFILE, else desktop.
+# python scraper_bench.py --profiles server desktop --concurrency 4 measures
+# RSS and CPU per concurrent scrape under each.
+
+PROFILES = {
+    "desktop": {
+        "headless": False,
+        "viewport": {"width": 1366, "height": 768},
+        "args": [],
+    },
+    "server": {
+        "headless": True,
+        # Still wide enough for the sites' desktop layouts
+        "viewport": {"width": 1280, "height": 720},
+        "args": [
+            "--disable-gpu",
+            "--disable-software-rasterizer",
+            "--disable-dev-shm-usage",
+            "--renderer-process-limit=1",
+            "--disable-site-isolation-trials",
+            "--disable-features=site-per-process,IsolateOrigins,Translate,MediaRouter,OptimizationHints,"
+            "BackForwardCache,CalculateNativeWinOcclusion",
+            "--disable-extensions",
+            "--disable-background-networking",
+            "--disable-background-timer-throttling",
+            "--disable-component-update",
+            "--disable-default-apps",
+            "--disable-sync",
+            "--no-first-run",
+            "--mute-audio",
+            "--blink-settings=imagesEnabled=false",
+            # MB of V8 heap per renderer
+            "--js-flags=--max-old-space-size=256",
+        ],
+    },
+}
+DEFAULT_PROFILE = os.environ.get("BROWSER_PROFILE", "desktop")
+
+# Headless Chromium reports "HeadlessChrome" in its user agent; used when a
+# scraper does not set its own
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/122.0.0.0 Safari/537.36")
+
+
+def profile_for(source):
+    """
+    Name of the profile `source` runs under.
+    """
+    name = os.environ.get(f"BROWSER_PROFILE_{source.upper()}", DEFAULT_PROFILE)
+    if name not in PROFILES:
+        raise ValueError(f"unknown browser profile {name!r} for {source} (expected one of {list(PROFILES)})")
+    return name
+
+
+def launch(playwright, source, args=(), init_scripts=(), profile=None):
+    """
+    Launch Chromium for `source` under `profile` (default: profile_for(source))
+    and open a context with the profile's viewport and the scraper's init
+    scripts. `args` are the scraper's own launch arguments; a
+    --user-agent among them wins over USER_AGENT. Returns (browser, context).
+    """
+    settings = PROFILES[profile or profile_for(source)]
+    args = list(args)
+    browser = playwright.chromium.launch(headless=settings["headless"], args=args + settings["args"])
+    context_options = {"viewport": settings["viewport"]}
+    if settings["headless"] and not any(arg.startswith("--user-agent=") for arg in args):
+        context_options["user_agent"] = USER_AGENT
+    context = browser.new_context(**context_options)
+    for script in init_scripts:
+        context.add_init_script(script)
+    return browser, context
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the browser profile of each source.")
+    parser.add_argument("sources", nargs="*", default=["justdial", "google_maps"])
+    args = parser.parse_args()
+
+    for source in args.sources:
+        name = profile_for(source)
+        settings = PROFILES[name]
+        viewport = settings["viewport"]
+        print(f"{source}: {name} ({'headless' if settings['headless'] else 'headful'}, "
+              f"{viewport['width']}x{viewport['height']}, {len(settings['args'])} extra flags)")
@@ -0,0 +1,85 @@
+import sqlite3
+from datetime import datetime, timedelta
+import database
+
+# Per-source circuit breaker
+# A CAPTCHA or block page (pagestate.BlockedError) opens the source's breaker:
+# workers stop claiming that source's jobs until the cooldown has passed, then
+# let a single job through as a probe. A probe that scrapes normally closes
+# the breaker; another block re-opens it with twice the cooldown. After
+# GIVE_UP_AFTER_TRIPS trips in a row the source's queued jobs are failed
+# instead of waiting (see jobs.handle_block), so a scheduled run still ends.
+# State lives in the source_health table, so every worker process and
+# coordinator node sees the same breaker.
+
+BASE_COOLDOWN_SECONDS = 15 * 60
+MAX_COOLDOWN_SECONDS = 2 * 3600
+GIVE_UP_AFTER_TRIPS = 3
+
+# For claim queries on the jobs table: true while `jobs.source` must not be
+# claimed, i.e. its breaker is cooling down or its probe is still running
+PAUSED_SQL = '''EXISTS (SELECT 1 FROM source_health h WHERE h.source = jobs.source AND h.state = 'open'
+                        AND (h.open_until > ? OR EXISTS (SELECT 1 FROM jobs probe
+                                                         WHERE probe.status = 'running' AND probe.source = h.source)))'''
+
+COLUMNS = ["source", "state", "trips", "open_until", "last_page_state", "updated_at"]
+
+
+def _connect():
+    return sqlite3.connect(database.DB_NAME, timeout=30)
+
+
+def record_block(source, page_state):
+    """
+    Open (or re-open) the breaker for `source`. Returns the breaker as a
+    dict, with gave_up set once it has tripped GIVE_UP_AFTER_TRIPS times
+    in a row.
+    """
+    conn = _connect()
+    try:
+        c = conn.cursor()
+        # Take the write lock before reading trips, so two workers blocked at once count two trips
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT trips FROM source_health WHERE source = ?", (source,))
+        row = c.fetchone()
+        trips = (row[0] if row else 0) + 1
+        cooldown = min(BASE_COOLDOWN_SECONDS * 2 ** (trips - 1), MAX_COOLDOWN_SECONDS)
+        open_until = (datetime.now() + timedelta(seconds=cooldown)).strftime("%Y-%m-%d %H:%M:%S")
+        c.execute('''INSERT INTO source_health (source, state, trips, open_until, last_page_state, updated_at)
+                     VALUES (?, 'open', ?, ?, ?, ?)
+                     ON CONFLICT(source) DO UPDATE SET state = 'open', trips = excluded.trips,
+                         open_until = excluded.open_until, last_page_state = excluded.last_page_state,
+                         updated_at = excluded.updated_at''',
+                  (source, trips, open_until, page_state, database._now()))
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Circuit for {source} opened after a {page_state} page (trip {trips}); paused until {open_until}.")
+    return {"source": source, "state": "open", "trips": trips, "open_until": open_until,
+            "last_page_state": page_state, "gave_up": trips >= GIVE_UP_AFTER_TRIPS}
+
+
+def record_success(source):
+    """
+    Close the breaker for `source` after a scrape got through.
+    """
+    conn = _connect()
+    c = conn.execute('''UPDATE source_health SET state = 'closed', trips = 0, open_until = NULL, updated_at = ?
+                        WHERE source = ? AND state != 'closed' ''', (database._now(), source))
+    if c.rowcount:
+        print(f"Circuit for {source} closed.")
+    conn.commit()
+    conn.close()
+
+
+def get_breakers():
+    conn = _connect()
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(COLUMNS)} FROM source_health ORDER BY source")
+    rows = c.fetchall()
+    conn.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+def open_breakers():
+    return [breaker for breaker in get_breakers() if breaker["state"] == "open"]
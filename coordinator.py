@@ -0,0 +1,435 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.request
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import archive
+import circuit
+import database
+import dedupe
+import jobs
+import known
+import pagestate
+import pipeline
+import planner
+import records
+import timings
+
+# Crawl coordinator
+# Spreads a crawl matrix over several scraper machines. The coordinator owns
+# the database: it queues one shard (a category/location/source scrape) per
+# row in the jobs table and leases shards to nodes over a small JSON-over-HTTP
+# API. Nodes only scrape; they send vendors back in batches and the
+# coordinator ingests them, so all results land in one database. Batches
+# travel as base64 records (records.to_text) rather than a list of dicts.
+#   POST /lease      {node}                          -> {job, lease_seconds, known} or
+#                                                       {job: null, active}
+#   POST /heartbeat  {node, job_id}                  -> {ok}
+#   POST /ingest     {node, job_id, records}         -> {ok, stats}
+#   POST /complete   {node, job_id, status, error,   -> {ok}
+#                     page_state, saved, metrics}
+#   GET  /status                                     -> shard counts and current leases
+# Leases are the jobs table's: a node that stops sending heartbeats loses
+# its shard when the lease runs out, and the shard goes to the next node
+# that asks. Set COORDINATOR_TOKEN on both sides to require a shared token.
+
+DEFAULT_PORT = 8765
+# Seconds between sweeps for shards whose node stopped sending heartbeats
+EXPIRE_INTERVAL = 5.0
+# Seconds an idle node waits before asking for work again
+NODE_POLL_INTERVAL = 2.0
+# Consecutive failed calls after which a node gives up on the coordinator
+MAX_UNREACHABLE = 30
+REQUEST_TIMEOUT = 60
+TOKEN = os.environ.get("COORDINATOR_TOKEN")
+
+
+class Coordinator:
+    """
+    Shard bookkeeping behind the HTTP API. Database writes go through one
+    lock, so nodes never contend for SQLite's write lock.
+    """
+    def __init__(self, batch):
+        self.batch = batch
+        self.nodes = {}
+        self._write_lock = threading.Lock()
+        # run_id -> database.PairRows of the run's shard, so each upload does not re-read the pair
+        self._pairs = {}
+
+    def _seen(self, node):
+        if node not in self.nodes:
+            print(f"[{datetime.now()}] Node {node} joined.")
+        self.nodes[node] = database._now()
+
+    def lease(self, node):
+        self._seen(node)
+        with self._write_lock:
+            job = jobs.claim_job(node, self.batch)
+            if job is None:
+                return {"job": None, "active": jobs.has_active_jobs(self.batch)}
+            run_id = database.start_scrape_run(job["category"], job["location"], job["source"])
+            # A retried shard counts from zero again
+            jobs._update_job(job["id"], node, run_id=run_id, vendors_found=0, vendors_new=0, vendors_changed=0,
+                             progress=f"Leased to {node}")
+        job["run_id"] = run_id
+        # Lets the node stop scrolling at vendors we already have
+        index = known.load(job["category"], job["location"]) if known.KNOWN_RUN_TO_STOP else None
+        print(f"[{datetime.now()}] Shard {job['id']} ({job['category']} in {job['location']}, {job['source']}) "
+              f"-> {node}, attempt {job['attempts']}.")
+        return {"job": job, "lease_seconds": jobs.LEASE_SECONDS, "known": index.to_text() if index else None,
+                "stop_after_known": known.KNOWN_RUN_TO_STOP}
+
+    def heartbeat(self, node, job_id):
+        self._seen(node)
+        with self._write_lock:
+            return {"ok": jobs._update_job(job_id, node, lease_expires_at=jobs._at(jobs.LEASE_SECONDS))}
+
+    def _held(self, node, job_id):
+        job = jobs.get_job(job_id)
+        if job is None or job["status"] != "running" or job["lease_owner"] != node:
+            return None
+        return job
+
+    def ingest(self, node, job_id, vendors):
+        self._seen(node)
+        with self._write_lock:
+            job = self._held(node, job_id)
+            if job is None:
+                # Lease expired or shard cancelled; the node should stop
+                return {"ok": False}
+            pair = self._pairs.setdefault(job["run_id"], database.PairRows())
+            stats = database.ingest_vendors(job["run_id"], vendors, job["category"], job["location"], pair)
+            found = job["vendors_found"] + len(vendors)
+            jobs._update_job(job_id, node, lease_expires_at=jobs._at(jobs.LEASE_SECONDS), vendors_found=found,
+                             vendors_new=job["vendors_new"] + stats["new"],
+                             vendors_changed=job["vendors_changed"] + stats["changed"],
+                             progress=f"{found} vendors received from {node}")
+        try:
+            archive.append_run(vendors, job["category"], job["location"], source=job["source"],
+                               run_id=job["run_id"])
+        except Exception as e:
+            # The archive is for analytics; never fail an ingest over it
+            print(f"Archiving run {job['run_id']} failed: {e}")
+        return {"ok": True, "stats": stats}
+
+    def complete(self, node, job_id, status, error=None, page_state=None, saved=None, metrics=None):
+        self._seen(node)
+        with self._write_lock:
+            job = self._held(node, job_id)
+            if job and job["run_id"]:
+                self._pairs.pop(job["run_id"], None)
+            if job is None:
+                job = jobs.get_job(job_id)
+                if job and job["status"] == "cancelled" and job["run_id"]:
+                    database.log_scraper_run(job["category"], job["location"], "Cancelled", "Cancelled")
+                    database.finish_scrape_run(job["run_id"], "Cancelled", "Cancelled")
+                return {"ok": False}
+
+            category, location, run_id = job["category"], job["location"], job["run_id"]
+            if metrics:
+                # The node's phase timings; its ingest spans include the upload
+                timings.RunMetrics.from_dict(metrics).save("Success" if status == "succeeded" else "Failed",
+                                                           scrape_run_id=run_id)
+            if status == "succeeded":
+                message = f"Added {job['vendors_new']} new vendors, updated {job['vendors_changed']}"
+                if saved:
+                    message += f"; {saved['summary']}"
+                    database.record_early_stop(run_id, saved["pages"], saved["seconds"])
+                database.log_scraper_run(category, location, "Success", message)
+                database.finish_scrape_run(run_id, "Success", message)
+                circuit.record_success(job["source"])
+                dedupe.resolve_new_vendors()
+                jobs._update_job(job_id, node, status="succeeded", finished_at=database._now(), progress=message,
+                                 lease_owner=None, lease_expires_at=None)
+            else:
+                message = (error or f"Node {node} stopped")[:200]
+                database.log_scraper_run(category, location, "Failed", message)
+                database.finish_scrape_run(run_id, "Failed", message)
+                if status == "blocked":
+                    # Pauses the source for every node, not just this one
+                    jobs.handle_block(job, node, page_state, message)
+                else:
+                    jobs._retry_or_fail(job, node, message)
+        print(f"[{datetime.now()}] Shard {job_id} {status} on {node}.")
+        return {"ok": True}
+
+    def status(self):
+        rows = jobs.get_jobs(limit=None, batch=self.batch)
+        return {
+            "batch": self.batch,
+            "counts": dict(Counter(row["status"] for row in rows)),
+            "leases": [{"job_id": row["id"], "node": row["lease_owner"], "expires": row["lease_expires_at"]}
+                       for row in rows if row["status"] == "running"],
+            "nodes": self.nodes,
+        }
+
+    def expire(self):
+        with self._write_lock:
+            expired = jobs.expire_leases()
+            if expired:
+                # A requeued shard starts a new run
+                running = {job["run_id"] for job in jobs.get_jobs(limit=None, batch=self.batch)
+                           if job["status"] == "running"}
+                self._pairs = {run_id: pair for run_id, pair in self._pairs.items() if run_id in running}
+            return expired
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The node went away; a shard leased in this reply expires like any other
+            pass
+
+    def _authorized(self):
+        if TOKEN and self.headers.get("X-Coordinator-Token") != TOKEN:
+            self._reply(403, {"error": "bad token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != "/status":
+            return self._reply(404, {"error": f"unknown path {self.path}"})
+        self._reply(200, self.server.coordinator.status())
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        coordinator = self.server.coordinator
+        routes = {
+            "/lease": lambda b: coordinator.lease(b["node"]),
+            "/heartbeat": lambda b: coordinator.heartbeat(b["node"], b["job_id"]),
+            # Nodes from before the records format send a list of vendor dicts
+            "/ingest": lambda b: coordinator.ingest(b["node"], b["job_id"],
+                                                    records.to_dicts(records.from_text(b["records"]))
+                                                    if "records" in b else b["vendors"]),
+            "/complete": lambda b: coordinator.complete(b["node"], b["job_id"], b["status"], b.get("error"),
+                                                        b.get("page_state"), b.get("saved"), b.get("metrics")),
+        }
+        if self.path not in routes:
+            return self._reply(404, {"error": f"unknown path {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            self._reply(200, routes[self.path](body))
+        except (KeyError, ValueError) as e:
+            self._reply(400, {"error": f"bad request: {e}"})
+        except sqlite3.Error as e:
+            self._reply(503, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        # Shard events are printed by the Coordinator; skip per-request lines
+        pass
+
+
+def serve(batch, host="127.0.0.1", port=DEFAULT_PORT, keep_serving=False):
+    """
+    Serve `batch` to nodes until none of its shards are queued or running
+    (or forever with keep_serving), then resolve duplicates and print the
+    batch report.
+    """
+    coordinator = Coordinator(batch)
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.coordinator = coordinator
+    threading.Thread(target=server.serve_forever, name="coordinator-http", daemon=True).start()
+    print(f"[{datetime.now()}] Coordinating {batch} on http://{host}:{port}. Press Ctrl+C to stop.")
+    try:
+        while keep_serving or jobs.has_active_jobs(batch):
+            time.sleep(EXPIRE_INTERVAL)
+            expired = coordinator.expire()
+            if expired:
+                print(f"[{datetime.now()}] Requeued {expired} shards from nodes that stopped sending heartbeats.")
+        # Let idle nodes hear that the batch is done before going away
+        time.sleep(NODE_POLL_INTERVAL * 2)
+    except KeyboardInterrupt:
+        print("Coordinator stopped; unfinished shards stay queued for the next run.")
+    finally:
+        server.shutdown()
+    dedupe.resolve_new_vendors()
+    print(jobs.batch_report(batch))
+
+
+class _RemoteLease:
+    """
+    Sends heartbeats for a leased shard from a background thread. `lost` is
+    set once the coordinator refuses one (lease expired or shard cancelled).
+    """
+    def __init__(self, node, job_id, owner, lease_seconds):
+        self.node = node
+        self.job_id = job_id
+        self.owner = owner
+        self.interval = lease_seconds / 3
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.node.call("/heartbeat", node=self.owner, job_id=self.job_id)["ok"]:
+                    self.lost = True
+                    return
+            except OSError as e:
+                # The lease still has time left; try again next beat
+                print(f"Heartbeat for shard {self.job_id} failed: {e}")
+
+
+class Node:
+    """
+    A scraper machine: `workers` threads lease shards from the coordinator
+    at `url`, scrape them with the local browser and send the vendors back.
+    Runs until the coordinator's batch is done or it stops answering.
+    """
+    def __init__(self, url, workers=1):
+        self.url = url.rstrip("/")
+        self.workers = workers
+
+    def call(self, path, **payload):
+        request = urllib.request.Request(f"{self.url}{path}", data=json.dumps(payload).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        if TOKEN:
+            request.add_header("X-Coordinator-Token", TOKEN)
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return json.loads(response.read())
+
+    def run(self):
+        threads = [threading.Thread(target=self._worker, name=f"node-worker-{i}") for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _worker(self):
+        owner = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        unreachable = 0
+        while True:
+            try:
+                reply = self.call("/lease", node=owner)
+                unreachable = 0
+            except OSError as e:
+                unreachable += 1
+                if unreachable >= MAX_UNREACHABLE:
+                    print(f"{owner}: coordinator unreachable ({e}); stopping.")
+                    return
+                time.sleep(NODE_POLL_INTERVAL)
+                continue
+            job = reply["job"]
+            if job is None:
+                if not reply["active"]:
+                    return
+                # Shards still running elsewhere may come back to the queue
+                time.sleep(NODE_POLL_INTERVAL)
+                continue
+            early_stop = None
+            if reply.get("known"):
+                early_stop = known.EarlyStop(known.KnownIndex.from_text(reply["known"]), reply["stop_after_known"])
+            self._run(job, owner, reply["lease_seconds"], early_stop)
+
+    def _ingest(self, job, owner, batch, lease, metrics):
+        with metrics.span("ingest"):
+            ok = self.call("/ingest", node=owner, job_id=job["id"], records=records.to_text(batch))["ok"]
+        if not ok:
+            lease.lost = True
+        batch.clear()
+
+    def _run(self, job, owner, lease_seconds, early_stop=None):
+        print(f"{owner}: scraping {job['category']} in {job['location']} ({job['source']}), "
+              f"attempt {job['attempts']}.")
+        status, error, page_state = "succeeded", None, None
+        batch = []
+        metrics = timings.RunMetrics("scrape", job["source"], job["category"], job["location"])
+        # The coordinator only leased the shard once its source was within its limits
+        with _RemoteLease(self, job["id"], owner, lease_seconds) as lease:
+            scraped = iter(pipeline.SOURCES[job["source"]](job["category"], job["location"], early_stop=early_stop,
+                                                           metrics=metrics))
+            try:
+                for vendor in scraped:
+                    batch.append(vendor)
+                    if len(batch) >= pipeline.INGEST_BATCH_SIZE:
+                        self._ingest(job, owner, batch, lease, metrics)
+                    if lease.lost:
+                        status = "cancelled"
+                        break
+                if batch and not lease.lost:
+                    self._ingest(job, owner, batch, lease, metrics)
+            except Exception as e:
+                status, error = "failed", str(e)
+                if isinstance(e, pagestate.BlockedError):
+                    status, page_state = "blocked", e.state
+                # Keep what was scraped before the failure
+                if batch and not lease.lost:
+                    try:
+                        self._ingest(job, owner, batch, lease, metrics)
+                    except OSError:
+                        pass
+            finally:
+                # Stops the browser if we left the loop early
+                if hasattr(scraped, "close"):
+                    scraped.close()
+        saved = None
+        if early_stop and early_stop.stopped:
+            saved = {"pages": early_stop.saved_pages, "seconds": early_stop.saved_seconds,
+                     "summary": early_stop.summary()}
+        try:
+            self.call("/complete", node=owner, job_id=job["id"], status=status, error=error,
+                      page_state=page_state, saved=saved, metrics=metrics.to_dict())
+        except OSError as e:
+            # The lease runs out and the coordinator hands the shard to another node
+            print(f"{owner}: could not report shard {job['id']}: {e}")
+        print(f"{owner}: shard {job['id']} {status}{f' ({error})' if error else ''}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a crawl across several scraper machines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Queue the crawl matrix and lease shards to nodes")
+    serve_parser.add_argument("--matrix", help=f"Crawl matrix file (default {planner.MATRIX_FILE})")
+    serve_parser.add_argument("--batch", help="Batch name; an existing batch is resumed")
+    serve_parser.add_argument("--plan", action="store_true", help="Only queue pairs the planner says are due")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Use 0.0.0.0 to accept other machines")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--keep-serving", action="store_true", help="Keep running after the batch is done")
+
+    node_parser = commands.add_parser("node", help="Scrape shards leased from a coordinator")
+    node_parser.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    node_parser.add_argument("--workers", type=int, default=1, help="Shards scraped at once on this machine")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        database.init_db()
+        batch = args.batch or f"crawl-{datetime.now().strftime('%Y-%m-%d-%H%M')}"
+        if jobs.batch_exists(batch):
+            print(f"Resuming {batch}.")
+        else:
+            matrix = planner.load_matrix(args.matrix)
+            pairs = planner.matrix_pairs(matrix)
+            if args.plan:
+                pairs = [(p["category"], p["location"]) for p in planner.plan(pairs, runs_per_pair=len(matrix["sources"]))]
+            queued = jobs.submit_batch(batch, pairs, matrix["sources"])
+            print(f"Queued {queued} shards ({len(pairs)} pairs x {len(matrix['sources'])} sources) as {batch}.")
+        serve(batch, args.host, args.port, args.keep_serving)
+    else:
+        Node(args.url, args.workers).run()
@@ -1,12 +1,25 @@
+import os
+import re
 import sqlite3
+import threading
+from normalize import normalize_phone, normalize_phones, parse_rating
 
 DB_NAME = "marriage_vendors.db"
+# Route vendor, scrape-run and log writes through this process's single
+# writer (see writer.py); 0 makes every call commit on its own connection
+SINGLE_WRITER = os.environ.get("SINGLE_WRITER", "1") != "0"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # Create table with unique constraint on name and phone (or location) to avoid duplicates
-    # We include category and location in uniqueness constraint to allow same vendor in multiple categories/locations if applicable
+# Schema migrations
+# Each migration runs exactly once per database file, in order, tracked with
+# PRAGMA user_version. Append new migrations to MIGRATIONS; never edit or
+# reorder ones that have shipped.
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in c.fetchall()}
+
+def _migration_base_schema(c):
+    # UNIQUE includes category and location so the same vendor can appear in several of each
     c.execute('''CREATE TABLE IF NOT EXISTS vendors
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   name TEXT NOT NULL,
@@ -17,64 +30,505 @@ def init_db():
                   rating TEXT,
                   summary TEXT,
                   UNIQUE(name, phone, category, location))''')
-    
-    # Simple migration for existing tables that might miss columns
-    # In production, use a proper migration tool like Alembic
-    try:
-        c.execute("ALTER TABLE vendors ADD COLUMN rating TEXT")
-    except sqlite3.OperationalError:
-        pass # Column likely exists
-        
-    try:
-        c.execute("ALTER TABLE vendors ADD COLUMN summary TEXT")
-    except sqlite3.OperationalError:
-        pass
-        
-    conn.commit()
-    conn.close()
-
+    # Databases created by very old versions may miss these columns
+    existing = _columns(c, "vendors")
+    for column in ("rating", "summary"):
+        if column not in existing:
+            c.execute(f"ALTER TABLE vendors ADD COLUMN {column} TEXT")
 
-def init_logs_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS scraper_logs
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  timestamp TEXT,
                   category TEXT,
                   location TEXT,
                   status TEXT,
                   message TEXT)''')
-    conn.commit()
-    conn.close()
 
-def log_scraper_run(category, location, status, message):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO scraper_logs (category, location, status, message) VALUES (?, ?, ?, ?)",
-              (category, location, status, message))
-    conn.commit()
-    conn.close()
+def _migration_aggregates(c):
+    init_aggregates(c)
 
-def add_vendor(name, phone, address, category, location, rating=None):
+def _migration_indexes(c):
+    # get_vendors filters on category and/or location; enrichment updates by name + location
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vendors_category_location ON vendors(category, location)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vendors_location_name ON vendors(location, name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scraper_logs_pair ON scraper_logs(category, location, id)")
+
+def _migration_typed_columns(c):
+    # Typed copies of the scraped rating/phone text so range filters and phone
+    # matching run inside SQLite. Filled by add_vendor; backfilled here.
+    existing = _columns(c, "vendors")
+    for column, decl in (("rating_value", "REAL"), ("phone_e164", "TEXT"), ("has_phone", "INTEGER NOT NULL DEFAULT 0")):
+        if column not in existing:
+            c.execute(f"ALTER TABLE vendors ADD COLUMN {column} {decl}")
+
+    # The parsers as they were when this migration shipped, so it backfills
+    # the same values however normalize.py changes later
+    phone_candidate_re = re.compile(r"\+?\d[\d\s\-()]{8,}\d")
+    rating_re = re.compile(r"\d+(?:\.\d+)?")
+
+    def normalize_phone(phone):
+        if not phone:
+            return None
+        match = phone_candidate_re.search(phone)
+        if not match:
+            return None
+        digits = re.sub(r"\D", "", match.group(0))
+        if len(digits) == 12 and digits.startswith("91"):
+            digits = digits[2:]
+        elif len(digits) == 11 and digits.startswith("0"):
+            digits = digits[1:]
+        if len(digits) != 10 or digits[0] == "0":
+            return None
+        return "+91" + digits
+
+    def parse_rating(rating):
+        if rating is None:
+            return None
+        if isinstance(rating, (int, float)):
+            value = float(rating)
+        else:
+            match = rating_re.search(rating)
+            if not match:
+                return None
+            value = float(match.group(0))
+        return value if 0 <= value <= 5 else None
+
+    conn = c.connection
+    conn.create_function("normalize_phone", 1, normalize_phone, deterministic=True)
+    conn.create_function("parse_rating", 1, parse_rating, deterministic=True)
+    c.execute('''UPDATE vendors SET rating_value = parse_rating(rating),
+                                     phone_e164 = normalize_phone(phone),
+                                     has_phone = normalize_phone(phone) IS NOT NULL''')
+
+    # Phone coverage in the aggregates now follows has_phone
+    for trigger in ("vendors_agg_insert", "vendors_agg_delete", "vendors_agg_update"):
+        c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    init_aggregates(c, HAS_PHONE_COLUMN_SQL)
+    rebuild_aggregates(c, HAS_PHONE_COLUMN_SQL)
+
+    # "rating >= 4 with phone in Mysore" is an equality/equality/range scan
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vendors_location_phone_rating ON vendors(location, has_phone, rating_value)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vendors_category_rating ON vendors(category, rating_value)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vendors_phone_e164 ON vendors(phone_e164) WHERE phone_e164 IS NOT NULL")
+
+def _migration_canonical_ids(c):
+    # Entity resolution (dedupe.py): canonical_id is the smallest vendor id in
+    # the cluster, vendor_blocks holds each row's blocking keys
+    if "canonical_id" not in _columns(c, "vendors"):
+        c.execute("ALTER TABLE vendors ADD COLUMN canonical_id INTEGER")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vendors_canonical_id ON vendors(canonical_id)")
+    c.execute('''CREATE TABLE IF NOT EXISTS vendor_blocks
+                 (block_key INTEGER NOT NULL,
+                  vendor_id INTEGER NOT NULL,
+                  PRIMARY KEY (block_key, vendor_id)) WITHOUT ROWID''')
+
+def _migration_scrape_runs(c):
+    # One row per scrape; observations record which vendors each run saw and a
+    # bitmask of what changed, vendor_changes keeps old/new values of changed fields only
+    c.execute('''CREATE TABLE IF NOT EXISTS scrape_runs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  started_at TEXT NOT NULL,
+                  finished_at TEXT,
+                  source TEXT,
+                  category TEXT,
+                  location TEXT,
+                  status TEXT,
+                  vendors_seen INTEGER NOT NULL DEFAULT 0,
+                  vendors_new INTEGER NOT NULL DEFAULT 0,
+                  vendors_changed INTEGER NOT NULL DEFAULT 0,
+                  message TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scrape_runs_pair ON scrape_runs(category, location, started_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scrape_runs_started ON scrape_runs(started_at)")
+    c.execute('''CREATE TABLE IF NOT EXISTS vendor_observations
+                 (run_id INTEGER NOT NULL,
+                  vendor_id INTEGER NOT NULL,
+                  changed INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (run_id, vendor_id)) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vendor_observations_vendor ON vendor_observations(vendor_id)")
+    c.execute('''CREATE TABLE IF NOT EXISTS vendor_changes
+                 (run_id INTEGER NOT NULL,
+                  vendor_id INTEGER NOT NULL,
+                  field TEXT NOT NULL,
+                  old_value TEXT,
+                  new_value TEXT,
+                  PRIMARY KEY (run_id, vendor_id, field)) WITHOUT ROWID''')
+
+
+def _migration_jobs(c):
+    # Background scrape/enrich jobs started from the app (see jobs.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  kind TEXT NOT NULL,
+                  category TEXT,
+                  location TEXT,
+                  status TEXT NOT NULL DEFAULT 'queued',
+                  created_at TEXT NOT NULL,
+                  started_at TEXT,
+                  finished_at TEXT,
+                  progress TEXT,
+                  vendors_found INTEGER NOT NULL DEFAULT 0,
+                  vendors_new INTEGER NOT NULL DEFAULT 0,
+                  vendors_changed INTEGER NOT NULL DEFAULT 0,
+                  log_path TEXT,
+                  output_file TEXT,
+                  run_id INTEGER,
+                  error TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+
+
+def _migration_data_version(c):
+    # Counter bumped by every write that changes what the dashboard shows
+    c.execute('''CREATE TABLE IF NOT EXISTS meta
+                 (key TEXT PRIMARY KEY,
+                  value INTEGER NOT NULL DEFAULT 0)''')
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+
+
+def _migration_job_leases(c):
+    # jobs becomes a lease-based queue shared by several worker processes:
+    # a claimed job is owned until lease_expires_at, failed attempts are
+    # retried after available_at, and batch groups the jobs of one scheduled run
+    columns = _columns(c, "jobs")
+    for name, definition in [
+        ("source", "TEXT NOT NULL DEFAULT 'justdial'"),
+        ("batch", "TEXT"),
+        ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+        ("max_attempts", "INTEGER NOT NULL DEFAULT 3"),
+        ("available_at", "TEXT"),
+        ("lease_owner", "TEXT"),
+        ("lease_expires_at", "TEXT"),
+    ]:
+        if name not in columns:
+            c.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+    # Jobs left 'running' by the old in-process runner have no lease; requeue them
+    c.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch, status)")
+
+def _migration_source_health(c):
+    # Per-source circuit breaker (see circuit.py): while a source is open,
+    # workers leave its jobs queued instead of scraping a block page
+    c.execute('''CREATE TABLE IF NOT EXISTS source_health
+                 (source TEXT PRIMARY KEY,
+                  state TEXT NOT NULL DEFAULT 'closed',
+                  trips INTEGER NOT NULL DEFAULT 0,
+                  open_until TEXT,
+                  last_page_state TEXT,
+                  updated_at TEXT)''')
+
+def _migration_pacing(c):
+    # Learned request pace per source (see pacing.py), next to its circuit breaker
+    columns = _columns(c, "source_health")
+    for name, definition in [
+        ("pace", "REAL NOT NULL DEFAULT 1.0"),
+        ("latency", "REAL"),
+        ("speedups", "INTEGER NOT NULL DEFAULT 0"),
+        ("slowdowns", "INTEGER NOT NULL DEFAULT 0"),
+        ("last_decision", "TEXT"),
+    ]:
+        if name not in columns:
+            c.execute(f"ALTER TABLE source_health ADD COLUMN {name} {definition}")
+
+def _migration_early_stop(c):
+    # Result pages and seconds a scrape saved by stopping at known vendors (see known.py)
+    columns = _columns(c, "scrape_runs")
+    for name, definition in [("pages_saved", "INTEGER"), ("seconds_saved", "REAL")]:
+        if name not in columns:
+            c.execute(f"ALTER TABLE scrape_runs ADD COLUMN {name} {definition}")
+
+def _migration_run_metrics(c):
+    # Per-phase timing spans and counters of every run (see timings.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS metric_runs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  scrape_run_id INTEGER REFERENCES scrape_runs(id),
+                  kind TEXT NOT NULL,
+                  source TEXT,
+                  category TEXT,
+                  location TEXT,
+                  started_at TEXT NOT NULL,
+                  seconds REAL,
+                  items INTEGER,
+                  status TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS run_metrics
+                 (metric_run_id INTEGER NOT NULL REFERENCES metric_runs(id),
+                  kind TEXT NOT NULL,
+                  name TEXT NOT NULL,
+                  value REAL NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_metric_runs_started ON metric_runs(started_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_run_metrics_run ON run_metrics(metric_run_id, kind)")
+
+def _migration_source_starts(c):
+    # When each source last started a job (see ratelimit.py), for start
+    # spacing that holds across worker processes
+    if "last_started_at" not in _columns(c, "source_health"):
+        c.execute("ALTER TABLE source_health ADD COLUMN last_started_at REAL")
+
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_aggregates,
+    _migration_indexes,
+    _migration_typed_columns,
+    _migration_canonical_ids,
+    _migration_scrape_runs,
+    _migration_jobs,
+    _migration_data_version,
+    _migration_job_leases,
+    _migration_source_health,
+    _migration_pacing,
+    _migration_early_stop,
+    _migration_run_metrics,
+    _migration_source_starts,
+]
+
+# Database files already migrated by this process, so repeat init_db() calls
+# from Streamlit reruns and scheduler jobs cost a dict lookup and a stat()
+_migrated = set()
+
+def migrate(db_name=None):
     """
-    Add a vendor to the database. Returns True if added, False if duplicate.
+    Bring the database up to the latest schema version.
+    Pending migrations run inside a single transaction.
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+    path = os.path.abspath(db_name or DB_NAME)
+    if path in _migrated and os.path.exists(path):
+        return
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        c = conn.cursor()
+        c.execute("PRAGMA user_version")
+        if c.fetchone()[0] < len(MIGRATIONS):
+            # IMMEDIATE takes the write lock up front; re-read the version under
+            # it in case another process migrated while we were waiting
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute("PRAGMA user_version")
+                version = c.fetchone()[0]
+                for migration in MIGRATIONS[version:]:
+                    migration(c)
+                c.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+    finally:
+        conn.close()
+    _migrated.add(path)
+
+def init_db():
+    migrate()
+
+def _write(op, *args, wait=True):
+    """
+    Run op(cursor, *args) in a write transaction and return its result.
+    With SINGLE_WRITER the op is queued to the process's writer, which
+    commits it together with other producers' ops; wait=False then returns
+    the writer's Future without waiting for the commit.
+    """
+    if SINGLE_WRITER:
+        import writer
+        future = writer.get_writer().submit(op, *args, background=not wait)
+        return future.result() if wait else future
+    conn = sqlite3.connect(DB_NAME, timeout=30)
     try:
-        c.execute("INSERT INTO vendors (name, phone, address, category, location, rating) VALUES (?, ?, ?, ?, ?, ?)",
-                  (name, phone, address, category, location, rating))
+        result = op(conn.cursor(), *args)
         conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
+        return result
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         conn.close()
 
+# Kept for callers that still initialise the logs table separately; the logs
+# table is part of the base schema now
+init_logs_db = init_db
+
+
+# Data version
+# Ingest, enrichment and dedupe bump meta.data_version in the same transaction
+# as their writes. The app caches dashboard reads keyed by this number, so a
+# cached result stays valid until the vendor data actually changes.
+
+def bump_data_version(c):
+    c.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+
+# path -> [connection, last PRAGMA data_version, last meta.data_version]
+_version_watchers = {}
+_version_lock = threading.Lock()
+
+def get_data_version(db_name=None):
+    """
+    Current meta.data_version. A long-lived connection checks
+    PRAGMA data_version first, which changes only when another connection
+    commits and reads no table rows, so the counter row is only read again
+    after some write has happened.
+    """
+    path = os.path.abspath(db_name or DB_NAME)
+    with _version_lock:
+        watcher = _version_watchers.get(path)
+        if watcher is None:
+            migrate(path)
+            watcher = [sqlite3.connect(path, check_same_thread=False), None, None]
+            _version_watchers[path] = watcher
+        conn = watcher[0]
+        commits = conn.execute("PRAGMA data_version").fetchone()[0]
+        if commits != watcher[1]:
+            watcher[2] = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+            watcher[1] = commits
+        return watcher[2]
+
+
+# Dashboard aggregates
+# The dashboard used to run COUNT/GROUP BY over the whole vendors table on every
+# Streamlit rerun. These tables hold the same numbers and are kept current by
+# triggers, so reading them costs O(number of groups) instead of O(vendors).
+
+# A vendor "has a phone" unless the scraper left one of its placeholder values
+HAS_PHONE_SQL = "({row}.phone IS NOT NULL AND TRIM({row}.phone) NOT IN ('', 'Not Available', 'N/A'))"
+# Since _migration_typed_columns: when its phone normalised to a canonical number
+HAS_PHONE_COLUMN_SQL = "{row}.has_phone"
+
+AGGREGATE_TABLES = ["vendor_totals", "category_counts", "location_counts", "category_location_counts"]
+
+
+def _aggregate_trigger_body(row, sign, has_phone_sql):
+    """
+    Build the statements that add (sign=1) or remove (sign=-1) one vendor row
+    (NEW or OLD) from every aggregate table.
+    """
+    has_phone = has_phone_sql.format(row=row)
+    category = f"COALESCE({row}.category, '')"
+    location = f"COALESCE({row}.location, '')"
+    upsert = "DO UPDATE SET total = total + excluded.total, with_phone = with_phone + excluded.with_phone;"
+    statements = [
+        f"INSERT INTO vendor_totals (id, total, with_phone) VALUES (1, {sign}, {sign} * {has_phone}) "
+        f"ON CONFLICT(id) {upsert}",
+        f"INSERT INTO category_counts (category, total, with_phone) VALUES ({category}, {sign}, {sign} * {has_phone}) "
+        f"ON CONFLICT(category) {upsert}",
+        f"INSERT INTO location_counts (location, total, with_phone) VALUES ({location}, {sign}, {sign} * {has_phone}) "
+        f"ON CONFLICT(location) {upsert}",
+        f"INSERT INTO category_location_counts (category, location, total, with_phone) "
+        f"VALUES ({category}, {location}, {sign}, {sign} * {has_phone}) "
+        f"ON CONFLICT(category, location) {upsert}",
+    ]
+    if sign < 0:
+        # Drop empty groups so readers never have to filter them out
+        statements += [
+            f"DELETE FROM category_counts WHERE category = {category} AND total <= 0;",
+            f"DELETE FROM location_counts WHERE location = {location} AND total <= 0;",
+            f"DELETE FROM category_location_counts WHERE category = {category} AND location = {location} AND total <= 0;",
+        ]
+    return "\n".join(statements)
+
+
+def init_aggregates(c, has_phone_sql=HAS_PHONE_SQL):
+    """
+    Create the aggregate tables and the triggers that maintain them.
+    Backfills from the vendors table the first time they are created.
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS vendor_totals
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  total INTEGER NOT NULL DEFAULT 0,
+                  with_phone INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS category_counts
+                 (category TEXT PRIMARY KEY,
+                  total INTEGER NOT NULL DEFAULT 0,
+                  with_phone INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS location_counts
+                 (location TEXT PRIMARY KEY,
+                  total INTEGER NOT NULL DEFAULT 0,
+                  with_phone INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS category_location_counts
+                 (category TEXT NOT NULL,
+                  location TEXT NOT NULL,
+                  total INTEGER NOT NULL DEFAULT 0,
+                  with_phone INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (category, location))''')
+
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS vendors_agg_insert AFTER INSERT ON vendors
+                  BEGIN {_aggregate_trigger_body("NEW", 1, has_phone_sql)} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS vendors_agg_delete AFTER DELETE ON vendors
+                  BEGIN {_aggregate_trigger_body("OLD", -1, has_phone_sql)} END''')
+    # Only the grouping columns and the phone flag feed the aggregates, so
+    # summary and rating updates do not pay for trigger work
+    phone_column = "has_phone" if has_phone_sql == HAS_PHONE_COLUMN_SQL else "phone"
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS vendors_agg_update AFTER UPDATE OF category, location, {phone_column} ON vendors
+                  BEGIN {_aggregate_trigger_body("OLD", -1, has_phone_sql)}
+                        {_aggregate_trigger_body("NEW", 1, has_phone_sql)} END''')
+
+    c.execute("SELECT COUNT(*) FROM vendor_totals")
+    if c.fetchone()[0] == 0:
+        rebuild_aggregates(c, has_phone_sql)
+
+
+def rebuild_aggregates(c, has_phone_sql=HAS_PHONE_SQL):
+    """
+    Recompute every aggregate table from the vendors table.
+    Only needed on first creation or if the tables were edited by hand.
+    """
+    has_phone = has_phone_sql.format(row="vendors")
+    for table in AGGREGATE_TABLES:
+        c.execute(f"DELETE FROM {table}")
+    c.execute(f'''INSERT INTO vendor_totals (id, total, with_phone)
+                  SELECT 1, COUNT(*), COALESCE(SUM({has_phone}), 0) FROM vendors''')
+    c.execute(f'''INSERT INTO category_counts (category, total, with_phone)
+                  SELECT COALESCE(category, ''), COUNT(*), SUM({has_phone}) FROM vendors
+                  GROUP BY 1''')
+    c.execute(f'''INSERT INTO location_counts (location, total, with_phone)
+                  SELECT COALESCE(location, ''), COUNT(*), SUM({has_phone}) FROM vendors
+                  GROUP BY 1''')
+    c.execute(f'''INSERT INTO category_location_counts (category, location, total, with_phone)
+                  SELECT COALESCE(category, ''), COALESCE(location, ''), COUNT(*), SUM({has_phone}) FROM vendors
+                  GROUP BY 1, 2''')
+
+
+def _add_vendor(c, name, phone, address, category, location, rating):
+    phone_e164 = normalize_phone(phone)
+    try:
+        c.execute('''INSERT INTO vendors (name, phone, address, category, location, rating,
+                                          rating_value, phone_e164, has_phone)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (name, phone, address, category, location, rating,
+                   parse_rating(rating), phone_e164, phone_e164 is not None))
+    except sqlite3.IntegrityError:
+        return False
+    bump_data_version(c)
+    return True
+
+def add_vendor(name, phone, address, category, location, rating=None):
+    """
+    Add a vendor to the database. Returns True if added, False if duplicate.
+    """
+    return _write(_add_vendor, name, phone, address, category, location, rating)
+
+def _update_vendor_details(c, name, location, phone, address):
+    updated = 0
+    phone_e164 = normalize_phone(phone)
+    if phone_e164:
+        c.execute('''UPDATE vendors SET phone = ?, phone_e164 = ?, has_phone = 1
+                     WHERE name = ? AND location = ? AND has_phone = 0''', (phone, phone_e164, name, location))
+        updated += c.rowcount
+    # Never overwrite with the placeholder address (the location itself)
+    if address and address != location:
+        c.execute("UPDATE vendors SET address = ? WHERE name = ? AND location = ? AND COALESCE(address, '') != ?",
+                  (address, name, location, address))
+        updated += c.rowcount
+    if updated:
+        bump_data_version(c)
+    return updated
+
+def update_vendor_details(name, location, phone=None, address=None):
+    """
+    Fill in a phone found by enrichment (only where the vendor has none)
+    and a changed address. Returns the number of rows updated.
+    """
+    return _write(_update_vendor_details, name, location, phone, address)
+
 def update_vendor_summary(vendor_id, summary):
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
     c.execute("UPDATE vendors SET summary = ? WHERE id = ?", (summary, vendor_id))
+    bump_data_version(c)
     conn.commit()
     conn.close()
 
@@ -86,37 +540,131 @@ def get_vendor_by_name_phone(name, phone):
     conn.close()
     return row
 
-def get_vendors(category=None, location=None):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # Return all columns including id, rating, summary
-    query = "SELECT id, name, phone, address, category, location, rating, summary FROM vendors WHERE 1=1"
+def vendor_filters(category=None, location=None, min_rating=None, with_phone=None):
+    """
+    WHERE clause and parameters for the usual vendor filters, shared by
+    get_vendors and the export/grid queries.
+    """
+    clauses = []
     params = []
     if category:
-        query += " AND category = ?"
+        clauses.append("category = ?")
         params.append(category)
     if location:
-        query += " AND location = ?"
+        clauses.append("location = ?")
         params.append(location)
-    
+    if with_phone is not None:
+        clauses.append("has_phone = ?")
+        params.append(1 if with_phone else 0)
+    if min_rating is not None:
+        clauses.append("rating_value >= ?")
+        params.append(min_rating)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
 
-    c.execute(query, params)
+def get_vendors(category=None, location=None, min_rating=None, with_phone=None):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    # Return all columns including id, rating, summary
+    where, params = vendor_filters(category, location, min_rating, with_phone)
+    c.execute("SELECT id, name, phone, address, category, location, rating, summary FROM vendors" + where, params)
     rows = c.fetchall()
     conn.close()
     return rows
 
-def get_total_vendors():
+# Sort keys for the vendor grid; unrated vendors always sort last, and id
+# breaks ties so pages never overlap
+VENDOR_SORTS = {
+    "name": "name {dir}, id",
+    "rating": "rating_value IS NULL, rating_value {dir}, id",
+    "category": "category {dir}, name, id",
+    "location": "location {dir}, name, id",
+    "newest": "id {dir}",
+}
+
+VENDOR_PAGE_COLUMNS = ["id", "name", "phone", "address", "category", "location", "rating", "summary"]
+
+def count_vendors(category=None, location=None, min_rating=None, with_phone=None):
+    """
+    Number of vendors matching the usual filters. Without a rating filter
+    the answer comes from the aggregate tables instead of the vendors table.
+    """
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM vendors")
-    count = c.fetchone()[0]
+    if min_rating is None:
+        if category and location:
+            c.execute("SELECT total, with_phone FROM category_location_counts WHERE category = ? AND location = ?",
+                      (category, location))
+        elif category:
+            c.execute("SELECT total, with_phone FROM category_counts WHERE category = ?", (category,))
+        elif location:
+            c.execute("SELECT total, with_phone FROM location_counts WHERE location = ?", (location,))
+        else:
+            c.execute("SELECT total, with_phone FROM vendor_totals WHERE id = 1")
+        total, phones = c.fetchone() or (0, 0)
+        count = total if with_phone is None else phones if with_phone else total - phones
+    else:
+        where, params = vendor_filters(category, location, min_rating, with_phone)
+        c.execute("SELECT COUNT(*) FROM vendors" + where, params)
+        count = c.fetchone()[0]
     conn.close()
     return count
 
+def get_vendor_page(page=0, page_size=50, sort="name", descending=False,
+                    category=None, location=None, min_rating=None, with_phone=None):
+    """
+    One page of vendors (VENDOR_PAGE_COLUMNS order) for the grid.
+    Returns (rows, total_matching).
+    """
+    if sort not in VENDOR_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    order = VENDOR_SORTS[sort].format(dir="DESC" if descending else "ASC")
+    where, params = vendor_filters(category, location, min_rating, with_phone)
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(VENDOR_PAGE_COLUMNS)} FROM vendors{where} ORDER BY {order} LIMIT ? OFFSET ?",
+              params + [page_size, page * page_size])
+    rows = c.fetchall()
+    conn.close()
+    return rows, count_vendors(category, location, min_rating, with_phone)
+
+def get_vendors_by_phone(phone):
+    """
+    All vendor rows sharing a phone number, whatever format it was scraped in.
+    """
+    phone_e164 = normalize_phone(phone)
+    if not phone_e164:
+        return []
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT id, name, phone, address, category, location, rating, summary FROM vendors WHERE phone_e164 = ?",
+              (phone_e164,))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def get_total_vendors():
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT total FROM vendor_totals WHERE id = 1")
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def get_phone_coverage():
+    """
+    Returns (vendors_with_phone, total_vendors).
+    """
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT with_phone, total FROM vendor_totals WHERE id = 1")
+    row = c.fetchone()
+    conn.close()
+    return (row[0], row[1]) if row else (0, 0)
+
 def get_vendor_counts_by_category():
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
-    c.execute("SELECT category, COUNT(*) FROM vendors GROUP BY category")
+    c.execute("SELECT category, total FROM category_counts")
     rows = c.fetchall()
     conn.close()
     # Return as a dictionary: {category: count}
@@ -125,12 +673,35 @@ def get_vendor_counts_by_category():
 def get_top_districts(limit=5):
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
-    c.execute("SELECT location, COUNT(*) FROM vendors GROUP BY location ORDER BY COUNT(*) DESC LIMIT ?", (limit,))
-    c.execute("SELECT location, COUNT(*) FROM vendors GROUP BY location ORDER BY COUNT(*) DESC LIMIT ?", (limit,))
+    c.execute("SELECT location, total FROM location_counts ORDER BY total DESC LIMIT ?", (limit,))
     rows = c.fetchall()
     conn.close()
     return {row[0]: row[1] for row in rows}
 
+def get_locations():
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT location FROM location_counts ORDER BY location")
+    rows = c.fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+def get_category_location_counts(location=None):
+    """
+    Returns [(category, location, total, with_phone), ...], largest groups first.
+    """
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    query = "SELECT category, location, total, with_phone FROM category_location_counts"
+    params = []
+    if location:
+        query += " WHERE location = ?"
+        params.append(location)
+    c.execute(query + " ORDER BY total DESC", params)
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
 def get_all_vendors_df():
     import pandas as pd
     conn = sqlite3.connect(DB_NAME)
@@ -139,28 +710,15 @@ def get_all_vendors_df():
     return df
 
 # Logging functions
-def init_logs_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS scraper_logs
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  timestamp TEXT,
-                  category TEXT,
-                  location TEXT,
-                  status TEXT,
-                  message TEXT)''')
-    conn.commit()
-    conn.close()
+def _log_scraper_run(c, timestamp, category, location, status, message):
+    c.execute("INSERT INTO scraper_logs (timestamp, category, location, status, message) VALUES (?, ?, ?, ?, ?)",
+              (timestamp, category, location, status, message))
 
 def log_scraper_run(category, location, status, message):
+    # A log event; with the single writer it is committed in the background
     from datetime import datetime
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO scraper_logs (timestamp, category, location, status, message) VALUES (?, ?, ?, ?, ?)",
-              (timestamp, category, location, status, message))
-    conn.commit()
-    conn.close()
+    _write(_log_scraper_run, timestamp, category, location, status, message, wait=False)
 
 def get_logs(limit=50):
     conn = sqlite3.connect(DB_NAME)
@@ -177,6 +735,254 @@ def get_logs_df():
     conn.close()
     return df
 
+# Scrape runs and change history
+
+# vendor_observations.changed bits
+CHANGED_NEW = 1
+CHANGED_PHONE = 2
+CHANGED_ADDRESS = 4
+CHANGED_RATING = 8
+CHANGED_FIELDS = {"phone": CHANGED_PHONE, "address": CHANGED_ADDRESS, "rating": CHANGED_RATING}
+
+def _now():
+    from datetime import datetime
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _start_scrape_run(c, started_at, category, location, source):
+    c.execute("INSERT INTO scrape_runs (started_at, source, category, location, status) VALUES (?, ?, ?, ?, 'Running')",
+              (started_at, source, category, location))
+    return c.lastrowid
+
+def start_scrape_run(category, location, source="justdial"):
+    return _write(_start_scrape_run, _now(), category, location, source)
+
+def _finish_scrape_run(c, finished_at, run_id, status, message):
+    c.execute("UPDATE scrape_runs SET finished_at = ?, status = ?, message = ? WHERE id = ?",
+              (finished_at, status, message, run_id))
+
+def finish_scrape_run(run_id, status, message=None):
+    _write(_finish_scrape_run, _now(), run_id, status, message)
+
+def _record_early_stop(c, run_id, pages_saved, seconds_saved):
+    c.execute("UPDATE scrape_runs SET pages_saved = ?, seconds_saved = ? WHERE id = ?",
+              (pages_saved, seconds_saved, run_id))
+
+def record_early_stop(run_id, pages_saved, seconds_saved):
+    _write(_record_early_stop, run_id, pages_saved, seconds_saved)
+
+def _scraped_changes(row, vendor, location):
+    """
+    Fields whose scraped value differs from the stored row, as {field: (old, new)}.
+    Placeholders never overwrite real data (e.g. a phone found by enrichment),
+    and a stored phone is never replaced: a different number is another vendor.
+    """
+    _, _, phone, address, rating, phone_e164 = row
+    changes = {}
+    new_phone = vendor.get("phone")
+    new_e164 = normalize_phone(new_phone)
+    if new_e164 and phone_e164 is None:
+        changes["phone"] = (phone, new_phone)
+    new_address = vendor.get("address")
+    if new_address and new_address != location and new_address != address:
+        changes["address"] = (address, new_address)
+    new_rating = vendor.get("rating")
+    if parse_rating(new_rating) is not None and new_rating != rating:
+        changes["rating"] = (rating, new_rating)
+    return changes
+
+def _match_row(rows, scraped_e164):
+    """
+    The stored row (of those with the card's name) a scraped card is, or None
+    for a new vendor. A card with a phone is the row with that phone, else a
+    row without one; a card without a phone is a row without one, else the
+    name's only row. Same-name vendors with different phones stay apart.
+    """
+    if scraped_e164:
+        return (next((r for r in rows if r[5] == scraped_e164), None)
+                or next((r for r in rows if r[5] is None), None))
+    return next((r for r in rows if r[5] is None), rows[0] if len(rows) == 1 else None)
+
+class PairRows:
+    """
+    The stored vendors of one category/location pair, by name, for
+    ingest_vendors. The first batch of a run loads them and every batch keeps
+    them current, so a run reads the pair once instead of once per batch. It
+    also holds the vendors the run has seen, so a card repeated in a later
+    batch is counted as a repeat. One per run; only writer ops touch it.
+    """
+    def __init__(self):
+        self.by_name = None
+        self.seen = set()
+
+    def load(self, c, category, location):
+        if self.by_name is None:
+            # All stored vendors for the pair in one indexed query, instead of one lookup per card
+            c.execute('''SELECT id, name, phone, address, rating, phone_e164 FROM vendors
+                         WHERE category = ? AND location = ?''', (category, location))
+            self.by_name = {}
+            for row in c.fetchall():
+                self.by_name.setdefault(row[1], []).append(list(row))
+        return self.by_name
+
+def ingest_vendors(run_id, vendors, category, location, pair=None):
+    """
+    Write one batch of a run's scraped vendors. New vendors are inserted,
+    existing ones are updated only in the fields that changed, and every
+    vendor seen gets a membership row in vendor_observations. Pass the same
+    PairRows with every batch of a run; without one the pair is read again.
+    Returns {"seen": n, "new": n, "changed": n, "repeated": n}; repeated
+    counts cards of a vendor the run had already seen.
+    """
+    # One pass over the batch's phones, outside the write transaction; repeats are normalised once
+    scraped_e164s = normalize_phones([vendor.get("phone") for vendor in vendors])
+    return _write(_ingest_vendors, run_id, vendors, scraped_e164s, category, location, pair or PairRows())
+
+def _ingest_vendors(c, run_id, vendors, scraped_e164s, category, location, pair):
+    try:
+        stats, seen = _ingest_batch(c, run_id, vendors, scraped_e164s, category, location,
+                                    pair.load(c, category, location), pair.seen)
+    except Exception:
+        # The batch is rolled back; rows it added to the cache may not exist
+        pair.by_name = None
+        raise
+    pair.seen.update(seen)
+    return stats
+
+def _ingest_batch(c, run_id, vendors, scraped_e164s, category, location, known, seen):
+    observations = {}
+    changes = []
+    new_count = changed_count = repeated_count = 0
+    for vendor, scraped_e164 in zip(vendors, scraped_e164s):
+        name = vendor.get("name")
+        if not name:
+            continue
+        rows = known.setdefault(name, [])
+        row = _match_row(rows, scraped_e164)
+        if row is None:
+            phone = vendor.get("phone")
+            rating = vendor.get("rating")
+            c.execute('''INSERT OR IGNORE INTO vendors (name, phone, address, category, location, rating,
+                                                      rating_value, phone_e164, has_phone)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                      (name, phone, vendor.get("address"), category, location, rating,
+                       parse_rating(rating), scraped_e164, scraped_e164 is not None))
+            if c.rowcount:
+                rows.append([c.lastrowid, name, phone, vendor.get("address"), rating, scraped_e164])
+                observations[c.lastrowid] = CHANGED_NEW
+                new_count += 1
+            else:
+                # Stored by another writer since the pair was loaded
+                repeated_count += 1
+            continue
+
+        vendor_id = row[0]
+        if vendor_id in observations or vendor_id in seen:
+            # The same vendor's card again (Justdial repeats sponsored cards)
+            repeated_count += 1
+            continue
+        diff = _scraped_changes(row, vendor, location)
+        mask = 0
+        if "phone" in diff:
+            new_phone = diff["phone"][1]
+            try:
+                # Enrichment may have filled it since the pair was loaded
+                c.execute("UPDATE vendors SET phone = ?, phone_e164 = ?, has_phone = 1 WHERE id = ? AND has_phone = 0",
+                          (new_phone, scraped_e164, vendor_id))
+                updated = c.rowcount
+            except sqlite3.IntegrityError:
+                # Another row already holds this name/phone pair
+                updated = 0
+            if updated:
+                row[2], row[5] = new_phone, scraped_e164
+                mask |= CHANGED_PHONE
+            else:
+                del diff["phone"]
+        if "address" in diff:
+            c.execute("UPDATE vendors SET address = ? WHERE id = ?", (diff["address"][1], vendor_id))
+            row[3] = diff["address"][1]
+            mask |= CHANGED_ADDRESS
+        if "rating" in diff:
+            new_rating = diff["rating"][1]
+            c.execute("UPDATE vendors SET rating = ?, rating_value = ? WHERE id = ?",
+                      (new_rating, parse_rating(new_rating), vendor_id))
+            row[4] = new_rating
+            mask |= CHANGED_RATING
+        for field, (old, new) in diff.items():
+            changes.append((run_id, vendor_id, field, old, new))
+        if mask:
+            changed_count += 1
+        observations[vendor_id] = mask
+
+    c.executemany("INSERT OR IGNORE INTO vendor_observations (run_id, vendor_id, changed) VALUES (?, ?, ?)",
+                  [(run_id, vendor_id, mask) for vendor_id, mask in observations.items()])
+    c.executemany('''INSERT OR REPLACE INTO vendor_changes (run_id, vendor_id, field, old_value, new_value)
+                     VALUES (?, ?, ?, ?, ?)''', changes)
+    c.execute('''UPDATE scrape_runs SET vendors_seen = vendors_seen + ?, vendors_new = vendors_new + ?,
+                                        vendors_changed = vendors_changed + ? WHERE id = ?''',
+              (len(observations), new_count, changed_count, run_id))
+    if new_count or changed_count:
+        bump_data_version(c)
+    return ({"seen": len(observations), "new": new_count, "changed": changed_count, "repeated": repeated_count},
+            observations)
+
+def get_changes_since(since, category=None, location=None):
+    """
+    Field-level changes recorded by runs started at or after `since`
+    ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"), newest first:
+    [(started_at, vendor_id, name, category, location, field, old_value, new_value), ...]
+    """
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    query = '''SELECT r.started_at, v.id, v.name, v.category, v.location, ch.field, ch.old_value, ch.new_value
+               FROM scrape_runs r
+               JOIN vendor_changes ch ON ch.run_id = r.id
+               JOIN vendors v ON v.id = ch.vendor_id
+               WHERE r.started_at >= ?'''
+    params = [since]
+    if category:
+        query += " AND r.category = ?"
+        params.append(category)
+    if location:
+        query += " AND r.location = ?"
+        params.append(location)
+    c.execute(query + " ORDER BY r.started_at DESC", params)
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def get_new_vendors_since(since, category=None, location=None):
+    """
+    Vendors first seen by runs started at or after `since`:
+    [(started_at, vendor_id, name, phone, category, location), ...]
+    """
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    query = '''SELECT r.started_at, v.id, v.name, v.phone, v.category, v.location
+               FROM scrape_runs r
+               JOIN vendor_observations o ON o.run_id = r.id
+               JOIN vendors v ON v.id = o.vendor_id
+               WHERE r.started_at >= ? AND (o.changed & ?) != 0'''
+    params = [since, CHANGED_NEW]
+    if category:
+        query += " AND r.category = ?"
+        params.append(category)
+    if location:
+        query += " AND r.location = ?"
+        params.append(location)
+    c.execute(query + " ORDER BY r.started_at DESC", params)
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def get_scrape_runs(limit=50):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute('''SELECT id, started_at, finished_at, source, category, location, status,
+                        vendors_seen, vendors_new, vendors_changed
+                 FROM scrape_runs ORDER BY id DESC LIMIT ?''', (limit,))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
 if __name__ == "__main__":
     init_db()
-    init_logs_db()
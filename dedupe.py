@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import re
+import sqlite3
+import time
+import zlib
+import database
+
+# Cross-source entity resolution
+# Every vendor row gets a canonical_id: the smallest vendor id of the cluster it
+# belongs to. Rows are only compared with rows that share a blocking key (same
+# canonical phone, or same city + MinHash band of the name), so the work grows
+# with the number of new rows rather than with all pairs in the table.
+
+NUM_HASHES = 12
+BAND_SIZE = 3  # 4 bands of 3: ~94% of pairs at similarity 0.8 collide, ~10% at 0.3
+MAX_BLOCK_SIZE = 100  # Keys shared by more rows than this carry no signal (call centres, "Sri Sai ...")
+
+NAME_MATCH = 0.8  # Name similarity needed when phones are missing
+PHONE_NAME_MATCH = 0.3  # Same phone still needs a loosely similar name
+
+# Each "permutation" XORs the shingle's CRC32 with a fixed random mask, which
+# lets min(map(...)) run the whole scan in C
+_MASKS = [zlib.crc32(f"minhash-{i}".encode()) for i in range(NUM_HASHES)]
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+_NAME_STOPWORDS = {"the", "and", "pvt", "ltd", "private", "limited", "co", "llp"}
+# Words half the vendors in a category share; left out of blocking so a band
+# does not collapse to "every caterer in Mysore", but still used for scoring
+_BLOCKING_STOPWORDS = {"sri", "shree", "shri", "new", "wedding", "caterers", "catering", "photography",
+                       "photographers", "photo", "studio", "studios", "decorators", "decoration", "decorations",
+                       "events", "event", "tent", "house", "florists", "flower", "bakery", "bakers", "hall",
+                       "convention", "centre", "center", "jewellers", "jewellery", "travels", "sound",
+                       "systems", "beauty", "parlour", "salon", "textiles", "services", "management"}
+
+
+def normalize_name(name):
+    tokens = _NON_ALNUM_RE.sub(" ", (name or "").lower().replace("&", " and ")).split()
+    return " ".join(t for t in tokens if t not in _NAME_STOPWORDS)
+
+
+def city_of(location):
+    return (location or "").split(",")[0].strip().lower()
+
+
+def shingles(normalized_name):
+    padded = f" {normalized_name} "
+    if len(padded) < 3:
+        return {padded}
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def name_similarity(a, b, threshold=0.0):
+    """
+    Jaccard similarity of two shingle sets. Returns 0.0 early when the set
+    sizes alone rule out reaching threshold.
+    """
+    if not a or not b:
+        return 0.0
+    small, large = (len(a), len(b)) if len(a) <= len(b) else (len(b), len(a))
+    if small < threshold * large:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _key(text):
+    # 64-bit signed so it fits an SQLite INTEGER; collisions only add candidates
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def blocking_name(normalized_name):
+    tokens = [t for t in normalized_name.split() if t not in _BLOCKING_STOPWORDS]
+    # A name made only of generic words still needs some key
+    return " ".join(tokens) if tokens else normalized_name
+
+
+def minhash(shingle_set):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingle_set]
+    return [min(map(mask.__xor__, hashes)) for mask in _MASKS]
+
+
+def block_keys(phone_e164, city, signature):
+    keys = []
+    if phone_e164:
+        keys.append(_key(f"p:{phone_e164}"))
+    for band in range(0, NUM_HASHES, BAND_SIZE):
+        values = ",".join(str(v) for v in signature[band:band + BAND_SIZE])
+        keys.append(_key(f"n:{city}:{band}:{values}"))
+    return keys
+
+
+def is_match(a, b):
+    """
+    a and b are (phone_e164, city, shingle_set) tuples.
+    """
+    phone_a, city_a, names_a = a
+    phone_b, city_b, names_b = b
+    if phone_a and phone_b:
+        if phone_a != phone_b:
+            return False
+        return name_similarity(names_a, names_b, PHONE_NAME_MATCH) >= PHONE_NAME_MATCH
+    # One side is missing a phone (typically before enrichment fills it in)
+    return city_a == city_b and name_similarity(names_a, names_b, NAME_MATCH) >= NAME_MATCH
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        root = parent.setdefault(x, x)
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # The smallest id is the canonical one
+            if rb < ra:
+                ra, rb = rb, ra
+            self.parent[rb] = ra
+
+
+def _load_temp_ids(c, table, ids):
+    c.execute(f"DROP TABLE IF EXISTS temp.{table}")
+    c.execute(f"CREATE TEMP TABLE {table} (id INTEGER PRIMARY KEY)")
+    c.executemany(f"INSERT OR IGNORE INTO temp.{table} (id) VALUES (?)", ((i,) for i in ids))
+
+
+def _resolve_batch(c, rows):
+    """
+    rows: [(id, name, phone_e164, location, canonical_id), ...] not yet resolved.
+    Returns how many of them were merged into an earlier vendor.
+    """
+    features = {}
+    new_keys = []
+    for vendor_id, name, phone_e164, location, _ in rows:
+        normalized = normalize_name(name)
+        city = city_of(location)
+        features[vendor_id] = (phone_e164, city, shingles(normalized))
+        for key in block_keys(phone_e164, city, minhash(shingles(blocking_name(normalized)))):
+            new_keys.append((key, vendor_id))
+
+    c.executemany("INSERT OR IGNORE INTO vendor_blocks (block_key, vendor_id) VALUES (?, ?)", new_keys)
+
+    # Everything that shares a key with the batch, old rows and new alike
+    c.execute("DROP TABLE IF EXISTS temp.batch_keys")
+    c.execute("CREATE TEMP TABLE batch_keys (block_key INTEGER PRIMARY KEY)")
+    c.executemany("INSERT OR IGNORE INTO temp.batch_keys (block_key) VALUES (?)", ((k,) for k, _ in new_keys))
+    c.execute('''SELECT b.block_key, b.vendor_id FROM vendor_blocks b
+                 JOIN temp.batch_keys k ON b.block_key = k.block_key''')
+    blocks = {}
+    for key, vendor_id in c.fetchall():
+        blocks.setdefault(key, []).append(vendor_id)
+
+    candidates = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if a in features or b in features:
+                    candidates.add((a, b) if a < b else (b, a))
+
+    # Features and current clusters of the previously resolved rows we compare against
+    uf = _UnionFind()
+    current_canonical = {}
+    existing = {v for pair in candidates for v in pair if v not in features}
+    if existing:
+        _load_temp_ids(c, "existing_ids", existing)
+        c.execute('''SELECT v.id, v.name, v.phone_e164, v.location, v.canonical_id FROM vendors v
+                     JOIN temp.existing_ids e ON v.id = e.id''')
+        unresolved = set()
+        for vendor_id, name, phone_e164, location, canonical_id in c.fetchall():
+            if canonical_id is None:
+                # Not resolved yet, e.g. a new row that reused a deleted
+                # vendor's id and its blocks; compared when its own batch runs
+                unresolved.add(vendor_id)
+                continue
+            features[vendor_id] = (phone_e164, city_of(location), shingles(normalize_name(name)))
+            current_canonical[vendor_id] = canonical_id
+            uf.union(vendor_id, canonical_id)
+        # Blocks left behind by deleted vendors
+        stale = existing - set(features) - unresolved
+        if stale:
+            c.executemany("DELETE FROM vendor_blocks WHERE vendor_id = ?", ((vendor_id,) for vendor_id in stale))
+
+    for a, b in candidates:
+        if a in features and b in features and is_match(features[a], features[b]):
+            uf.union(a, b)
+
+    # New rows take their cluster root. Old clusters bridged by a new row are
+    # folded into the smallest canonical id; union-find only ever lowers roots,
+    # so remaps never chain.
+    updates = [(uf.find(row[0]), row[0]) for row in rows]
+    c.executemany("UPDATE vendors SET canonical_id = ? WHERE id = ?", updates)
+    remaps = set()
+    for vendor_id, current in current_canonical.items():
+        root = uf.find(vendor_id)
+        if current != root:
+            remaps.add((root, current))
+    c.executemany("UPDATE vendors SET canonical_id = ? WHERE canonical_id = ?", sorted(remaps))
+    return sum(1 for root, vendor_id in updates if root != vendor_id)
+
+
+def resolve_new_vendors(db_name=None, batch_size=50000):
+    """
+    Assign canonical ids to every vendor that does not have one yet.
+    Safe to call after each ingest; rows already resolved are not rescanned.
+    Returns (rows_resolved, rows_merged, seconds).
+    """
+    database.migrate(db_name)
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_name or database.DB_NAME)
+    c = conn.cursor()
+    # vendor_blocks keys are random, so inserts touch pages all over its b-tree
+    c.execute("PRAGMA cache_size = -65536")
+    resolved = merged = 0
+    last_id = 0
+    try:
+        while True:
+            c.execute('''SELECT id, name, phone_e164, location, canonical_id FROM vendors
+                         WHERE canonical_id IS NULL AND id > ? ORDER BY id LIMIT ?''', (last_id, batch_size))
+            rows = c.fetchall()
+            if not rows:
+                break
+            merged += _resolve_batch(c, rows)
+            # canonical_id is part of the exports
+            database.bump_data_version(c)
+            conn.commit()
+            resolved += len(rows)
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+    return resolved, merged, time.perf_counter() - start
+
+
+def reset(db_name=None):
+    """
+    Forget all clusters so the next resolve_new_vendors() starts from scratch,
+    e.g. after changing the thresholds above.
+    """
+    database.migrate(db_name)
+    conn = sqlite3.connect(db_name or database.DB_NAME)
+    conn.execute("DELETE FROM vendor_blocks")
+    conn.execute("UPDATE vendors SET canonical_id = NULL")
+    conn.commit()
+    conn.close()
+
+
+def _synthetic_vendors(rows, seed=42):
+    """
+    Vendor rows where about a third are another source's spelling of an
+    earlier vendor: different case/punctuation, a typo, and a phone that one
+    side may be missing.
+    """
+    import random
+    rng = random.Random(seed)
+    syllables = ["sri", "lak", "shmi", "gan", "esh", "ra", "ja", "ven", "kat", "bal", "aji", "sai", "kav",
+                 "eri", "mo", "han", "pri", "ya", "raj", "ku", "mar", "an", "na", "pur", "na", "de", "vi", "shan",
+                 "kar", "gow", "da", "nan", "di", "ni", "vas", "su", "dha", "hari", "om", "tej"]
+    kinds = ["Caterers", "Photography", "Studio", "Decorators", "Tent House", "Events", "Florists", "Bakery"]
+    cities = ["Bangalore", "Mysore", "Shimoga", "Hubli", "Mangalore", "Belgaum", "Davangere", "Tumkur"]
+
+    def word():
+        return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))).title()
+
+    vendors = []
+    for i in range(rows):
+        if vendors and i % 3 == 2:
+            name, phone, location = vendors[rng.randrange(len(vendors))]
+            name = name.upper().replace(" ", "  ") if rng.random() < 0.5 else name.replace("a", "aa", 1)
+            phone = phone if rng.random() < 0.5 else None
+        else:
+            name = f"{word()} {word()} {rng.choice(kinds)}"
+            phone = f"+91{rng.randint(6000000000, 9999999999)}" if rng.random() < 0.6 else None
+            location = f"{rng.choice(cities)}, Karnataka"
+        vendors.append((name, phone, location))
+    return vendors
+
+
+def benchmark(rows, db_name):
+    """
+    Time a full resolve over synthetic vendors, then an incremental one.
+    """
+    database.migrate(db_name)
+    conn = sqlite3.connect(db_name)
+    conn.executemany('''INSERT OR IGNORE INTO vendors (name, phone, category, location, phone_e164, has_phone)
+                        VALUES (?, ?, 'Wedding', ?, ?, ?)''',
+                     ((name, phone or "Not Available", location, phone, phone is not None)
+                      for name, phone, location in _synthetic_vendors(rows)))
+    conn.commit()
+    conn.close()
+
+    resolved, merged, seconds = resolve_new_vendors(db_name)
+    print(f"Full resolve: {resolved} rows, {merged} merged in {seconds:.1f}s ({resolved / seconds:,.0f} rows/s)")
+
+    conn = sqlite3.connect(db_name)
+    conn.executemany('''INSERT OR IGNORE INTO vendors (name, phone, category, location, phone_e164, has_phone)
+                        VALUES (?, ?, 'Wedding', ?, ?, ?)''',
+                     ((name, phone or "Not Available", location, phone, phone is not None)
+                      for name, phone, location in _synthetic_vendors(1000, seed=7)))
+    conn.commit()
+    conn.close()
+    resolved, merged, seconds = resolve_new_vendors(db_name)
+    print(f"Incremental resolve: {resolved} new rows, {merged} merged in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign canonical vendor ids across sources.")
+    parser.add_argument("--rebuild", action="store_true", help="Discard existing clusters first")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS",
+                        help="Time a resolve over ROWS synthetic vendors in a scratch database")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            benchmark(args.benchmark, os.path.join(tmp, "dedupe_bench.db"))
+    else:
+        if args.rebuild:
+            reset()
+        resolved, merged, seconds = resolve_new_vendors()
+        print(f"Resolved {resolved} vendors ({merged} merged into existing vendors) in {seconds:.1f}s")
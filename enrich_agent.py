@@ -1,52 +1,62 @@
-import json
+import os
 import sqlite3
-import re
-import time
-import random
 import sys
 import argparse
+import time
+import browsers
+import database
+import maps_scraper
+import normalize
+import pacing
+import pagestate
+import pipeline
+import timings
 from playwright.sync_api import sync_playwright
 
-DB_NAME = "marriage_vendors.db"
+DB_NAME = database.DB_NAME
 
 def get_db_connection():
     return sqlite3.connect(DB_NAME)
 
 def update_db_details(name, phone, address, category, location):
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Update phone if found/needed
-    if phone:
-        c.execute("UPDATE vendors SET phone = ? WHERE name = ? AND location = ? AND (phone IS NULL OR phone = '' OR phone = 'Not Available')", 
-                  (phone, name, location))
-    
-    # Update address if found/needed (and not just default location)
-    if address and address != location:
-         c.execute("UPDATE vendors SET address = ? WHERE name = ? AND location = ?", 
-                  (address, name, location))
-                  
-    if c.rowcount > 0:
+    # Goes through the process's single database writer (see writer.py)
+    if database.update_vendor_details(name, location, phone, address):
         print(f"Updated DB for {name}")
-    conn.commit()
-    conn.close()
 
-def enrich_data(category, location):
-    sanitized_category = category.replace(' ', '_')
-    sanitized_location = location.replace(' ', '_').replace(',', '').replace('/', '_')
-    json_file = f"vendors_{sanitized_category}_{sanitized_location}.json"
-    
-    try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        print(f"File {json_file} not found. Please run the scraper first for this location.")
-        return
+def _sync_saved_files(category, location, updated):
+    """
+    Keep a saved scraper JSON or records file in step with the database.
+    """
+    for saved_file, save in [(pipeline.output_json_path(category, location), pipeline.save_json),
+                             (pipeline.output_records_path(category, location), pipeline.save_records)]:
+        if not updated or not os.path.exists(saved_file):
+            continue
+        vendors = pipeline.load_vendors(saved_file)
+        changed = False
+        for vendor in vendors:
+            found = updated.get(vendor["name"])
+            if found:
+                new_phone = found["phone"] or vendor["phone"]
+                new_address = found["address"] or vendor["address"]
+                changed = changed or (new_phone, new_address) != (vendor["phone"], vendor["address"])
+                vendor["phone"], vendor["address"] = new_phone, new_address
+        if changed:
+            save(category, location, vendors, saved_file)
 
-    vendors = data.get("vendors", [])
-    print(f"Loaded {len(vendors)} vendors from {json_file}. Checking for missing phones...")
-    
-    vendors_to_enrich = [v for v in vendors if v.get("phone") in ["Not Available", "", None]]
+def enrich_data(category, location, should_stop=None, base_url=maps_scraper.MAPS_URL, pacer=None,
+                profile=None, metrics=None):
+    """
+    Look up vendors without a phone on Google Maps and update the database
+    (and the scraper's JSON or records file, if one was saved). should_stop() is
+    checked before each vendor. Raises pagestate.BlockedError if Google
+    serves a CAPTCHA or block page. base_url, pacer, profile and metrics are
+    as for maps_scraper.scrape_google_maps.
+    """
+    metrics = metrics or timings.RunMetrics("enrich", "google_maps", category, location)
+    # The database is the source of truth; the JSON file is optional
+    rows = database.get_vendors(category=category, location=location, with_phone=False)
+    print(f"Loaded {len(rows)} vendors without a phone from the database.")
+    vendors_to_enrich = [{"name": row[1], "phone": row[2], "address": row[3]} for row in rows]
     
     if not vendors_to_enrich:
         print("No vendors need enrichment.")
@@ -54,93 +64,110 @@ def enrich_data(category, location):
 
     print(f"Enriching {len(vendors_to_enrich)} vendors via Google Maps...")
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=False,
-            args=["--disable-blink-features=AutomationControlled"]
-        )
-        page = browser.new_page()
-        
-        updated_count = 0
-        
-        for vendor in vendors_to_enrich:
-            name = vendor["name"]
-            search_query = f"{name} {location}"
-            print(f"Searching: {search_query}")
-            
+    # Searches speed up while Google Maps keeps up and back off when it does not
+    pacer = pacer or pacing.get_pacer("google_maps")
+
+    updated_count = 0
+    # name -> the phone and address found (None if not found), for the saved file
+    updated = {}
+    try:
+        with sync_playwright() as p:
+            browser, context = browsers.launch(p, "google_maps", profile=profile,
+                                                args=["--disable-blink-features=AutomationControlled"])
             try:
-                page.goto(f"https://www.google.com/maps/search/{search_query}", timeout=30000)
-                time.sleep(3) # Wait for load
+                page = context.new_page()
+
+                for vendor in vendors_to_enrich:
+                    if should_stop and should_stop():
+                        print("Enrichment stopped.")
+                        break
+                    name = vendor["name"]
+                    search_query = f"{name} {location}"
+                    print(f"Searching: {search_query}")
+            
+                    metrics.count("vendors")
+                    try:
+                        with metrics.span("lookup"):
+                            with pacer.timed():
+                                page.goto(f"{base_url}/search/{search_query}", timeout=30000)
+                            # Wait for load; returns as soon as the result (or a challenge) shows
+                            pagestate.wait_for_state(page, "google_maps", timeout=5, pacer=pacer)
+                        extract_started = time.monotonic()
                 
-                # Check if it opened a single result or a list
-                # If we are lucky, it opens the details directly
+                        # Check if it opened a single result or a list
+                        # If we are lucky, it opens the details directly
                 
-                # Try to find phone number on the page
-                # Look for buttons with data-item-id starting with "phone:" 
-                # or aria-label containing "Phone:"
+                        # Try to find phone number on the page
+                        # Look for buttons with data-item-id starting with "phone:" 
+                        # or aria-label containing "Phone:"
                 
-                phone = None
+                        phone = None
+                        address = None
                 
-                # Method 1: Look for the phone number text directly in the panel
-                # Often formatted like: 080 1234 5678 or +91 ...
+                        # Method 1: Look for the phone number text directly in the panel
+                        # Often formatted like: 080 1234 5678 or +91 ...
                 
-                # We can grab the whole text content of the visible Sidebar
-                sidebar = page.locator("div[role='main']").first
-                if sidebar.count() > 0:
-                    text = sidebar.inner_text()
-                    # Regex for phone
-                    mob_match = re.search(r"(\+91[\-\s]?)?[6-9]\d{9}", text)
-                    if mob_match: 
-                        phone = mob_match.group(0)
-                    else:
-                        land_match = re.search(r"\b0\d{2,4}[\-\s]?\d{6,8}\b", text)
-                        if land_match: phone = land_match.group(0)
+                        # We can grab the whole text content of the visible Sidebar
+                        sidebar = page.locator("div[role='main']").first
+                        if sidebar.count() > 0:
+                            text = sidebar.inner_text()
+                            # Regex for phone (mobile first, then landline)
+                            phone = normalize.find_phone(text)
 
-                    # Extract Address 
-                    # Look for button with data-item-id="address" or check text
-                    # Often the address is the text inside a specific button or section
-                    # A robust way is to look for the "location" icon or known address patterns
-                    # But simpler: just get the full text and looks for lines that look like address (contain pin code)
-                    # OR: Look for button with aria-label="Address: ..."
+                            # Extract Address 
+                            # Look for button with data-item-id="address" or check text
+                            # Often the address is the text inside a specific button or section
+                            # A robust way is to look for the "location" icon or known address patterns
+                            # But simpler: just get the full text and looks for lines that look like address (contain pin code)
+                            # OR: Look for button with aria-label="Address: ..."
                     
-                    address_btn = page.locator("button[data-item-id='address']").first
-                    if address_btn.count() > 0:
-                        address = address_btn.get_attribute("aria-label")
-                        if address: address = address.replace("Address: ", "").strip()
-                    else:
-                        # Fallback: look for lines with 6 digit pincode
-                        lines = text.split('\n')
-                        for line in lines:
-                             if re.search(r"\b\d{6}\b", line):
-                                 address = line
-                                 break
+                            address_btn = page.locator("button[data-item-id='address']").first
+                            if address_btn.count() > 0:
+                                address = address_btn.get_attribute("aria-label")
+                                if address: address = address.replace("Address: ", "").strip()
+                            else:
+                                # Fallback: look for lines with 6 digit pincode
+                                lines = text.split('\n')
+                                for line in lines:
+                                     if normalize.has_pincode(line):
+                                         address = line
+                                         break
 
-                if phone or address:
-                    log_msg = []
-                    if phone: 
-                        vendor["phone"] = phone
-                        log_msg.append(f"Phone: {phone}")
-                    if address:
-                        vendor["address"] = address
-                        log_msg.append(f"Addr: {address}")
+                        metrics.record("extract", time.monotonic() - extract_started)
+                        if phone or address:
+                            log_msg = []
+                            if phone: 
+                                vendor["phone"] = phone
+                                log_msg.append(f"Phone: {phone}")
+                            if address:
+                                vendor["address"] = address
+                                log_msg.append(f"Addr: {address}")
                         
-                    print(f"  Found {', '.join(log_msg)}")
-                    update_db_details(name, phone, address, category, location)
-                    updated_count += 1
-                else:
-                    print(f"  No phone found.")
+                            print(f"  Found {', '.join(log_msg)}")
+                            with metrics.span("update"):
+                                update_db_details(name, phone, address, category, location)
+                            updated_count += 1
+                            updated[name] = {"phone": phone, "address": address}
+                            metrics.count("phones_found" if phone else "addresses_only")
+                        else:
+                            print(f"  No phone found.")
+                            metrics.count("not_found")
                 
-            except Exception as e:
-                print(f"Error enriching {name}: {e}")
-            
-            time.sleep(random.uniform(2, 4))
+                    except pagestate.BlockedError:
+                        # Every further search would be blocked as well
+                        raise
+                    except Exception as e:
+                        print(f"Error enriching {name}: {e}")
+                        metrics.count("lookup_errors")
             
-        browser.close()
-        
-    # Save updated JSON
-    with open(json_file, "w") as f:
-        json.dump(data, f, indent=2)
-    
+                    pacer.wait("page")
+            finally:
+                browser.close()
+    finally:
+        pacer.save()
+        # Also when a block page ended the run, so what was found is not lost
+        _sync_saved_files(category, location, updated)
+
     print(f"Enrichment complete. Updated {updated_count} vendors.")
 
 if __name__ == "__main__":
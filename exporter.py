@@ -0,0 +1,132 @@
+import csv
+import os
+import sqlite3
+import tempfile
+import database
+
+# Streaming export of the vendors table
+# Rows are read from SQLite with fetchmany() and written straight to the output
+# file, so memory use depends on CHUNK_SIZE, not on how many vendors there are.
+
+CHUNK_SIZE = 5000
+
+EXPORT_COLUMNS = ["id", "name", "phone", "phone_e164", "address", "category", "location",
+                  "rating", "rating_value", "summary", "canonical_id"]
+
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+# Excel's hard row limit; larger exports continue on another sheet
+XLSX_MAX_ROWS = 1048576
+
+
+def iter_vendor_chunks(chunk_size=CHUNK_SIZE, **filters):
+    """
+    Yield lists of up to chunk_size vendor rows (EXPORT_COLUMNS order).
+    filters are the keyword arguments of database.vendor_filters.
+    """
+    where, params = database.vendor_filters(**filters)
+    conn = sqlite3.connect(database.DB_NAME)
+    try:
+        c = conn.cursor()
+        c.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM vendors{where} ORDER BY id", params)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def export_csv(path, **filters):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in iter_vendor_chunks(**filters):
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def export_xlsx(path, **filters):
+    import xlsxwriter
+
+    # constant_memory flushes each row to disk as soon as the next one starts
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        sheet = None
+        sheet_row = XLSX_MAX_ROWS
+        count = 0
+        for rows in iter_vendor_chunks(**filters):
+            for row in rows:
+                if sheet_row >= XLSX_MAX_ROWS:
+                    sheet_number = len(workbook.worksheets()) + 1
+                    sheet = workbook.add_worksheet("Vendors" if sheet_number == 1 else f"Vendors {sheet_number}")
+                    sheet.write_row(0, 0, EXPORT_COLUMNS)
+                    sheet_row = 1
+                sheet.write_row(sheet_row, 0, row)
+                sheet_row += 1
+            count += len(rows)
+        if sheet is None:
+            workbook.add_worksheet("Vendors").write_row(0, 0, EXPORT_COLUMNS)
+    finally:
+        workbook.close()
+    return count
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("name", pa.string()),
+        ("phone", pa.string()),
+        ("phone_e164", pa.string()),
+        ("address", pa.string()),
+        ("category", pa.string()),
+        ("location", pa.string()),
+        ("rating", pa.string()),
+        ("rating_value", pa.float64()),
+        ("summary", pa.string()),
+        ("canonical_id", pa.int64()),
+    ])
+
+
+def export_parquet(path, **filters):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    count = 0
+    # One row group per chunk
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rows in iter_vendor_chunks(**filters):
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+            count += len(rows)
+    return count
+
+
+EXPORTERS = {"csv": export_csv, "xlsx": export_xlsx, "parquet": export_parquet}
+
+
+def spool_export(fmt, **filters):
+    """
+    Write an export to a temporary file and return (path, row_count).
+    The caller owns the file and should remove it when done.
+    """
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    fd, path = tempfile.mkstemp(prefix="vendors_export_", suffix=FORMATS[fmt][1])
+    os.close(fd)
+    try:
+        return path, EXPORTERS[fmt](path, **filters)
+    except Exception:
+        os.remove(path)
+        raise
@@ -0,0 +1,277 @@
+import argparse
+import html
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+# Local fixture site
+# Synthetic Justdial listing pages and Google Maps-like feeds, so the scrapers
+# can be run (and timed, see scraper_bench.py) without touching the real
+# sites. Both grow by infinite scroll: the page holds page_size cards and
+# fetches the next ones when scrolled near the bottom; Justdial then shows a
+# footer and Maps its end-of-list line once all `cards` are out. Every
+# response waits `latency` seconds first. Layouts mimic the markup variants
+# the scrapers handle:
+#   justdial  classic    li.cntanr cards, phone in .callcontent
+#             resultbox  div.result-box cards, phone only in the card text
+#             anchors    bare .resultbox_title_anchor titles (the slow path)
+#   maps      aria       articles named by aria-label
+#             headline   name only in .fontHeadlineSmall
+# Routes (base URLs for the scrapers: FixtureSite.justdial_url / maps_url):
+#   /                      Justdial homepage with a search box
+#   /search?q=, /City/Slug Justdial results
+#   /maps/search/<query>   Maps feed for "<category> in <location>", else a place page
+#   /jd/cards, /maps/cards next page_size cards (?q=&offset=)
+
+JUSTDIAL_LAYOUTS = ["classic", "resultbox", "anchors"]
+MAPS_LAYOUTS = ["aria", "headline"]
+
+# Every BLACKLIST_EVERY-th Justdial card is a navigation tile the scraper must skip
+BLACKLIST_EVERY = 25
+
+_WORDS = ["Sri", "Lakshmi", "Ganesh", "Balaji", "Sai", "Venkatesh", "Royal", "Grand", "Shree", "Annapoorna",
+          "Mahalakshmi", "Kaveri", "Tunga", "Chamundi", "Nandi", "Vinayaka"]
+_KINDS = ["Caterers", "Photography", "Decorators", "Tent House", "Events", "Florists", "Sound Systems"]
+_ROADS = ["MG Road", "Gandhi Bazaar", "Kuvempu Road", "BH Road", "Nehru Road", "Savarkar Nagar"]
+
+
+def vendor(seed, query, index):
+    """
+    The index-th synthetic vendor for a search; the same every time, so any
+    page of cards can be rendered on its own.
+    """
+    rng = random.Random(f"{seed}/{query}/{index}")
+    name = f"{rng.choice(_WORDS)} {rng.choice(_WORDS)} {rng.choice(_KINDS)} {index + 1}"
+    phone = f"{rng.randint(70000, 99999)} {rng.randint(10000, 99999)}" if rng.random() < 0.7 else None
+    address = f"{rng.randint(1, 999)}, {rng.choice(_ROADS)}, Fixture City {rng.randint(560001, 577999)}"
+    rating = f"{rng.randint(30, 50) / 10:.1f}"
+    return {"name": name, "phone": phone, "address": address, "rating": rating}
+
+
+def place_phone(name):
+    # Enrichment finds a number for every place page
+    rng = random.Random(name)
+    return f"+91 {rng.randint(70000, 99999)} {rng.randint(10000, 99999)}"
+
+
+def _justdial_card(layout, v, index):
+    name, address, rating = html.escape(v["name"]), html.escape(v["address"]), v["rating"]
+    if index % BLACKLIST_EVERY == BLACKLIST_EVERY - 1:
+        name = "Trending Searches"
+    phone = html.escape(v["phone"] or "")
+    if layout == "classic":
+        call = f'<span class="callcontent">{phone}</span>' if phone else ""
+        return (f'<li class="cntanr" style="height:170px"><h2 class="store-name">{name}</h2>{call}'
+                f'<span class="cont_fl_addr">{address}</span><span class="green-box">{rating}</span></li>')
+    if layout == "resultbox":
+        return (f'<div class="result-box" style="height:170px"><a class="resultbox_title_anchor">{name}</a>'
+                f'<p>{rating} ratings · Call {phone or "for details"}</p>'
+                f'<div class="address-info">{address}</div><div class="rating">{rating}</div></div>')
+    return f'<div style="height:170px"><a class="resultbox_title_anchor">{name}</a><p>{address}</p></div>'
+
+
+def _maps_card(layout, v):
+    name = html.escape(v["name"])
+    label = f' aria-label="{name}"' if layout == "aria" else ""
+    phone = f' · {html.escape(v["phone"])}' if v["phone"] else ""
+    return (f'<div><div role="article"{label} style="height:120px">'
+            f'<div class="fontHeadlineSmall">{name}</div>'
+            f'<span role="img" aria-label="{v["rating"]} stars"></span>'
+            f'<div class="fontBodyMedium">Wedding service · {html.escape(v["address"])}<br>'
+            f'Open · Closes 10 pm{phone}</div></div></div>')
+
+
+# Appends the next cards to `container` when `scroller` nears its bottom
+_SCROLL_JS = """
+<script>
+(function () {
+    const scroller = %(scroller)s, container = document.querySelector(%(container)s);
+    let offset = %(offset)d, loading = false;
+    const total = %(total)d, url = %(url)s;
+    function finish() { %(finish)s }
+    if (offset >= total) { finish(); return; }
+    (scroller === window ? window : scroller).addEventListener("scroll", async () => {
+        const el = scroller === window ? document.documentElement : scroller;
+        if (loading || offset >= total || el.scrollTop + el.clientHeight < el.scrollHeight - 600) return;
+        loading = true;
+        const response = await fetch(url + "&offset=" + offset);
+        container.insertAdjacentHTML("beforeend", await response.text());
+        offset += %(page_size)d;
+        if (offset >= total) finish();
+        loading = false;
+    });
+})();
+</script>"""
+
+
+class FixtureSite:
+    """
+    The fixture site on a background thread: start() returns it, stop()
+    shuts it down; also a context manager.
+    """
+    def __init__(self, cards=200, page_size=20, latency=0.0, layout="classic", maps_layout="aria",
+                 host="127.0.0.1", port=0, seed=1):
+        if layout not in JUSTDIAL_LAYOUTS:
+            raise ValueError(f"unknown Justdial layout {layout!r} (expected one of {JUSTDIAL_LAYOUTS})")
+        if maps_layout not in MAPS_LAYOUTS:
+            raise ValueError(f"unknown Maps layout {maps_layout!r} (expected one of {MAPS_LAYOUTS})")
+        self.cards = cards
+        self.page_size = page_size
+        self.latency = latency
+        self.layout = layout
+        self.maps_layout = maps_layout
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.site = self
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def justdial_url(self):
+        return self.url
+
+    @property
+    def maps_url(self):
+        return f"{self.url}/maps"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fixture-site", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def _cards(self, query, offset, render):
+        end = min(offset + self.page_size, self.cards)
+        return "".join(render(vendor(self.seed, query, i), i) for i in range(offset, end))
+
+    def justdial_cards(self, query, offset):
+        return self._cards(query, offset, lambda v, i: _justdial_card(self.layout, v, i))
+
+    def maps_cards(self, query, offset):
+        return self._cards(query, offset, lambda v, i: _maps_card(self.maps_layout, v))
+
+    def justdial_home(self):
+        return """<html><head><title>Justdial fixture</title></head><body>
+<header><input id="srchbx" class="search-input" type="text" placeholder="Search for anything"></header>
+<script>
+document.getElementById("srchbx").addEventListener("keydown", (event) => {
+    if (event.key === "Enter") location.href = "/search?q=" + encodeURIComponent(event.target.value);
+});
+</script></body></html>"""
+
+    def justdial_results(self, query):
+        tag = "ul" if self.layout == "classic" else "div"
+        script = _SCROLL_JS % {
+            "scroller": "window", "container": json.dumps("#results"), "offset": self.page_size,
+            "total": self.cards, "page_size": self.page_size, "url": json.dumps(f"/jd/cards?q={quote(query)}"),
+            "finish": 'document.body.insertAdjacentHTML("beforeend", "<footer>Justdial fixture footer</footer>");',
+        }
+        return (f"<html><head><title>{html.escape(query)} - Justdial fixture</title></head>"
+                f'<body style="margin:0"><{tag} id="results">{self.justdial_cards(query, 0)}</{tag}>'
+                f"{script}</body></html>")
+
+    def maps_results(self, query):
+        script = _SCROLL_JS % {
+            "scroller": "document.querySelector(\"div[role='feed']\")", "container": json.dumps("div[role='feed']"),
+            "offset": self.page_size, "total": self.cards, "page_size": self.page_size,
+            "url": json.dumps(f"/maps/cards?q={quote(query)}"),
+            "finish": "container.insertAdjacentHTML(\"beforeend\", \"<p>You've reached the end of the list.</p>\");",
+        }
+        return (f"<html><head><title>{html.escape(query)} - Maps fixture</title></head><body>"
+                f'<div role="main"><div role="feed" style="height:640px;overflow-y:scroll">'
+                f"{self.maps_cards(query, 0)}</div></div>{script}</body></html>")
+
+    def maps_place(self, query):
+        name = html.escape(query)
+        address = html.escape(vendor(self.seed, query, 0)["address"])
+        return (f"<html><head><title>{name} - Maps fixture</title></head><body>"
+                f"<div role=\"main\"><h1>{name}</h1>"
+                f'<button data-item-id="address" aria-label="Address: {address}">{address}</button>'
+                f"<div>Phone: {place_phone(query)}</div></div></body></html>")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body, code=200):
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The browser closed mid-response
+            pass
+
+    def do_GET(self):
+        site = self.server.site
+        site.count_request()
+        if site.latency:
+            time.sleep(site.latency)
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        query, offset = params.get("q", ""), int(params.get("offset", 0))
+        parts = [part for part in path.split("/") if part]
+
+        if path == "/":
+            return self._reply(site.justdial_home())
+        if path == "/search":
+            return self._reply(site.justdial_results(query))
+        if path == "/jd/cards":
+            return self._reply(site.justdial_cards(query, offset))
+        if path == "/maps/cards":
+            return self._reply(site.maps_cards(query, offset))
+        if parts[:2] == ["maps", "search"] and len(parts) > 2:
+            search = "/".join(parts[2:])
+            # The Maps scraper searches "<category> in <location>"; enrichment searches a vendor name
+            return self._reply(site.maps_results(search) if " in " in search else site.maps_place(search))
+        if len(parts) == 2 and parts[0] not in ("maps", "jd"):
+            # Direct category URL, /City/Slug
+            return self._reply(site.justdial_results(f"{parts[1]} in {parts[0]}"))
+        self._reply("<html><body>Not found</body></html>", 404)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the fixture site for manual testing.")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every response")
+    parser.add_argument("--layout", choices=JUSTDIAL_LAYOUTS, default="classic")
+    parser.add_argument("--maps-layout", choices=MAPS_LAYOUTS, default="aria")
+    args = parser.parse_args()
+
+    site = FixtureSite(args.cards, args.page_size, args.latency, args.layout, args.maps_layout, port=args.port)
+    site.start()
+    print(f"Justdial fixture on {site.justdial_url}/, Maps fixture on {site.maps_url}/search/Caterers in Shimoga. "
+          f"Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        site.stop()
@@ -0,0 +1,575 @@
+import argparse
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+import circuit
+import database
+import dedupe
+import enrich_agent
+import pacing
+import pagestate
+import pipeline
+import ratelimit
+import timings
+
+# Job queue
+# Scrape and enrich runs are rows in the jobs table. Workers, whether threads
+# in the Streamlit server, the scheduler or standalone `python jobs.py`
+# processes, claim queued rows atomically and hold them under a lease that a
+# heartbeat keeps renewing. If a worker dies its lease runs out and the job
+# is queued again; failed attempts are retried with exponential backoff until
+# max_attempts. State lives in SQLite, which is what lets a browser reload,
+# a second tab or a restarted scheduler pick the jobs up again. Jobs of a
+# source whose circuit breaker is open (circuit.py) stay queued until it
+# lets them through.
+
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "2"))
+JOB_LOG_DIR = "job_logs"
+POLL_INTERVAL = 1.0
+# Seconds between progress writes to the jobs table
+PROGRESS_INTERVAL = 1.0
+# A claimed job belongs to its worker for this long; heartbeats renew it
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+# Delay before the first retry; doubles with every further attempt
+BACKOFF_SECONDS = 60
+MAX_BACKOFF_SECONDS = 3600
+# Seconds a worker waits for the database write lock held by another process
+BUSY_TIMEOUT = 30
+
+JOB_KINDS = ("scrape", "enrich")
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_dedupe_lock = threading.Lock()
+
+JOB_COLUMNS = ["id", "kind", "source", "category", "location", "status", "batch", "created_at", "started_at",
+               "finished_at", "progress", "vendors_found", "vendors_new", "vendors_changed", "log_path",
+               "output_file", "run_id", "error", "attempts", "max_attempts", "available_at", "lease_owner",
+               "lease_expires_at"]
+
+
+# Jobs run on worker threads in this process, so each worker points
+# sys.stdout/sys.stderr at its job's log file through this thread-local
+_job_output = threading.local()
+
+
+class _ThreadOutput:
+    """
+    Stand-in for sys.stdout/sys.stderr that writes to the current worker's
+    job log, and to the original stream for every other thread.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        log = getattr(_job_output, "log", None)
+        if log is None:
+            return self._stream.write(text)
+        if text.strip():
+            _job_output.last_line = text.strip().splitlines()[-1][:200]
+        return log.write(text)
+
+    def flush(self):
+        log = getattr(_job_output, "log", None)
+        (log or self._stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _connect():
+    return sqlite3.connect(database.DB_NAME, timeout=BUSY_TIMEOUT)
+
+
+def _at(seconds=0):
+    """
+    Timestamp `seconds` from now, in the format of database._now().
+    """
+    return (datetime.now() + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def submit_job(kind, category, location, source=None, batch=None, max_attempts=MAX_ATTEMPTS, notify=True):
+    """
+    Queue a job and wake this process's workers. Returns the job id.
+    source defaults to justdial for scrapes and google_maps, which
+    enrichment searches, for enrich jobs.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    source = source or ("google_maps" if kind == "enrich" else "justdial")
+    database.init_db()
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('''INSERT INTO jobs (kind, source, category, location, status, batch, max_attempts, created_at)
+                 VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)''',
+              (kind, source, category, location, batch, max_attempts, database._now()))
+    job_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    if notify:
+        get_manager().notify()
+    return job_id
+
+
+def get_jobs(limit=20, batch=None):
+    query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+    params = []
+    if batch is not None:
+        query += " WHERE batch = ?"
+        params.append(batch)
+    query += " ORDER BY id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    conn = _connect()
+    c = conn.cursor()
+    c.execute(query, params)
+    rows = c.fetchall()
+    conn.close()
+    return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+
+def get_job(job_id):
+    conn = _connect()
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+def has_active_jobs(batch=None):
+    query = "SELECT 1 FROM jobs WHERE status IN (?, ?)"
+    params = list(ACTIVE_STATUSES)
+    if batch is not None:
+        query += " AND batch = ?"
+        params.append(batch)
+    conn = _connect()
+    c = conn.cursor()
+    c.execute(query + " LIMIT 1", params)
+    row = c.fetchone()
+    conn.close()
+    return row is not None
+
+
+def batch_exists(batch):
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM jobs WHERE batch = ? LIMIT 1", (batch,))
+    row = c.fetchone()
+    conn.close()
+    return row is not None
+
+
+def submit_batch(batch, pairs, sources, max_attempts=MAX_ATTEMPTS):
+    """
+    Queue one scrape job per (category, location) pair and source under
+    `batch`. Sources alternate in the queue, so workers rarely all wait on
+    one source's limits. Returns the number of jobs queued.
+    """
+    database.init_db()
+    rows = [("scrape", source, category, location, batch, max_attempts, database._now())
+            for category, location in pairs for source in sources]
+    conn = _connect()
+    conn.executemany('''INSERT INTO jobs (kind, source, category, location, status, batch, max_attempts, created_at)
+                          VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)''', rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def _parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if value else None
+
+
+def batch_report(batch):
+    """
+    Wall time of a batch and, per source, pairs run and failed and the
+    throughput achieved, from the batch's rows in the jobs table.
+    """
+    rows = get_jobs(limit=None, batch=batch)
+    sources = {}
+    for row in rows:
+        started, finished = _parse_time(row["started_at"]), _parse_time(row["finished_at"])
+        s = sources.setdefault(row["source"], {"pairs": 0, "failed": 0, "vendors": 0, "busy": 0.0, "timed": 0,
+                                               "first_start": None, "last_finish": None})
+        s["pairs"] += 1
+        s["failed"] += row["status"] == "failed"
+        s["vendors"] += row["vendors_found"] if row["status"] == "succeeded" else 0
+        if started and finished:
+            s["busy"] += (finished - started).total_seconds()
+            s["timed"] += 1
+            s["first_start"] = min(s["first_start"] or started, started)
+            s["last_finish"] = max(s["last_finish"] or finished, finished)
+
+    starts = [s["first_start"] for s in sources.values() if s["first_start"]]
+    finishes = [s["last_finish"] for s in sources.values() if s["last_finish"]]
+    wall = (max(finishes) - min(starts)).total_seconds() if starts else 0.0
+    lines = [f"Matrix {batch}: {len(rows)} pairs in {wall / 60:.1f} min"]
+    for source, s in sorted(sources.items()):
+        span = max((s["last_finish"] - s["first_start"]).total_seconds(), 1) if s["first_start"] else 1
+        lines.append(f"  {source}: {s['pairs']} pairs ({s['failed']} failed), {s['vendors']} vendors, "
+                     f"{s['vendors'] / span * 60:.1f} vendors/min, {s['timed'] / span * 3600:.1f} pairs/hour, "
+                     f"{s['busy'] / max(s['timed'], 1):.0f}s per pair")
+    conn = _connect()
+    c = conn.cursor()
+    c.execute('''SELECT COUNT(r.pages_saved), COALESCE(SUM(r.pages_saved), 0), COALESCE(SUM(r.seconds_saved), 0)
+                 FROM jobs j JOIN scrape_runs r ON r.id = j.run_id
+                 WHERE j.batch = ? AND r.pages_saved IS NOT NULL''', (batch,))
+    stopped, pages_saved, seconds_saved = c.fetchone()
+    conn.close()
+    if stopped:
+        lines.append(f"  Early stops: {stopped} scrapes stopped at known vendors, saving ~{pages_saved} pages "
+                     f"(~{seconds_saved / 60:.1f} min)")
+    for row in pacing.get_metrics():
+        latency = f"{row['latency']:.1f}s" if row["latency"] is not None else "-"
+        lines.append(f"  {row['source']} pace {row['pace']:.2f}x, latency {latency}, "
+                     f"{row['speedups']} speed-ups, {row['slowdowns']} slow-downs")
+    for breaker in circuit.open_breakers():
+        lines.append(f"  {breaker['source']} paused until {breaker['open_until']} "
+                     f"after a {breaker['last_page_state']} page (trip {breaker['trips']})")
+    return "\n".join(lines)
+
+
+def cancel_job(job_id):
+    """
+    Cancel a queued job, or stop a running one at its next checkpoint.
+    """
+    conn = _connect()
+    conn.execute('''UPDATE jobs SET status = 'cancelled', finished_at = ?, lease_owner = NULL,
+                                    lease_expires_at = NULL
+                    WHERE id = ? AND status IN (?, ?)''',
+                 (database._now(), job_id) + ACTIVE_STATUSES)
+    conn.commit()
+    conn.close()
+
+
+def tail_log(path, max_bytes=4000):
+    if not path or not os.path.exists(path):
+        return ""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        data = f.read().decode("utf-8", errors="replace")
+    # Drop the partial first line
+    return data.split("\n", 1)[1] if size > max_bytes and "\n" in data else data
+
+
+def _update_job(job_id, owner, **fields):
+    """
+    Update a job's columns if `owner` still holds its lease (so a worker
+    whose lease expired, or whose job was cancelled, cannot overwrite it).
+    Returns True if the row was updated.
+    """
+    conn = _connect()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    c = conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                     list(fields.values()) + [job_id, owner])
+    updated = c.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+
+def expire_leases():
+    """
+    Requeue running jobs whose worker stopped renewing the lease, or fail
+    them if they have used up their attempts. Returns the number expired.
+    """
+    now = database._now()
+    conn = _connect()
+    c = conn.execute('''UPDATE jobs
+                        SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                            finished_at = CASE WHEN attempts >= max_attempts THEN ? ELSE NULL END,
+                            error = 'Lease expired (worker stopped)', available_at = ?,
+                            lease_owner = NULL, lease_expires_at = NULL
+                        WHERE status = 'running' AND lease_expires_at < ?
+                        RETURNING run_id''', (now, now, now))
+    rows = c.fetchall()
+    run_ids = [run_id for (run_id,) in rows if run_id is not None]
+    # The dead worker never finished its scrape run; the retry starts a new one
+    conn.executemany("UPDATE scrape_runs SET finished_at = ?, status = 'Failed', message = ? "
+                     "WHERE id = ? AND status = 'Running'",
+                     [(now, "Lease expired (worker stopped)", run_id) for run_id in run_ids])
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def claim_job(owner, batch=None):
+    """
+    Atomically lease the oldest queued job that is due (optionally from one
+    batch) and whose source is within its limits (ratelimit.LIMITS) to
+    `owner` and return it, or None if there is nothing to do.
+    """
+    expire_leases()
+    now = database._now()
+    started = time.time()
+    limits, limit_params = ratelimit.limits_cte()
+    query = f'''{limits}
+                UPDATE jobs SET status = 'running', started_at = ?, finished_at = NULL, lease_owner = ?,
+                                lease_expires_at = ?, attempts = attempts + 1
+                WHERE id = (SELECT id FROM jobs
+                            WHERE status = 'queued' AND (available_at IS NULL OR available_at <= ?)
+                            AND NOT {circuit.PAUSED_SQL}
+                            AND NOT {ratelimit.THROTTLED_SQL}
+                            {"AND batch = ?" if batch is not None else ""}
+                            ORDER BY id LIMIT 1)
+                RETURNING {', '.join(JOB_COLUMNS)}'''
+    params = limit_params + [now, owner, _at(LEASE_SECONDS), now, now, started] + ([batch] if batch is not None else [])
+    conn = _connect()
+    try:
+        c = conn.cursor()
+        # Count the source's running jobs and record its start under one write lock
+        c.execute("BEGIN IMMEDIATE")
+        c.execute(query, params)
+        row = c.fetchone()
+        if row:
+            ratelimit.record_start(c, row[JOB_COLUMNS.index("source")], started)
+        conn.commit()
+    finally:
+        conn.close()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+def _retry_or_fail(job, owner, error):
+    if job["attempts"] < job["max_attempts"]:
+        delay = min(BACKOFF_SECONDS * 2 ** (job["attempts"] - 1), MAX_BACKOFF_SECONDS)
+        print(f"Attempt {job['attempts']} of {job['max_attempts']} failed; retrying in {delay}s.")
+        _update_job(job["id"], owner, status="queued", available_at=_at(delay), error=error[:500],
+                    lease_owner=None, lease_expires_at=None)
+    else:
+        _update_job(job["id"], owner, status="failed", finished_at=database._now(), error=error[:500],
+                    lease_owner=None, lease_expires_at=None)
+
+
+def handle_block(job, owner, page_state, error):
+    """
+    A job hit a CAPTCHA or block page: open its source's circuit breaker and
+    retry the job later. Once the breaker has given up, the source's other
+    queued jobs are failed too rather than left waiting.
+    """
+    breaker = circuit.record_block(job["source"], page_state)
+    _retry_or_fail(job, owner, error)
+    if breaker["gave_up"]:
+        conn = _connect()
+        c = conn.execute('''UPDATE jobs SET status = 'failed', finished_at = ?, error = ?
+                            WHERE status = 'queued' AND source = ?''',
+                         (database._now(), f"{job['source']} kept returning {page_state} pages; skipped",
+                          job["source"]))
+        print(f"Gave up on {job['source']} for now; failed {c.rowcount} queued jobs.")
+        conn.commit()
+        conn.close()
+
+
+class _Lease:
+    """
+    Renews a job's lease from a background thread while the job runs.
+    `lost` is set once the lease can no longer be renewed (job cancelled or
+    taken over after expiry); the job should then stop.
+    """
+    def __init__(self, job_id, owner):
+        self.job_id = job_id
+        self.owner = owner
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name=f"lease-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _renew(self):
+        while not self._stop.wait(LEASE_SECONDS / 3):
+            try:
+                if not _update_job(self.job_id, self.owner, lease_expires_at=_at(LEASE_SECONDS)):
+                    self.lost = True
+                    return
+            except sqlite3.OperationalError:
+                # Busy; the lease still has time left, try again next beat
+                pass
+
+
+class _Checkpoint:
+    """
+    Progress and cancellation hooks handed to a running job. Progress is
+    written at most every PROGRESS_INTERVAL seconds; a write that finds the
+    job cancelled or no longer ours stops the job.
+    """
+    def __init__(self, job_id, owner, lease):
+        self.job_id = job_id
+        self.owner = owner
+        self.lease = lease
+        self.last_write = 0.0
+
+    def progress(self, vendors, stats):
+        if time.monotonic() - self.last_write >= PROGRESS_INTERVAL:
+            self.last_write = time.monotonic()
+            if not _update_job(self.job_id, self.owner, progress=_job_output.last_line,
+                               vendors_found=len(vendors), vendors_new=stats["new"], vendors_changed=stats["changed"]):
+                self.lease.lost = True
+
+    def should_stop(self):
+        if time.monotonic() - self.last_write >= PROGRESS_INTERVAL:
+            self.last_write = time.monotonic()
+            # Not updated: cancelled or taken over, no need to wait for the next lease renewal
+            if not _update_job(self.job_id, self.owner, progress=_job_output.last_line):
+                self.lease.lost = True
+        return self.lease.lost
+
+
+class JobManager:
+    """
+    A pool of worker threads. start() runs them in the background for as
+    long as the process lives; drain() runs them until `batch` has no queued
+    or running jobs left. Per-source limits are applied by claim_job.
+    """
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, batch=None, write_json=True):
+        self.max_workers = max_workers
+        self.batch = batch
+        self.write_json = write_json
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._spawn(until_idle=False, daemon=True)
+
+    def drain(self):
+        self._spawn(until_idle=True, daemon=False)
+        for thread in self._threads:
+            thread.join()
+
+    def notify(self):
+        self._wake.set()
+
+    def _spawn(self, until_idle, daemon):
+        database.init_db()
+        os.makedirs(JOB_LOG_DIR, exist_ok=True)
+        if not isinstance(sys.stdout, _ThreadOutput):
+            sys.stdout = _ThreadOutput(sys.stdout)
+            sys.stderr = _ThreadOutput(sys.stderr)
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, args=(until_idle,), name=f"job-worker-{i}", daemon=daemon)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self, until_idle):
+        owner = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        while True:
+            try:
+                job = claim_job(owner, self.batch)
+            except sqlite3.OperationalError as e:
+                # Database busy; try again on the next tick
+                print(f"Job worker could not claim a job: {e}")
+                job = None
+            if job is None:
+                # Jobs still running elsewhere or waiting out a backoff may come back to the queue
+                if until_idle and not has_active_jobs(self.batch):
+                    return
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+
+            log_path = os.path.join(JOB_LOG_DIR, f"job_{job['id']}.log")
+            _update_job(job["id"], owner, log_path=log_path)
+            # Line-buffered, so the UI's log tail follows the job as it prints.
+            # Attempts append to the same log.
+            with open(log_path, "a", encoding="utf-8", buffering=1) as log, _Lease(job["id"], owner) as lease:
+                _job_output.log = log
+                _job_output.last_line = ""
+                try:
+                    print(f"--- Attempt {job['attempts']} by {owner} at {database._now()} ---")
+                    self._run(job, owner, lease)
+                except pagestate.BlockedError as e:
+                    print(f"Job blocked: {e}")
+                    handle_block(job, owner, e.state, str(e))
+                except Exception as e:
+                    print(f"Job failed: {e}")
+                    _retry_or_fail(job, owner, str(e))
+                finally:
+                    _job_output.log = None
+
+    def _run(self, job, owner, lease):
+        job_id, category, location = job["id"], job["category"], job["location"]
+        checkpoint = _Checkpoint(job_id, owner, lease)
+
+        # claim_job already held the job back until its source (enrich jobs
+        # count against theirs too) had a free slot and was due to start
+        if job["kind"] == "enrich":
+            metrics = timings.RunMetrics("enrich", job["source"], category, location)
+            try:
+                enrich_agent.enrich_data(category, location, should_stop=checkpoint.should_stop, metrics=metrics)
+            except Exception:
+                metrics.save("Failed")
+                raise
+            metrics.save("Success")
+        else:
+            run_id = database.start_scrape_run(category, location, job["source"])
+            _update_job(job_id, owner, run_id=run_id)
+            result = pipeline.run_scrape(category, location, source=job["source"], run_id=run_id,
+                                         write_json=self.write_json, progress=checkpoint.progress,
+                                         should_stop=checkpoint.should_stop)
+        if job["kind"] == "enrich":
+            circuit.record_success(job["source"])
+            _update_job(job_id, owner, status="succeeded", finished_at=database._now(),
+                        progress=_job_output.last_line, lease_owner=None, lease_expires_at=None)
+            return
+        if result["status"] == "Cancelled":
+            return
+        circuit.record_success(job["source"])
+        # Resolve one batch of new rows at a time within this process
+        with _dedupe_lock:
+            dedupe.resolve_new_vendors()
+        _update_job(job_id, owner, status="succeeded", finished_at=database._now(), progress=result["message"],
+                    vendors_found=len(result["vendors"]), vendors_new=result["stats"]["new"],
+                    vendors_changed=result["stats"]["changed"], output_file=result["json_file"],
+                    lease_owner=None, lease_expires_at=None)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """
+    The process-wide JobManager, started on first use. It claims the
+    scheduler's batch jobs too; claim_job keeps every source within its
+    limits across both pools.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+            _manager.start()
+        return _manager
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued scrape/enrich jobs.")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_JOBS)
+    parser.add_argument("--batch", help="Only run jobs of this batch")
+    parser.add_argument("--until-idle", action="store_true", help="Exit once no jobs are queued or running")
+    args = parser.parse_args()
+
+    manager = JobManager(args.workers, batch=args.batch, write_json=False)
+    if args.until_idle:
+        manager.drain()
+    else:
+        manager.start()
+        print(f"{args.workers} job workers running. Press Ctrl+C to exit.")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            print("Job workers stopped.")
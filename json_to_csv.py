@@ -1,106 +1,291 @@
+import argparse
 import json
 import csv
-import re
+import glob
 import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+import normalize
+import records
+
+# Batch conversion
+# convert_json_to_csv cleans one file row by row. convert_many loads many
+# vendors_*.json and .vrec records files (or the vendors table) as DataFrames, does the same
+# cleaning with pandas string methods over whole columns, and writes one
+# merged, deduplicated CSV or Parquet file. Files are loaded and cleaned in
+# a process pool; the merge and dedupe run once over the combined frame.
+# The patterns are normalize.py's, whose pattern strings pandas can hand to
+# pyarrow's RE2 engine (compiled patterns fall back to a Python loop).
+
+# Phone values the scrapers use when they found none
+MISSING_PHONES = ["Not Available", "N/A", ""]
+
+CSV_COLUMNS = ["name", "phone", "address"]
+MERGED_COLUMNS = ["name", "phone", "address", "rating", "category", "location"]
+
+DEFAULT_PATTERNS = ["vendors_*.json", "vendors_*" + records.EXTENSION]
+DEFAULT_OUTPUT = "vendors_merged.csv"
 
 def extract_phone_from_address(address):
     """
     Extracts phone number from address string and cleans the address.
     Returns (cleaned_address, phone_number)
     """
-    if not address:
-        return address, None
-
-    # Regex patterns
-    # Pattern to find phone numbers (approximate for Indian numbers: 10-12 digits, optional spaces)
-    # Examples: 073386 66555 (6+5), 98442 82504 (6+5), 081832 22225 (6+5)
-    # Allow 3-6 digits for the first part
-    phone_pattern = r'\b(\d{3,6}\s?\d{5,8})\b'
-    
-    # Pattern to remove "Open . Closes .." garbage
-    # Example: "Open \u00b7 Closes 5\u202fpm \u00b7 "
-    garbage_pattern = r'Open.*Closes.*?[APap][Mm].*?(\u00b7|\.)\s*'
-
-    phone_match = re.search(phone_pattern, address)
-    phone = None
-    
-    clean_addr = address
-
-    if phone_match:
-        phone = phone_match.group(1)
-        # Remove the phone number from the address
-        clean_addr = clean_addr.replace(phone, '').strip()
-    
-    # Remove garbage prefix
-    clean_addr = re.sub(garbage_pattern, '', clean_addr).strip()
-    
-    # Remove trailing/leading separators like '·' or ',' or '-'
-    clean_addr = re.sub(r'^[\s\u00b7,\-]+|[\s\u00b7,\-]+$', '', clean_addr).strip()
-
-    return clean_addr, phone
+    return normalize.split_phone(address)
+
+def clean_vendor(phone, address):
+    """
+    Fill a missing phone (None or one of MISSING_PHONES) from the address,
+    dropping it and any "Open . Closes .." garbage from the address.
+    Returns (phone, address).
+    """
+    if (phone is None or phone in MISSING_PHONES) and address:
+        cleaned_addr, extracted_phone = extract_phone_from_address(address)
+        if extracted_phone:
+            phone = extracted_phone
+            address = cleaned_addr
+        elif normalize.has_opening_hours(address):
+            # No phone, but the garbage is worth stripping anyway
+            address = cleaned_addr
+    return phone, address
+
+def read_vendor_file(path):
+    """
+    The {"category", "location", "vendors"} of a scraper JSON file or a
+    records file, with records.VendorRecord's fields in every vendor.
+    """
+    if path.endswith(records.EXTENSION):
+        category, location, vendors = records.read_file(path)
+        return {"category": category, "location": location, "vendors": records.to_dicts(vendors)}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["vendors"] = records.to_dicts(records.from_dicts(data.get("vendors", [])))
+    return data
 
 def convert_json_to_csv(json_file_path):
     """
-    Converts a vendor JSON file to CSV with data cleaning.
+    Converts a vendor JSON (or records) file to CSV with data cleaning.
     """
     if not os.path.exists(json_file_path):
         return None, "File not found."
 
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        vendors = data.get("vendors", [])
+        vendors = read_vendor_file(json_file_path)["vendors"]
         if not vendors:
             return None, "No vendors found in JSON."
 
         # Prepare CSV data
         csv_data = []
         for v in vendors:
-            name = v.get("name")
-            phone = v.get("phone", "Not Available")
-            address = v.get("address", "")
-            rating = v.get("rating", "N/A")
-            snippet = v.get("snippet", "")
-            
-            # Logic: If phone is missing, try to find it in address
-            if phone in ["Not Available", "N/A", ""] and address:
-                cleaned_addr, extracted_phone = extract_phone_from_address(address)
-                if extracted_phone:
-                    phone = extracted_phone
-                    address = cleaned_addr
-                # Even if no phone extracted, we might want to clean garbage from address?
-                # The user example implies garbage usually comes with the phone number logic,
-                # but "Open . Closes.." might appear even if phone isn't there? 
-                # Let's assume we clean address regardless if it looks like it has garbage.
-                if "Open" in address and "Closes" in address:
-                     address, _ = extract_phone_from_address(address) # Re-run to clean garbage if not already done
-
+            phone, address = clean_vendor(v["phone"], v["address"])
             csv_data.append({
-                "name": name,
+                "name": v["name"],
                 "phone": phone,
                 "address": address
             })
-            
+
         # Generate CSV filename
-        csv_file = json_file_path.replace('.json', '.csv')
-        
-        keys = ["name", "phone", "address"]
-        
+        csv_file = os.path.splitext(json_file_path)[0] + '.csv'
+
         with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
             writer.writeheader()
             writer.writerows(csv_data)
-            
+
         return csv_file, "Success"
 
     except Exception as e:
         return None, str(e)
 
+def clean_frame(df):
+    """
+    clean_vendor over whole columns: a DataFrame with phone and address
+    columns is cleaned in place and returned. The regexes only run on rows
+    whose phone is missing, and only addresses that held a phone or opening
+    hours are rewritten.
+    """
+    address = df["address"].fillna("").astype(str)
+    phone = df["phone"].fillna("Not Available").astype(str)
+    todo = phone.isin(MISSING_PHONES) & (address != "")
+    if not todo.any():
+        return df
+
+    addr = address[todo]
+    cleaned, found = normalize.split_phone_series(addr)
+    cleaned = cleaned[found.notna() | normalize.opening_hours_series(addr)]
+    found = found.dropna()
+
+    df.loc[cleaned.index, "address"] = cleaned
+    df.loc[found.index, "phone"] = found
+    return df
+
+def dedupe_frame(df):
+    """
+    Drop repeat vendors: same name (normalize.name_key) and same phone
+    number, or same name and location when there is no phone. The first row
+    of each vendor is kept. Returns (frame, duplicates_dropped).
+    """
+    name_key = normalize.name_key_series(df["name"])
+    # Last ten digits, so "+91 98442 82504" and "098442 82504" match
+    phone_key = df["phone"].fillna("").astype(str).str.replace(r"\D+", "", regex=True).str[-10:]
+    location_key = "@" + df["location"].fillna("").astype(str).str.strip().str.lower()
+    phone_key = phone_key.where(phone_key.str.len() >= 6, location_key)
+    duplicated = (name_key + "\t" + phone_key).duplicated()
+    return df[~duplicated].reset_index(drop=True), int(duplicated.sum())
+
+def load_file(path):
+    """
+    Vendors of one JSON or records file as a cleaned DataFrame with
+    MERGED_COLUMNS. Category and location come from the file when the
+    vendors lack them.
+    """
+    import pandas as pd
+
+    data = read_vendor_file(path)
+    df = pd.DataFrame(data.get("vendors", []), columns=MERGED_COLUMNS)
+    for column in ["category", "location"]:
+        if data.get(column):
+            df[column] = df[column].fillna(data[column])
+    return clean_frame(df)
+
+def load_database(db_name=None):
+    import pandas as pd
+    import database
+
+    conn = sqlite3.connect(db_name or database.DB_NAME)
+    df = pd.read_sql_query(f"SELECT {', '.join(MERGED_COLUMNS)} FROM vendors ORDER BY id", conn)
+    conn.close()
+    return clean_frame(df)
+
+def write_frame(df, path):
+    """
+    Write CSV, or Parquet for a .parquet path. The file is replaced
+    atomically.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if path.endswith(".parquet"):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False, encoding="utf-8")
+    os.replace(tmp_path, path)
+    return path
+
+def convert_many(paths=None, output=DEFAULT_OUTPUT, from_db=False, workers=None):
+    """
+    Merge vendor JSON or records files (paths, default every vendors_*.json
+    and vendors_*.vrec here) or, with from_db, the vendors table, into one
+    cleaned, deduplicated CSV or Parquet file. Files are loaded in a pool of `workers` processes
+    (default: one per CPU). Returns (output_path, message) like
+    convert_json_to_csv.
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    if from_db:
+        frames = [load_database()]
+        what = "the database"
+    else:
+        paths = sorted(paths or [path for pattern in DEFAULT_PATTERNS for path in glob.glob(pattern)])
+        if not paths:
+            return None, "No vendor files found."
+        if len(paths) == 1 or workers == 1:
+            frames = [load_file(path) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                frames = list(pool.map(load_file, paths))
+        what = f"{len(paths)} files"
+
+    merged = pd.concat(frames, ignore_index=True)
+    if merged.empty:
+        return None, "No vendors found."
+    merged, dropped = dedupe_frame(merged)
+    write_frame(merged, output)
+    seconds = time.perf_counter() - start
+    return output, (f"Merged {len(merged)} vendors from {what} ({dropped} duplicates dropped) "
+                    f"in {seconds:.1f}s")
+
+def _synthetic_frame(rows, seed=42):
+    """
+    Vendor rows shaped like scraper output: about half without a phone,
+    most of those with one in the address, some with opening-hours garbage,
+    and a fifth repeating an earlier vendor.
+    """
+    import random
+    import pandas as pd
+
+    rng = random.Random(seed)
+    words = ["Sri", "Lakshmi", "Ganesh", "Balaji", "Sai", "Venkatesh", "Royal", "Grand", "Shree", "Annapoorna"]
+    kinds = ["Caterers", "Photography", "Decorators", "Tent House", "Events", "Florists"]
+    cities = ["Bangalore", "Mysore", "Shimoga", "Hubli", "Mangalore"]
+    names, phones, addresses, locations = [], [], [], []
+    for i in range(rows):
+        if i and rng.random() < 0.2:
+            j = rng.randrange(i)
+            names.append(names[j].upper())
+            phones.append(phones[j])
+            addresses.append(addresses[j])
+            locations.append(locations[j])
+            continue
+        names.append(f"{rng.choice(words)} {rng.choice(words)} {rng.choice(kinds)} {i}")
+        city = rng.choice(cities)
+        locations.append(f"{city}, Karnataka")
+        address = f"{rng.randint(1, 999)}, {rng.randint(1, 40)}th Cross, {city}"
+        number = f"0{rng.randint(70000, 99999)} {rng.randint(10000, 99999)}"
+        roll = rng.random()
+        if roll < 0.5:
+            phones.append(number)
+        elif roll < 0.8:
+            phones.append("Not Available")
+            address = f"{address} · {number}"
+        else:
+            phones.append("Not Available")
+        if rng.random() < 0.3:
+            address = f"Open · Closes {rng.randint(5, 11)} pm · {address}"
+        addresses.append(address)
+    return pd.DataFrame({"name": names, "phone": phones, "address": addresses, "rating": "4.2",
+                         "category": rng.choice(kinds), "location": locations})
+
+def benchmark(rows):
+    """
+    Time row-by-row cleaning (clean_vendor) against clean_frame, and the
+    dedupe, over synthetic vendors.
+    """
+    df = _synthetic_frame(rows)
+    print(f"{rows:,} synthetic vendors")
+
+    start = time.perf_counter()
+    for phone, address in zip(df["phone"].tolist(), df["address"].tolist()):
+        clean_vendor(phone, address)
+    seconds = time.perf_counter() - start
+    print(f"Row by row:  {seconds:.2f}s ({rows / seconds:,.0f} rows/s)")
+
+    start = time.perf_counter()
+    cleaned = clean_frame(df.copy())
+    seconds = time.perf_counter() - start
+    print(f"Vectorized:  {seconds:.2f}s ({rows / seconds:,.0f} rows/s)")
+
+    start = time.perf_counter()
+    deduped, dropped = dedupe_frame(cleaned)
+    seconds = time.perf_counter() - start
+    print(f"Dedupe:      {seconds:.2f}s ({rows / seconds:,.0f} rows/s), {dropped:,} duplicates dropped")
+
 if __name__ == "__main__":
-    # Test with the existing file if running standalone
-    test_file = "vendors_Halls_Shimoga_Karnataka.json"
-    if os.path.exists(test_file):
-        print(f"Testing conversion on {test_file}...")
-        csv_path, msg = convert_json_to_csv(test_file)
-        print(f"Result: {csv_path} - {msg}")
+    parser = argparse.ArgumentParser(description="Merge vendor JSON or records files into one cleaned, deduplicated file.")
+    parser.add_argument("files", nargs="*",
+                        help=f"JSON or records files or globs (default: {' '.join(DEFAULT_PATTERNS)})")
+    parser.add_argument("--from-db", action="store_true", help="Read the vendors table instead of JSON files")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Output .csv or .parquet file")
+    parser.add_argument("--workers", type=int, help="Processes loading files (default: one per CPU)")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS",
+                        help="Time the cleaning over ROWS synthetic vendors instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        paths = [path for pattern in args.files for path in sorted(glob.glob(pattern))]
+        if args.files and not paths:
+            parser.error("no files match")
+        output, message = convert_many(paths, args.output, args.from_db, args.workers)
+        print(f"{output}: {message}" if output else message)
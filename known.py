@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import math
+import os
+import sqlite3
+from array import array
+from bisect import bisect_left
+import database
+import normalize
+
+# Known-vendor index
+# A re-scrape of a pair mostly scrolls past vendors we already hold. Before a
+# scrape, the pair's stored names are loaded into a KnownIndex: a sorted array
+# of 64-bit name hashes (8 bytes a vendor, no false positives in practice).
+# EarlyStop watches the cards as the scraper extracts them and tells it to
+# stop scrolling once KNOWN_RUN_TO_STOP cards in a row were all known, then
+# estimates how many result pages and seconds that saved.
+
+# Consecutive known cards after which a scrape stops scrolling (0: never stop early)
+KNOWN_RUN_TO_STOP = int(os.environ.get("KNOWN_RUN_TO_STOP", "20"))
+
+
+def vendor_key(name):
+    """
+    64-bit hash of a vendor name, ignoring case and runs of whitespace.
+    """
+    return int.from_bytes(hashlib.blake2b(normalize.name_key(name).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class KnownIndex:
+    """
+    Membership test for vendor names: `name in index`.
+    """
+    def __init__(self, keys=()):
+        self._keys = array("Q", sorted(set(keys)))
+
+    @classmethod
+    def from_names(cls, names):
+        return cls(vendor_key(name) for name in names if name)
+
+    @classmethod
+    def from_bytes(cls, data):
+        index = cls()
+        index._keys.frombytes(data)
+        return index
+
+    def to_bytes(self):
+        return self._keys.tobytes()
+
+    def to_text(self):
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_text(cls, text):
+        return cls.from_bytes(base64.b64decode(text or ""))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, name):
+        key = vendor_key(name)
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+
+def load(category, location):
+    """
+    KnownIndex of the vendors stored for a category/location pair.
+    """
+    conn = sqlite3.connect(database.DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT name FROM vendors WHERE category = ? AND location = ?", (category, location))
+    index = KnownIndex.from_names(name for (name,) in c.fetchall())
+    conn.close()
+    return index
+
+
+class EarlyStop:
+    """
+    Tracks a scrape against a KnownIndex. The scraper calls see(name) for
+    every new card and page(seconds) after every results page (one scroll
+    round), and stops scrolling when `done`.
+    """
+    def __init__(self, index, stop_after=KNOWN_RUN_TO_STOP):
+        self.index = index
+        self.stop_after = stop_after
+        self.run = 0
+        self.seen = 0
+        self.known = 0
+        self.pages = 0
+        self.page_seconds = 0.0
+        self.stopped = False
+        self.saved_pages = 0
+        self.saved_seconds = 0.0
+
+    def see(self, name):
+        known = name in self.index
+        self.seen += 1
+        self.known += known
+        self.run = self.run + 1 if known else 0
+        return known
+
+    def page(self, seconds):
+        self.pages += 1
+        self.page_seconds += seconds
+
+    @property
+    def done(self):
+        return bool(self.stop_after) and self.run >= self.stop_after
+
+    def stop(self, target_count):
+        """
+        Record that the scraper stopped early with `target_count` cards
+        wanted. The pages saved are the known vendors not yet seen (the most
+        the scroll could still have turned up, capped by the target), at the
+        cards per page and seconds per page of this scrape.
+        """
+        self.stopped = True
+        remaining = min(target_count - self.seen, len(self.index) - self.known)
+        cards_per_page = self.seen / self.pages if self.pages else 0
+        if remaining > 0 and cards_per_page:
+            self.saved_pages = math.ceil(remaining / cards_per_page)
+            self.saved_seconds = self.saved_pages * self.page_seconds / self.pages
+        return self.summary()
+
+    def summary(self):
+        if not self.stopped:
+            return None
+        return (f"stopped after {self.run} known vendors in a row, saving ~{self.saved_pages} pages "
+                f"(~{self.saved_seconds:.0f}s)")
@@ -1,18 +1,34 @@
 import argparse
-import json
-import time
-import random
-import re
 import sys
+import time
+import browsers
+import normalize
+import pacing
+import pagestate
+import timings
 from playwright.sync_api import sync_playwright
 
-def scrape_google_maps(category, location, target_count=50):
+MAPS_URL = "https://www.google.com/maps"
+
+def scrape_google_maps(category, location, target_count=50, early_stop=None, base_url=MAPS_URL, pacer=None,
+                       profile=None, metrics=None):
+    """
+    Scrape the Google Maps results feed. early_stop (a known.EarlyStop) ends
+    the scroll once a run of loaded results are all vendors we already have.
+    base_url and pacer (instead of the shared Google Maps pacer) let
+    scraper_bench.py run it against the local fixture site; profile
+    overrides the source's browser profile (see browsers.py). metrics (a
+    timings.RunMetrics) receives the time spent in each phase.
+    """
     data = []
+    # Waits between actions adapt to how Google Maps is responding
+    pacer = pacer or pacing.get_pacer("google_maps")
+    metrics = metrics or timings.RunMetrics("scrape", "google_maps", category, location)
     
     with sync_playwright() as p:
-        # Launch browser (Headful is safer for Maps)
-        browser = p.chromium.launch(
-            headless=False,
+        # Launch browser (the desktop profile, headful, is safer for Maps)
+        browser, context = browsers.launch(
+            p, "google_maps", profile=profile,
             args=[
                 "--disable-blink-features=AutomationControlled",
                 "--no-sandbox",
@@ -22,12 +38,10 @@ def scrape_google_maps(category, location, target_count=50):
                 "--ignore-certificate-errors",
                 "--ignore-certificate-errors-spki-list",
                 "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
-            ]
+            ],
+            # Stealth scripts
+            init_scripts=["Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"]
         )
-        context = browser.new_context(viewport={"width": 1366, "height": 768})
-        
-        # Stealth scripts
-        context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         
         page = context.new_page()
         
@@ -36,15 +50,21 @@ def scrape_google_maps(category, location, target_count=50):
             search_query = f"{category} in {location}"
             print(f"Navigating to Google Maps for: {search_query}")
             
-            page.goto(f"https://www.google.com/maps/search/{search_query}", timeout=60000)
+            with metrics.span("navigate"), pacer.timed():
+                page.goto(f"{base_url}/search/{search_query}", timeout=60000)
             
             # 2. Wait for Feed
             print("Waiting for results feed...")
-            try:
-                # The feed is usually a div with role='feed'
-                page.wait_for_selector("div[role='feed']", timeout=15000)
+            # The feed is usually a div with role='feed'; consent walls are dismissed,
+            # CAPTCHA pages raise pagestate.BlockedError
+            with metrics.span("wait_results"):
+                state = pagestate.wait_for_state(page, "google_maps", timeout=15, pacer=pacer)
+            if state == pagestate.EMPTY:
+                print("Google Maps found nothing for this search.")
+                return data
+            if state == pagestate.RESULTS:
                 print("Feed found.")
-            except:
+            else:
                 print("Feed not found immediately. Checking if valid results exist...")
                 if "maps/search" not in page.url:
                     print(f"Redirected unexpectedly to: {page.url}")
@@ -59,6 +79,8 @@ def scrape_google_maps(category, location, target_count=50):
             max_scroll_attempts = 30
             
             while len(data) < target_count and scroll_attempts < max_scroll_attempts:
+                page_started = time.monotonic()
+                metrics.count("scrolls")
                 # Count items currently in DOM
                 items = page.locator(f"{feed_selector} > div > div[role='article']").all()
                 count = len(items)
@@ -67,21 +89,29 @@ def scrape_google_maps(category, location, target_count=50):
                 
                 if count >= target_count:
                     print("Reached target count in DOM.")
+                    metrics.record("scroll", time.monotonic() - page_started)
                     break
                 
                 if count == previous_count:
+                    # Stop at once if a challenge replaced the results
+                    pagestate.check(page, "google_maps", pacer)
                     scroll_attempts += 1
                     print(f"  - No new items loaded. Attempt {scroll_attempts}/{max_scroll_attempts}")
                 else:
+                    if early_stop:
+                        for item in items[previous_count:count]:
+                            early_stop.see(item.get_attribute("aria-label") or "")
                     previous_count = count
                     scroll_attempts = 0
+                    # New results after a scroll: the site is keeping up
+                    pacer.ok()
                 
                 # Scroll the FEED, not the window
                 # We hover over the feed and wheel
                 try:
                     page.hover(feed_selector)
                     page.mouse.wheel(0, 2000)
-                    time.sleep(2)
+                    pacer.wait("settle")
                     
                     # Explicitly scroll to the last element found to trigger loading
                     if items:
@@ -89,23 +119,34 @@ def scrape_google_maps(category, location, target_count=50):
                         
                     # End key fallback
                     page.keyboard.press("End")
-                    time.sleep(1)
+                    pacer.wait("click")
                 except Exception as e:
                     print(f"Scroll error: {e}")
                 
                 # Check for "You've reached the end of the list" text
                 if page.get_by_text("You've reached the end of the list").is_visible():
                     print("Reached end of list.")
+                    metrics.record("scroll", time.monotonic() - page_started)
                     break
                 
-                time.sleep(random.uniform(2, 4))
+                pacer.wait("page")
+                metrics.record("scroll", time.monotonic() - page_started)
+
+                if early_stop:
+                    early_stop.page(time.monotonic() - page_started)
+                    if early_stop.done:
+                        # Everything further down was seen by an earlier run
+                        print(f"Early stop: {early_stop.stop(target_count)}.")
+                        break
             
             # 4. Extract Data
             print("Extracting data from loaded items...")
+            extract_started = time.monotonic()
             
             # Re-fetch items to get fresh handles
             items = page.locator(f"{feed_selector} > div > div[role='article']").all()
             print(f"Found {len(items)} items to process.")
+            metrics.count("cards_seen", len(items))
             
             for item in items:
                 try:
@@ -145,10 +186,7 @@ def scrape_google_maps(category, location, target_count=50):
                             break
                             
                     # Phone extraction from text regex
-                    phone = "Not Available"
-                    phone_match = re.search(r"(\+91[\-\s]?)?[6-9]\d{4}[\-\s]?\d{5}", text_content)
-                    if phone_match:
-                        phone = phone_match.group(0)
+                    phone = normalize.find_phone(text_content) or "Not Available"
 
                     snippet = f"{name} - {category} in {location}"
                     
@@ -160,17 +198,26 @@ def scrape_google_maps(category, location, target_count=50):
                         "snippet": snippet
                     })
                     print(f"    + Extracted: {name}")
+                    metrics.count("vendors")
                     
                 except Exception as e:
                     # print(f"Error parsing item: {e}")
+                    metrics.count("extract_errors")
                     continue
+            metrics.record("extract", time.monotonic() - extract_started)
             
             # Save debug screenshot
             page.screenshot(path="maps_debug.png")
             
+        except pagestate.BlockedError as e:
+            print(f"Blocked: {e}", file=sys.stderr)
+            page.screenshot(path="maps_error.png")
+            raise
         except Exception as e:
             print(f"Scraper error: {e}", file=sys.stderr)
             page.screenshot(path="maps_error.png")
+        finally:
+            pacer.save()
             
         browser.close()
         
@@ -180,18 +227,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--category", required=True)
     parser.add_argument("--location", required=True)
+    parser.add_argument("--format", choices=["json", "records"], default="json",
+                        help="Save a JSON file (default) or a compact records file (see records.py)")
     args = parser.parse_args()
     
     print(f"Starting Google Maps scraper for {args.category} in {args.location}")
     
-    results = scrape_google_maps(args.category, args.location)
-    
-    # Save to JSON
-    sanitized_category = args.category.replace(' ', '_')
-    sanitized_location = args.location.replace(' ', '_').replace(',', '').replace('/', '_')
-    filename = f"vendors_{sanitized_category}_{sanitized_location}.json"
+    try:
+        results = scrape_google_maps(args.category, args.location)
+    except pagestate.BlockedError:
+        sys.exit(1)
     
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump({"category": args.category, "location": args.location, "vendors": results}, f, indent=2)
+    # Save to JSON or a records file
+    import pipeline
+    save = pipeline.save_records if args.format == "records" else pipeline.save_json
+    filename = save(args.category, args.location, results)
         
     print(f"Successfully scraped {len(results)} vendors. Saved to {filename}")
@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# Text normalisation
+# The patterns every scraper, the enrichment agent, the JSON converter and the
+# database use to pull phone numbers, addresses, names and ratings out of
+# scraped text, compiled once. Most have a scalar function and a batch one
+# (lists, or pandas string Series for json_to_csv). The *_PATTERN strings are
+# accepted by both Python's re and RE2 (no lookarounds or \u escapes), so
+# pandas can run them in pyarrow's regex engine. normalize_corpus.json holds
+# the cases every function must agree on (checked by running python
+# normalize.py).
+
+# Mobile: (+91 / 91 / 0) 6-9xxxxxxxxx, as one run or split 5+5 like the Maps
+# feed ("+91 98442 82504", "073386 66555")
+MOBILE_PATTERN = r"(?:\+?91[\-\s]?|\b0?)[6-9]\d{4}[\-\s]?\d{5}\b"
+# Landline: 0 + STD code (2-4 more digits) + number (6-8 digits), e.g. 08182 222222
+LANDLINE_PATTERN = r"\b0\d{2,4}[\-\s]?\d{6,8}\b"
+# "Open · Closes 5 pm · " prefix that Maps puts in front of addresses
+OPENING_HOURS_PATTERN = r"Open.*Closes.*?[APap][Mm].*?(?:·|\.)\s*"
+# Leading/trailing separators like '·' or ',' or '-'
+EDGE_PATTERN = r"^[\s·,\-]+|[\s·,\-]+$"
+PINCODE_PATTERN = r"\b\d{6}\b"
+
+MOBILE_RE = re.compile(MOBILE_PATTERN)
+LANDLINE_RE = re.compile(LANDLINE_PATTERN)
+OPENING_HOURS_RE = re.compile(OPENING_HOURS_PATTERN)
+EDGE_RE = re.compile(EDGE_PATTERN)
+PINCODE_RE = re.compile(PINCODE_PATTERN)
+# First run of digits that could be a phone number, allowing the separators
+# Justdial and Maps put between groups ("+91 98442 82504", "073386 66555")
+PHONE_CANDIDATE_RE = re.compile(r"\+?\d[\d\s\-()]{8,}\d")
+NON_DIGIT_RE = re.compile(r"\D+")
+RATING_RE = re.compile(r"\d+(?:\.\d+)?")
+
+# Justdial navigation and category tiles that look like result cards
+BLACKLIST_NAMES = [
+    "Wedding Requisites", "Beauty & Spa", "Repairs & Services", "Daily Needs",
+    "Bills & Recharge", "Travel Bookings", "Trending Searches", "Explore Top Tourist Places",
+    "Popular Searches", "Cool Day Essentials", "Follow us on", "One-Stop for All Local Businesses",
+    "JD Mart", "Advertise", "Free Listing", "Login / Sign Up", "Recent Activity", "Seasonal"
+]
+# One alternation of the lowercased entries: a single scan of the lowercased
+# name for all of them (about twice as fast as re.IGNORECASE)
+BLACKLIST_RE = re.compile("|".join(re.escape(b.lower()) for b in BLACKLIST_NAMES))
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "normalize_corpus.json")
+
+
+# Phones
+
+def find_phone_match(text):
+    """
+    re.Match of the phone number in free text: the first mobile number,
+    else the first landline. None if there is neither.
+    """
+    if not text:
+        return None
+    return MOBILE_RE.search(text) or LANDLINE_RE.search(text)
+
+def find_phone(text):
+    """
+    Phone number as written in free text (see find_phone_match), or None.
+    """
+    match = find_phone_match(text)
+    return match.group(0) if match else None
+
+def normalize_phone(phone):
+    """
+    Canonical E.164 form of an Indian phone number ("+919844282504"),
+    or None for placeholders and text that does not hold a valid number.
+    """
+    if not phone:
+        return None
+    match = PHONE_CANDIDATE_RE.search(phone)
+    if not match:
+        return None
+    digits = NON_DIGIT_RE.sub("", match.group(0))
+    if len(digits) == 12 and digits.startswith("91"):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith("0"):
+        # STD-prefixed landline or mobile with trunk prefix
+        digits = digits[1:]
+    if len(digits) != 10 or digits[0] == "0":
+        return None
+    return "+91" + digits
+
+def find_phones(texts):
+    return [find_phone(text) for text in texts]
+
+def normalize_phones(phones):
+    """
+    normalize_phone over a list. A page of vendors repeats the same
+    placeholder (and often the same number), so each distinct value is
+    normalised once.
+    """
+    cache = {}
+    result = []
+    for phone in phones:
+        if phone not in cache:
+            cache[phone] = normalize_phone(phone)
+        result.append(cache[phone])
+    return result
+
+
+# Addresses
+
+def clean_address(address):
+    """
+    Address without the opening-hours prefix and stray separators.
+    """
+    if not address:
+        return address
+    address = OPENING_HOURS_RE.sub("", address.strip()).strip()
+    return EDGE_RE.sub("", address).strip()
+
+def split_phone(address):
+    """
+    Take the phone number out of an address: returns (cleaned_address, phone),
+    phone None if the address holds none. The address is cleaned either way.
+    """
+    if not address:
+        return address, None
+    match = find_phone_match(address)
+    if not match:
+        return clean_address(address), None
+    return clean_address(address[:match.start()] + address[match.end():]), match.group(0)
+
+def has_opening_hours(address):
+    return bool(address) and "Open" in address and "Closes" in address
+
+def has_pincode(text):
+    return bool(text) and PINCODE_RE.search(text) is not None
+
+def clean_address_series(addresses):
+    """
+    clean_address over a pandas string Series.
+    """
+    return (addresses.str.strip()
+            .str.replace(OPENING_HOURS_PATTERN, "", regex=True).str.strip()
+            .str.replace(EDGE_PATTERN, "", regex=True).str.strip())
+
+def split_phone_series(addresses):
+    """
+    split_phone over a pandas string Series without missing values:
+    returns (cleaned_addresses, phones), phones NaN where there is none.
+    """
+    # Mobile numbers win over landlines, as in find_phone_match
+    has_mobile = addresses.str.contains(MOBILE_PATTERN, regex=True)
+    has_landline = ~has_mobile & addresses.str.contains(LANDLINE_PATTERN, regex=True)
+    phones = addresses.where(has_mobile | has_landline)
+    rest = addresses.copy()
+    for mask, pattern in [(has_mobile, MOBILE_PATTERN), (has_landline, LANDLINE_PATTERN)]:
+        if mask.any():
+            matched = addresses[mask]
+            # The first match (str.extract has no RE2 fast path)
+            phones[mask] = matched.str.replace(f"(?s)^.*?({pattern}).*$", r"\1", regex=True)
+            rest[mask] = matched.str.replace(pattern, "", n=1, regex=True)
+    return clean_address_series(rest), phones
+
+def opening_hours_series(addresses):
+    """
+    has_opening_hours over a pandas string Series.
+    """
+    return addresses.str.contains("Open", regex=False) & addresses.str.contains("Closes", regex=False)
+
+
+# Names
+
+def clean_name(name):
+    """
+    Vendor name from a card's text: its first line, stripped.
+    """
+    return (name or "").split("\n")[0].strip()
+
+def name_key(name):
+    """
+    Name compared ignoring case and runs of whitespace.
+    """
+    return " ".join(str(name).casefold().split())
+
+def name_key_series(names):
+    """
+    name_key over a pandas Series; missing names key as "".
+    """
+    return (names.fillna("").astype(str).str.casefold()
+            .str.replace(r"\s+", " ", regex=True).str.strip())
+
+def is_blacklisted(name):
+    """
+    True for Justdial tiles (BLACKLIST_NAMES, anywhere in the name, any case).
+    """
+    return bool(name) and BLACKLIST_RE.search(name.lower()) is not None
+
+def blacklisted(names):
+    search = BLACKLIST_RE.search
+    return [bool(name) and search(name.lower()) is not None for name in names]
+
+
+# Ratings
+
+def parse_rating(rating):
+    """
+    Numeric rating on the 0-5 scale, or None for "N/A" and unparseable text.
+    """
+    if rating is None:
+        return None
+    if isinstance(rating, (int, float)):
+        value = float(rating)
+    else:
+        match = RATING_RE.search(rating)
+        if not match:
+            return None
+        value = float(match.group(0))
+    return value if 0 <= value <= 5 else None
+
+
+# Corpus check and benchmark
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def check(corpus):
+    """
+    Run every function over the corpus. Returns a list of failure messages.
+    """
+    failures = []
+
+    def expect(what, got, wanted):
+        if got != wanted:
+            failures.append(f"{what}: got {got!r}, expected {wanted!r}")
+
+    for case in corpus["phones"]:
+        expect(f"find_phone({case['text']!r})", find_phone(case["text"]), case["phone"])
+        expect(f"normalize_phone({case['text']!r})", normalize_phone(find_phone(case["text"])), case["e164"])
+    for case in corpus["addresses"]:
+        expect(f"split_phone({case['address']!r})", list(split_phone(case["address"])),
+               [case["clean"], case["phone"]])
+    for case in corpus["names"]:
+        expect(f"clean_name({case['raw']!r})", clean_name(case["raw"]), case["name"])
+        expect(f"is_blacklisted({case['raw']!r})", is_blacklisted(clean_name(case["raw"])), case["blacklisted"])
+    for case in corpus["ratings"]:
+        expect(f"parse_rating({case['rating']!r})", parse_rating(case["rating"]), case["value"])
+    for case in corpus["name_keys"]:
+        expect(f"name_key({case['name']!r})", name_key(case["name"]), case["key"])
+    # The JSON converter's cleaning, built on split_phone
+    import json_to_csv
+    for case in corpus["vendors"]:
+        expect(f"clean_vendor({case['phone']!r}, {case['address']!r})",
+               list(json_to_csv.clean_vendor(case["phone"], case["address"])),
+               [case["clean_phone"], case["clean_address"]])
+
+    try:
+        import pandas as pd
+    except ImportError:
+        return failures
+    addresses = [case["address"] for case in corpus["addresses"]]
+    cleaned, phones = split_phone_series(pd.Series(addresses, dtype="string"))
+    for address, clean, phone in zip(addresses, cleaned, phones):
+        expect(f"split_phone_series({address!r})", [clean, None if pd.isna(phone) else phone],
+               list(split_phone(address)))
+    names = [case["name"] for case in corpus["name_keys"]]
+    for name, key in zip(names, name_key_series(pd.Series(names, dtype="string"))):
+        expect(f"name_key_series({name!r})", key, name_key(name))
+    vendors = json_to_csv.clean_frame(pd.DataFrame(corpus["vendors"], columns=["phone", "address"]))
+    for case, phone, address in zip(corpus["vendors"], vendors["phone"], vendors["address"]):
+        expect(f"clean_frame({case['phone']!r}, {case['address']!r})", [phone, address],
+               [case["clean_phone"], case["clean_address"]])
+    return failures
+
+def benchmark(rows, corpus):
+    """
+    Time the scalar and batch functions over the corpus repeated to `rows`
+    texts, against the per-call patterns and per-entry blacklist scan the
+    scrapers used before.
+    """
+    texts = [case["text"] for case in corpus["phones"]]
+    texts = (texts * (rows // len(texts) + 1))[:rows]
+    names = [clean_name(case["raw"]) for case in corpus["names"]]
+    names = (names * (rows // len(names) + 1))[:rows]
+    print(f"{rows:,} texts and names")
+
+    def timed(label, func):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        print(f"  {label:<34} {seconds:6.2f}s ({rows / seconds:,.0f}/s)")
+
+    def old_find_phone(text):
+        match = re.search(r"(\+91[\-\s]?)?[6-9]\d{9}", text) or re.search(r"\b0\d{2,4}[\-\s]?\d{6,8}\b", text)
+        return match.group(0) if match else None
+
+    timed("phone, pattern per call (old)", lambda: [old_find_phone(text) for text in texts])
+    timed("find_phones", lambda: find_phones(texts))
+    phones = find_phones(texts)
+    timed("normalize_phone per value", lambda: [normalize_phone(phone) for phone in phones])
+    timed("normalize_phones (repeats cached)", lambda: normalize_phones(phones))
+    timed("blacklist, scan per entry (old)",
+          lambda: [any(b.lower() in name.lower() for b in BLACKLIST_NAMES) for name in names])
+    timed("blacklisted", lambda: blacklisted(names))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the normalisers against the shared corpus, or time them.")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS", help="Time the normalisers over ROWS texts")
+    parser.add_argument("--corpus", default=CORPUS_FILE)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if args.benchmark:
+        benchmark(args.benchmark, corpus)
+    else:
+        failures = check(corpus)
+        for failure in failures:
+            print(failure)
+        cases = sum(len(cases) for cases in corpus.values())
+        print(f"{len(failures)} corpus checks failed" if failures else f"All {cases} corpus cases pass")
+        sys.exit(1 if failures else 0)
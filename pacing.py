@@ -0,0 +1,186 @@
+import argparse
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import database
+
+# Adaptive request pacing
+# Every wait a scraper makes between actions is BASE_DELAYS[kind] x the
+# source's pace, with some jitter. The pace follows AIMD on the request rate
+# (1 / pace): each healthy response (fast page load, new results after a
+# scroll) adds ADDITIVE_STEP to the rate, so scrapers speed up while the site
+# copes; a slow response or an error cuts the rate by DECREASE_FACTOR, and a
+# CAPTCHA or block page drops straight to MAX_PACE. One Pacer per source is
+# shared by the threads of a process, and the learned pace is stored in the
+# source_health table, so the next scrape starts where the last one ended.
+
+# Seconds per kind of wait at pace 1.0 (the fixed sleeps the scrapers used to have)
+BASE_DELAYS = {
+    "step": 0.55,   # between mouse wheel steps
+    "load": 4.0,    # for Justdial to append results after a scroll
+    "settle": 2.0,  # for the Maps feed to react to a scroll
+    "page": 3.0,    # between Maps page loads and enrichment searches
+    "click": 1.0,   # after typing, clicking or jiggling the page
+}
+MIN_PACE = 0.25
+MAX_PACE = 4.0
+ADDITIVE_STEP = 0.02
+DECREASE_FACTOR = 0.7
+# Page loads slower than this (seconds) count as a congestion signal
+LATENCY_TARGETS = {"justdial": 8.0, "google_maps": 8.0}
+DEFAULT_LATENCY_TARGET = 8.0
+# Weight of the newest sample in the latency moving average
+LATENCY_SMOOTHING = 0.3
+# Each wait is scaled by a random factor within +/- JITTER
+JITTER = 0.25
+# Seconds between writes of the pacing state to the database
+SAVE_INTERVAL = 30
+
+COLUMNS = ["source", "pace", "latency", "speedups", "slowdowns", "last_decision", "updated_at"]
+
+
+class Pacer:
+    """
+    AIMD pace for one source. Scrapers call wait(kind) instead of sleeping,
+    and report what they observe with ok(latency), error(reason) and
+    blocked(); timed() wraps a page load and reports it either way.
+    """
+    def __init__(self, source, pace=1.0, latency=None, speedups=0, slowdowns=0, last_decision=None):
+        self.source = source
+        self.pace = pace
+        self.latency = latency
+        self.speedups = speedups
+        self.slowdowns = slowdowns
+        self.last_decision = last_decision
+        self.target = LATENCY_TARGETS.get(source, DEFAULT_LATENCY_TARGET)
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+
+    def delay(self, kind):
+        return BASE_DELAYS[kind] * self.pace * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def wait(self, kind):
+        seconds = self.delay(kind)
+        time.sleep(seconds)
+        return seconds
+
+    def _set_pace(self, pace, decision):
+        old = self.pace
+        self.pace = min(MAX_PACE, max(MIN_PACE, pace))
+        if self.pace < old:
+            self.speedups += 1
+        elif self.pace > old:
+            self.slowdowns += 1
+            print(f"Pacing {self.source}: {decision}, slowing to {self.pace:.2f}x.")
+        self.last_decision = decision
+        if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self._save()
+
+    def ok(self, latency=None):
+        with self._lock:
+            if latency is not None:
+                self.latency = latency if self.latency is None else \
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+                if latency > self.target:
+                    self._set_pace(self.pace / DECREASE_FACTOR, f"slow response ({latency:.1f}s)")
+                    return
+            self._set_pace(1 / (1 / self.pace + ADDITIVE_STEP), "healthy")
+
+    def error(self, reason="error"):
+        with self._lock:
+            self._set_pace(self.pace / DECREASE_FACTOR, reason)
+
+    def blocked(self, page_state="blocked"):
+        with self._lock:
+            self._set_pace(MAX_PACE, f"{page_state} page")
+            self._save()
+
+    @contextmanager
+    def timed(self):
+        """
+        Time the block as one response: ok(latency) if it completes,
+        error() if it raises.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.error(f"{type(e).__name__}")
+            raise
+        self.ok(time.monotonic() - started)
+
+    def _save(self):
+        self._saved_at = time.monotonic()
+        try:
+            conn = sqlite3.connect(database.DB_NAME, timeout=30)
+            conn.execute('''INSERT INTO source_health (source, pace, latency, speedups, slowdowns,
+                                                       last_decision, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(source) DO UPDATE SET pace = excluded.pace, latency = excluded.latency,
+                                speedups = excluded.speedups, slowdowns = excluded.slowdowns,
+                                last_decision = excluded.last_decision, updated_at = excluded.updated_at''',
+                         (self.source, self.pace, self.latency, self.speedups, self.slowdowns,
+                          self.last_decision, database._now()))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            # Pacing still works from memory; the next save may get through
+            print(f"Could not save pacing for {self.source}: {e}")
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+
+_pacers = {}
+_pacers_lock = threading.Lock()
+
+
+def get_pacer(source):
+    """
+    The process-wide Pacer for `source`, resumed from the database on first use.
+    """
+    with _pacers_lock:
+        if source not in _pacers:
+            row = None
+            try:
+                database.init_db()
+                conn = sqlite3.connect(database.DB_NAME, timeout=30)
+                c = conn.cursor()
+                c.execute('''SELECT pace, latency, speedups, slowdowns, last_decision
+                             FROM source_health WHERE source = ?''', (source,))
+                row = c.fetchone()
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Could not load pacing for {source}: {e}")
+            _pacers[source] = Pacer(source, *row) if row else Pacer(source)
+        return _pacers[source]
+
+
+def get_metrics():
+    """
+    Stored pacing state of every source, as dicts with COLUMNS.
+    """
+    conn = sqlite3.connect(database.DB_NAME)
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(COLUMNS)} FROM source_health ORDER BY source")
+    rows = c.fetchall()
+    conn.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or reset the learned pace of each source.")
+    parser.add_argument("--reset", metavar="SOURCE", help="Start SOURCE over at pace 1.0")
+    args = parser.parse_args()
+
+    database.init_db()
+    if args.reset:
+        Pacer(args.reset, last_decision="reset").save()
+    for row in get_metrics():
+        latency = f"{row['latency']:.1f}s" if row["latency"] is not None else "-"
+        print(f"{row['source']}: pace {row['pace']:.2f}x ({BASE_DELAYS['load'] * row['pace']:.1f}s per load wait), "
+              f"latency {latency}, {row['speedups']} speed-ups, {row['slowdowns']} slow-downs, "
+              f"last: {row['last_decision'] or '-'}")
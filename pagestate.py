@@ -0,0 +1,189 @@
+import time
+
+# Page state detection
+# Classifies what a scraper's browser is looking at from one snapshot of the
+# page (URL, title, the start of the visible text and a few selector counts,
+# taken in a single evaluate call), so a scraper can tell a results page from
+# an empty search, a consent wall, a CAPTCHA or a block page as soon as the
+# page loads, instead of waiting out every selector timeout.
+
+RESULTS = "results"
+EMPTY = "empty"
+CONSENT = "consent"
+CAPTCHA = "captcha"
+BLOCKED = "blocked"
+UNKNOWN = "unknown"
+
+# States in which scraping cannot continue
+BLOCKING_STATES = (CAPTCHA, BLOCKED)
+
+# Seconds between snapshots while waiting for a page to settle
+POLL_INTERVAL = 0.25
+# Characters of visible text matched against the text markers
+TEXT_SAMPLE = 4000
+
+_COMMON_CAPTCHA_SELECTORS = ("iframe[src*='recaptcha'], iframe[src*='hcaptcha'], iframe[src*='captcha'], "
+                             ".g-recaptcha, .h-captcha, #px-captcha, #captcha, form#captcha-form, "
+                             "iframe[title*='challenge']")
+_COMMON_CAPTCHA_TEXT = ["verify you are human", "i'm not a robot", "are you a robot", "press & hold",
+                        "complete the security check", "unusual traffic"]
+_COMMON_BLOCKED_TEXT = ["access denied", "you don't have permission to access", "request blocked",
+                        "403 forbidden", "too many requests", "your ip has been blocked"]
+
+SIGNATURES = {
+    "justdial": {
+        "results": "div.result-box, li.cntanr, div.store-details, .resultbox_title_anchor, h2.store-name",
+        "captcha": _COMMON_CAPTCHA_SELECTORS,
+        "consent": "",
+        "captcha_urls": ["/captcha", "validate.perfdrive.com"],
+        "consent_urls": [],
+        "captcha_text": _COMMON_CAPTCHA_TEXT,
+        # Akamai's block page reads "Access Denied ... Reference #18.xxxx"
+        "blocked_text": _COMMON_BLOCKED_TEXT + ["reference #"],
+        "consent_text": [],
+        "empty_text": ["no results found", "no listing found", "we couldn't find", "did not match any"],
+    },
+    "google_maps": {
+        "results": "div[role='feed'] div[role='article'], div[role='main'] h1",
+        "captcha": _COMMON_CAPTCHA_SELECTORS,
+        "consent": "form[action*='consent.google']",
+        "captcha_urls": ["google.com/sorry/"],
+        "consent_urls": ["consent.google."],
+        "captcha_text": _COMMON_CAPTCHA_TEXT,
+        "blocked_text": _COMMON_BLOCKED_TEXT,
+        "consent_text": ["before you continue to google"],
+        "empty_text": ["google maps can't find", "make sure your search is spelled correctly"],
+    },
+}
+
+# Buttons that dismiss a consent wall, tried in order
+CONSENT_BUTTONS = ["button:has-text('Reject all')", "button:has-text('Accept all')",
+                   "button:has-text('I agree')", "form[action*='consent'] button"]
+
+_SNAPSHOT_JS = """(sel) => {
+    const count = (s) => s ? document.querySelectorAll(s).length : 0;
+    return {
+        url: location.href,
+        title: document.title || "",
+        text: (document.body ? document.body.innerText : "").slice(0, sel.sample).toLowerCase(),
+        results: count(sel.results),
+        captcha: count(sel.captcha),
+        consent: count(sel.consent),
+    };
+}"""
+
+
+class BlockedError(Exception):
+    """
+    Raised when a source answers with a CAPTCHA or block page. state is
+    one of BLOCKING_STATES (or CONSENT for a wall that could not be
+    dismissed); source is the SIGNATURES key.
+    """
+    def __init__(self, source, state, url=""):
+        super().__init__(f"{source} returned a {state} page ({url})" if url else f"{source} returned a {state} page")
+        self.source = source
+        self.state = state
+        self.url = url
+
+
+def classify(source, snapshot):
+    """
+    State of a page from its snapshot (see snapshot()). URLs are trusted
+    first; CAPTCHA and block text only count when no results are visible,
+    since vendor names and reviews can contain anything.
+    """
+    sig = SIGNATURES[source]
+    url = snapshot.get("url", "").lower()
+    text = f"{snapshot.get('title', '')}\n{snapshot.get('text', '')}".lower()
+
+    if any(marker in url for marker in sig["captcha_urls"]):
+        return CAPTCHA
+    if any(marker in url for marker in sig["consent_urls"]):
+        return CONSENT
+    if snapshot.get("results"):
+        return RESULTS
+    if snapshot.get("captcha") or any(marker in text for marker in sig["captcha_text"]):
+        return CAPTCHA
+    if any(marker in text for marker in sig["blocked_text"]):
+        return BLOCKED
+    if snapshot.get("consent") or any(marker in text for marker in sig["consent_text"]):
+        return CONSENT
+    if any(marker in text for marker in sig["empty_text"]):
+        return EMPTY
+    return UNKNOWN
+
+
+def snapshot(page, source):
+    sig = SIGNATURES[source]
+    return page.evaluate(_SNAPSHOT_JS, {"results": sig["results"], "captcha": sig["captcha"],
+                                        "consent": sig["consent"], "sample": TEXT_SAMPLE})
+
+
+def detect(page, source):
+    try:
+        return classify(source, snapshot(page, source))
+    except Exception:
+        # Page navigating away mid-evaluate; try again on the next snapshot
+        return UNKNOWN
+
+
+def dismiss_consent(page):
+    for selector in CONSENT_BUTTONS:
+        try:
+            button = page.query_selector(selector)
+            if button and button.is_visible():
+                button.click()
+                page.wait_for_load_state("domcontentloaded")
+                return True
+        except Exception:
+            continue
+    return False
+
+
+def _blocked(page, source, state, pacer):
+    if pacer:
+        pacer.blocked(state)
+    return BlockedError(source, state, page.url)
+
+
+def check(page, source, pacer=None):
+    """
+    Classify the page now. Raises BlockedError on a CAPTCHA or block page,
+    and on a consent wall that cannot be dismissed; otherwise returns the
+    state. A pacing.Pacer passed as pacer is told about blocks.
+    """
+    state = detect(page, source)
+    if state == CONSENT:
+        if not dismiss_consent(page):
+            raise _blocked(page, source, CONSENT, pacer)
+        state = detect(page, source)
+    if state in BLOCKING_STATES:
+        raise _blocked(page, source, state, pacer)
+    return state
+
+
+def wait_for_state(page, source, timeout=20, pacer=None):
+    """
+    Snapshot the page until it shows results or an empty search (returned),
+    or a CAPTCHA/block page (BlockedError). Consent walls are dismissed once.
+    Returns UNKNOWN if nothing conclusive appears within `timeout` seconds.
+    A pacing.Pacer passed as pacer is told about blocks and timeouts.
+    """
+    deadline = time.monotonic() + timeout
+    consent_tried = False
+    while True:
+        state = detect(page, source)
+        if state == CONSENT and not consent_tried:
+            consent_tried = True
+            print("Consent page detected; dismissing it.")
+            dismiss_consent(page)
+            continue
+        if state == CONSENT or state in BLOCKING_STATES:
+            raise _blocked(page, source, state, pacer)
+        if state in (RESULTS, EMPTY):
+            return state
+        if time.monotonic() >= deadline:
+            if pacer:
+                pacer.error(f"no results within {timeout}s")
+            return state
+        time.sleep(POLL_INTERVAL)
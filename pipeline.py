@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import archive
+import database
+import known
+import maps_scraper
+import records
+import scraper_agent
+import timings
+
+# In-process scrape pipeline
+# Scrapers yield vendor dicts as they extract them; run_scrape() ingests them
+# in small batches under one scrape run, so nothing has to go through a JSON
+# file or a child process. The JSON file is still written on request, as a
+# download/debugging artifact; save_records() writes the compact records file
+# instead (see records.py).
+
+SOURCES = {
+    "justdial": scraper_agent.iter_justdial,
+    "google_maps": maps_scraper.scrape_google_maps,
+}
+
+INGEST_BATCH_SIZE = 25
+
+
+def output_json_path(category, location):
+    """
+    The vendors_<category>_<location>.json name used by the scrapers' CLIs,
+    the enrichment agent and the app.
+    """
+    sanitized_category = category.replace(' ', '_')
+    sanitized_location = location.replace(' ', '_').replace(',', '').replace('/', '_')
+    return f"vendors_{sanitized_category}_{sanitized_location}.json"
+
+
+def output_records_path(category, location):
+    # output_json_path with the records extension
+    return output_json_path(category, location)[:-len(".json")] + records.EXTENSION
+
+
+def _replace(path, tag, write):
+    tmp_path = f"{path}.{os.getpid()}.{id(tag)}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def save_json(category, location, vendors, path=None):
+    """
+    Write vendors in the scrapers' JSON format, with every field of
+    records.VendorRecord. The file is replaced atomically, so two runs for
+    the same pair never leave a mixed file.
+    """
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"category": category, "location": location,
+                       "vendors": records.to_dicts(records.from_dicts(vendors))}, f, ensure_ascii=False)
+
+    return _replace(path or output_json_path(category, location), vendors, write)
+
+
+def save_records(category, location, vendors, path=None):
+    """
+    save_json for the records format.
+    """
+    return _replace(path or output_records_path(category, location), vendors,
+                    lambda tmp_path: records.write_file(tmp_path, vendors, category, location))
+
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return records.to_dicts(records.from_dicts(json.load(f).get("vendors", [])))
+
+
+def load_vendors(path):
+    """
+    Vendor dicts of a JSON or records file.
+    """
+    if path.endswith(records.EXTENSION):
+        return records.to_dicts(records.read_file(path)[2])
+    return load_json(path)
+
+
+def run_scrape(category, location, source="justdial", run_id=None, write_json=False,
+               progress=None, should_stop=None, stop_after_known=None):
+    """
+    Scrape one category/location pair and ingest the vendors as they arrive.
+
+    progress(vendors, stats) is called after every vendor; should_stop() is
+    checked at the same points and ends the scrape early when it returns True.
+    The scraper stops scrolling after stop_after_known (default
+    known.KNOWN_RUN_TO_STOP, 0 to never stop early) known vendors in a row.
+    Returns a dict with run_id, status, message, vendors, stats, json_file,
+    early_stop (the known.EarlyStop, or None) and metrics (the run's
+    timings.RunMetrics).
+    The run is logged to scraper_logs and scrape_runs, and its timings to
+    metric_runs, whatever the outcome; scraper exceptions are re-raised
+    after logging.
+    """
+    run_id = run_id or database.start_scrape_run(category, location, source)
+    vendors = []
+    batch = []
+    stats = {"seen": 0, "new": 0, "changed": 0, "repeated": 0}
+    status = "Success"
+    metrics = timings.RunMetrics("scrape", source, category, location)
+    # The pair's stored vendors, read by the first batch and reused by the rest
+    pair = database.PairRows()
+
+    def flush():
+        with metrics.span("ingest"):
+            batch_stats = database.ingest_vendors(run_id, batch, category, location, pair)
+        for key in stats:
+            stats[key] += batch_stats[key]
+        batch.clear()
+
+    stop_after_known = known.KNOWN_RUN_TO_STOP if stop_after_known is None else stop_after_known
+    index = known.load(category, location) if stop_after_known else None
+    # Nothing to recognise on a first scrape of the pair
+    early_stop = known.EarlyStop(index, stop_after_known) if index else None
+
+    scraped = iter(SOURCES[source](category, location, early_stop=early_stop, metrics=metrics))
+    try:
+        for vendor in scraped:
+            vendors.append(vendor)
+            batch.append(vendor)
+            if len(batch) >= INGEST_BATCH_SIZE:
+                flush()
+            if progress:
+                progress(vendors, stats)
+            if should_stop and should_stop():
+                status = "Cancelled"
+                break
+        if batch:
+            flush()
+    except Exception as e:
+        # Keep what was scraped before the failure
+        if batch and not isinstance(e, sqlite3.Error):
+            flush()
+        message = str(e)[:200]
+        database.log_scraper_run(category, location, "Failed", message)
+        database.finish_scrape_run(run_id, "Failed", message)
+        metrics.save("Failed", len(vendors), run_id)
+        raise
+    finally:
+        # Stops the browser if we left the loop early
+        if hasattr(scraped, "close"):
+            scraped.close()
+
+    try:
+        archive.append_run(vendors, category, location, source=source, run_id=run_id)
+    except Exception as e:
+        # The archive is for analytics; never fail an ingest over it
+        print(f"Archiving run {run_id} failed: {e}")
+    json_file = save_json(category, location, vendors) if write_json and vendors and status == "Success" else None
+
+    message = f"Added {stats['new']} new vendors, updated {stats['changed']}"
+    if early_stop and early_stop.stopped:
+        message += f"; {early_stop.summary()}"
+        database.record_early_stop(run_id, early_stop.saved_pages, early_stop.saved_seconds)
+    database.log_scraper_run(category, location, status, message)
+    database.finish_scrape_run(run_id, status, message)
+    metrics.save(status, len(vendors), run_id)
+    print(f"Run {run_id} timings: {metrics.summary()}")
+    return {"run_id": run_id, "status": status, "message": message, "vendors": vendors, "stats": stats,
+            "json_file": json_file, "early_stop": early_stop, "metrics": metrics}
@@ -0,0 +1,215 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+from datetime import datetime, timedelta
+import database
+
+# Scrape planner
+# Instead of re-scraping every (category, location) pair every day, score each
+# pair from its history and spend the crawl budget on the pairs most likely to
+# turn up new or changed vendors:
+#   - scraper_logs: time since the last successful scrape and the failure rate
+#   - scrape_runs: new/changed vendors per run (recent runs weigh more) and how
+#     long a run takes
+#   - category_location_counts: how much of the pair we hold, and with phones
+# A pair is only due once its recheck interval has passed. That interval grows
+# as its yield drops: productive pairs are re-checked daily, pairs that keep
+# returning nothing back off towards MAX_RECHECK_HOURS.
+
+WINDOW_DAYS = 28
+# Weight of a run halves every HALF_LIFE_DAYS
+HALF_LIFE_DAYS = 7
+MIN_RECHECK_HOURS = 20
+MAX_RECHECK_HOURS = 24 * 14
+# Assumed for pairs without a successful run in the window
+NEW_PAIR_YIELD = 50
+DEFAULT_PAIR_SECONDS = 600
+# A changed field is worth this fraction of a new vendor
+CHANGED_WEIGHT = 0.5
+# Weight of the share of a pair's vendors still missing a phone
+COVERAGE_WEIGHT = 5
+# Score is capped at this many recheck intervals overdue
+MAX_OVERDUE = 3
+
+_RUN_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Categories, locations and sources to crawl; read by the scheduler and the coordinator
+MATRIX_FILE = os.environ.get("CRAWL_MATRIX", "crawl_matrix.json")
+
+
+def load_matrix(path=None):
+    """
+    Read the crawl matrix: {"categories": [...], "sources": [...]} plus
+    "locations" (["District, State", ...]) and/or "states"
+    ({"State": ["District", ...]}), which expands to "District, State".
+    Returns a dict with categories, locations and sources lists.
+    """
+    with open(path or MATRIX_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    locations = list(config.get("locations", []))
+    for state, districts in config.get("states", {}).items():
+        locations.extend(f"{district}, {state}" for district in districts)
+    matrix = {
+        "categories": list(config.get("categories", [])),
+        "locations": list(dict.fromkeys(locations)),
+        "sources": list(config.get("sources", ["justdial"])),
+    }
+    if not matrix["categories"] or not matrix["locations"]:
+        raise ValueError(f"{path or MATRIX_FILE} needs at least one category and one location")
+    return matrix
+
+
+def matrix_pairs(matrix):
+    return [(category, location) for location in matrix["locations"] for category in matrix["categories"]]
+
+
+def _parse(timestamp):
+    try:
+        return datetime.strptime(timestamp, _RUN_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_history(now=None, window_days=WINDOW_DAYS):
+    """
+    Per-pair history: {(category, location): {...}} with last_success,
+    runs, failures, weighted_yield, weight, seconds and vendors/with_phone.
+    """
+    now = now or datetime.now()
+    since = (now - timedelta(days=window_days)).strftime(_RUN_FORMAT)
+    history = {}
+
+    def entry(category, location):
+        return history.setdefault((category, location), {
+            "last_success": None, "runs": 0, "failures": 0, "weighted_yield": 0.0, "weight": 0.0,
+            "seconds": [], "vendors": 0, "with_phone": 0,
+        })
+
+    conn = sqlite3.connect(database.DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT category, location, MAX(timestamp) FROM scraper_logs WHERE status = 'Success' "
+              "GROUP BY category, location")
+    for category, location, last_success in c.fetchall():
+        entry(category, location)["last_success"] = _parse(last_success)
+    c.execute("SELECT category, location, status FROM scraper_logs WHERE timestamp >= ?", (since,))
+    for category, location, status in c.fetchall():
+        pair = entry(category, location)
+        pair["runs"] += 1
+        pair["failures"] += status not in ("Success", "Cancelled")
+
+    c.execute('''SELECT category, location, started_at, finished_at, vendors_new, vendors_changed
+                 FROM scrape_runs WHERE started_at >= ? AND status = 'Success' ''', (since,))
+    for category, location, started_at, finished_at, new, changed in c.fetchall():
+        pair = entry(category, location)
+        started, finished = _parse(started_at), _parse(finished_at)
+        if started is None:
+            continue
+        weight = 0.5 ** ((now - started).total_seconds() / 86400 / HALF_LIFE_DAYS)
+        pair["weighted_yield"] += weight * (new + CHANGED_WEIGHT * changed)
+        pair["weight"] += weight
+        if finished:
+            pair["seconds"].append((finished - started).total_seconds())
+
+    c.execute("SELECT category, location, total, with_phone FROM category_location_counts")
+    for category, location, total, with_phone in c.fetchall():
+        pair = entry(category, location)
+        pair["vendors"], pair["with_phone"] = total, with_phone
+    conn.close()
+    return history
+
+
+def score_pair(pair, now=None):
+    """
+    Score one pair's history. Returns a dict with the score (0 when the
+    pair is not due) and the numbers behind it.
+    """
+    now = now or datetime.now()
+    if pair is None or pair["weight"] == 0:
+        # No successful run in the window to judge by
+        expected = NEW_PAIR_YIELD
+    else:
+        expected = pair["weighted_yield"] / pair["weight"]
+    failure_rate = pair["failures"] / pair["runs"] if pair and pair["runs"] else 0.0
+    coverage_gap = 1 - pair["with_phone"] / pair["vendors"] if pair and pair["vendors"] else 1.0
+    seconds = (sum(pair["seconds"]) / len(pair["seconds"])) if pair and pair["seconds"] else DEFAULT_PAIR_SECONDS
+
+    # MAX_RECHECK_HOURS at zero yield, half that at one vendor per run, MIN from ~16
+    recheck_hours = min(MAX_RECHECK_HOURS, max(MIN_RECHECK_HOURS, MAX_RECHECK_HOURS / (1 + expected)))
+    last_success = pair["last_success"] if pair else None
+    hours_since = (now - last_success).total_seconds() / 3600 if last_success else math.inf
+    overdue = min(hours_since / recheck_hours, MAX_OVERDUE)
+
+    value = (expected + COVERAGE_WEIGHT * coverage_gap) * (1 - 0.75 * failure_rate)
+    return {
+        "score": value * overdue if overdue >= 1 else 0.0,
+        "expected_new": expected,
+        "failure_rate": failure_rate,
+        "coverage_gap": coverage_gap,
+        "hours_since": hours_since,
+        "recheck_hours": recheck_hours,
+        "est_seconds": seconds,
+    }
+
+
+def plan(pairs, budget_seconds=None, budget_runs=None, runs_per_pair=1, now=None):
+    """
+    Choose and order pairs to scrape. pairs is an iterable of
+    (category, location). budget_seconds caps the summed estimated scrape
+    time, budget_runs the number of scrapes; runs_per_pair is how many
+    scrapes (one per source) a pair costs. Pairs that are not due are left
+    out. Returns dicts (category, location, plus score_pair's fields),
+    most valuable per second first.
+    """
+    now = now or datetime.now()
+    history = load_history(now)
+    candidates = []
+    for category, location in pairs:
+        scored = score_pair(history.get((category, location)), now)
+        if scored["score"] > 0:
+            scored.update(category=category, location=location)
+            candidates.append(scored)
+    candidates.sort(key=lambda p: p["score"] / p["est_seconds"], reverse=True)
+
+    chosen = []
+    spent_seconds = 0.0
+    for pair in candidates:
+        cost = pair["est_seconds"] * runs_per_pair
+        if budget_runs is not None and (len(chosen) + 1) * runs_per_pair > budget_runs:
+            break
+        if budget_seconds is not None and spent_seconds + cost > budget_seconds:
+            # A cheaper pair further down may still fit
+            continue
+        chosen.append(pair)
+        spent_seconds += cost
+    return chosen
+
+
+def known_pairs():
+    conn = sqlite3.connect(database.DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT DISTINCT category, location FROM scraper_logs UNION "
+              "SELECT category, location FROM category_location_counts")
+    rows = c.fetchall()
+    conn.close()
+    return sorted(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show which scraped pairs are due and in what order.")
+    parser.add_argument("--budget-minutes", type=float, help="Total scrape time to plan for")
+    parser.add_argument("--budget-runs", type=int, help="Maximum number of scrapes")
+    args = parser.parse_args()
+
+    database.init_db()
+    pairs = known_pairs()
+    chosen = plan(pairs, budget_seconds=args.budget_minutes * 60 if args.budget_minutes else None,
+                  budget_runs=args.budget_runs)
+    print(f"{len(chosen)} of {len(pairs)} known pairs planned.")
+    for pair in chosen:
+        since = "never" if math.isinf(pair["hours_since"]) else f"{pair['hours_since']:.0f}h ago"
+        print(f"  {pair['score']:7.1f}  {pair['category']} in {pair['location']}: "
+              f"expect {pair['expected_new']:.1f} new, last success {since}, "
+              f"recheck every {pair['recheck_hours']:.0f}h, {pair['failure_rate']:.0%} failed, "
+              f"~{pair['est_seconds'] / 60:.0f} min")
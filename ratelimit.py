@@ -0,0 +1,64 @@
+import json
+import os
+
+# Per-source limits for concurrent scraping
+# Each source gets a cap on how many of its jobs may run at once and on how
+# often a new one may start, so adding workers speeds up the matrix without
+# multiplying the request rate any one site sees. The limits are checked when
+# a job is claimed (jobs.claim_job, which the coordinator's leases go through
+# too), against the running jobs in the jobs table and the last start in
+# source_health, so they hold across the app, the scheduler, `jobs.py`
+# workers and coordinator nodes together. A throttled job stays queued until
+# a worker's next poll finds its source free.
+
+DEFAULT_LIMITS = {
+    "justdial": {"concurrency": 2, "per_minute": 6},
+    "google_maps": {"concurrency": 1, "per_minute": 3},
+}
+
+
+def merge_limits(limits=None):
+    """
+    DEFAULT_LIMITS updated with `limits`, e.g. {"justdial": {"concurrency": 3}}.
+    """
+    merged = {source: dict(settings) for source, settings in DEFAULT_LIMITS.items()}
+    for source, settings in (limits or {}).items():
+        merged.setdefault(source, {}).update(settings)
+    return merged
+
+
+# Overrides from SOURCE_LIMITS (JSON, same shape as DEFAULT_LIMITS); set the
+# same value for every process that claims jobs
+LIMITS = merge_limits(json.loads(os.environ.get("SOURCE_LIMITS") or "{}"))
+
+# For claim queries on the jobs table: true while `jobs.source` has as many
+# jobs running as it may, or started one less than its interval ago. Needs
+# the `limits` table of limits_cte() and one parameter, time.time().
+THROTTLED_SQL = '''EXISTS (SELECT 1 FROM limits l WHERE l.source = jobs.source
+                           AND ((SELECT COUNT(*) FROM jobs r WHERE r.status = 'running' AND r.source = l.source)
+                                    >= l.concurrency
+                                OR (SELECT h.last_started_at FROM source_health h WHERE h.source = l.source)
+                                    > ? - l.interval))'''
+
+
+def limits_cte(limits=None):
+    """
+    (sql, params) of a WITH clause defining limits(source, concurrency,
+    interval) from `limits` (default LIMITS), for THROTTLED_SQL.
+    """
+    rows = [(source, settings.get("concurrency", 1),
+             60.0 / settings["per_minute"] if settings.get("per_minute") else 0.0)
+            for source, settings in (LIMITS if limits is None else limits).items()]
+    if not rows:
+        return "WITH limits(source, concurrency, interval) AS (SELECT NULL, 0, 0 WHERE 0)", []
+    values = ", ".join(["(?, ?, ?)"] * len(rows))
+    return f"WITH limits(source, concurrency, interval) AS (VALUES {values})", [v for row in rows for v in row]
+
+
+def record_start(c, source, started):
+    """
+    Note in source_health that a job of `source` started at `started`
+    (time.time()); run in the claiming transaction.
+    """
+    c.execute('''INSERT INTO source_health (source, last_started_at) VALUES (?, ?)
+                 ON CONFLICT(source) DO UPDATE SET last_started_at = excluded.last_started_at''', (source, started))
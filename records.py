@@ -0,0 +1,235 @@
+import argparse
+import base64
+import gc
+import json
+import pickle
+import struct
+import time
+import tracemalloc
+import zlib
+from itertools import chain, starmap
+from operator import attrgetter
+
+# Vendor records
+# Scraped vendors travel as dicts, each one a hash table repeating its keys,
+# with keys going missing depending on who built it, and every hand-off
+# (the JSON file, a coordinator node's upload, the CSV export) re-encoded
+# them as indented JSON. VendorRecord is the one typed shape: slotted, with
+# the same defaults for missing fields everywhere. dumps()/loads() give
+# them a compact binary form: a small header (magic, schema version, flags,
+# record count) and then every field of every record as UTF-8, separated by
+# ASCII unit separators, optionally zlib-compressed for storage. Field names
+# are never repeated, and both directions are one join or split. JSON stays
+# the export format (pipeline.save_json).
+#   python records.py --benchmark 100000   serialization time, size and memory per N vendors
+#   python records.py vendors.vrec         print a records file as JSON
+
+SCHEMA_VERSION = 1
+# The fields of each schema version, in encoding order. A new version may
+# only append fields; older files get the defaults of the missing ones.
+SCHEMA_FIELDS = {1: ("name", "phone", "address", "rating", "snippet")}
+FIELDS = SCHEMA_FIELDS[SCHEMA_VERSION]
+DEFAULTS = {"name": "", "phone": "Not Available", "address": "", "rating": "N/A", "snippet": ""}
+
+MAGIC = b"VREC"
+HEADER = struct.Struct(">4sBBI")
+FLAG_ZLIB = 1
+# Separates the fields; scraped text never holds it, and it is replaced if it does
+SEP = "\x1f"
+# Records file extension, next to the scrapers' .json
+EXTENSION = ".vrec"
+
+
+class VendorRecord:
+    """
+    One scraped vendor. Every field is a string; missing or empty ones
+    (None included) take DEFAULTS.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, name="", phone="Not Available", address="", rating="N/A", snippet=""):
+        self.name = name
+        self.phone = phone
+        self.address = address
+        self.rating = rating
+        self.snippet = snippet
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*[_text(data.get(field), DEFAULTS[field]) for field in FIELDS])
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def __eq__(self, other):
+        return isinstance(other, VendorRecord) and _values(self) == _values(other)
+
+    def __repr__(self):
+        return f"VendorRecord({', '.join(f'{field}={getattr(self, field)!r}' for field in FIELDS)})"
+
+
+_values = attrgetter(*FIELDS)
+
+
+def _text(value, default):
+    if value is None or value == "":
+        return default
+    return value if isinstance(value, str) else str(value)
+
+
+def from_dicts(vendors):
+    """
+    VendorRecords of vendor dicts; records passed in are kept as they are.
+    """
+    return [v if isinstance(v, VendorRecord) else VendorRecord.from_dict(v) for v in vendors]
+
+
+def to_dicts(records):
+    return [record.to_dict() for record in records]
+
+
+def dumps(records, category="", location="", compress=False):
+    """
+    Records (or vendor dicts) as bytes, with the category and location of
+    the run. compress zlib-compresses the body, for files.
+    """
+    records = from_dicts(records)
+    values = [category, location]
+    values.extend(chain.from_iterable(map(_values, records)))
+    text = SEP.join(values)
+    if text.count(SEP) != len(values) - 1:
+        text = SEP.join(value.replace(SEP, " ") for value in values)
+    body = text.encode("utf-8")
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 1)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, SCHEMA_VERSION, flags, len(records)) + body
+
+
+def loads(data):
+    """
+    (category, location, records) of dumps() output. Raises ValueError for
+    anything else, including files of a newer schema version.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("not a vendor records file")
+    magic, version, flags, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a vendor records file")
+    if version not in SCHEMA_FIELDS:
+        raise ValueError(f"vendor records schema {version} is newer than this code's {SCHEMA_VERSION}")
+    body = data[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    values = body.decode("utf-8").split(SEP)
+    fields = SCHEMA_FIELDS[version]
+    if len(values) != 2 + count * len(fields):
+        raise ValueError(f"vendor records file is truncated or corrupt ({len(values)} values for {count} records)")
+    rows = zip(*[iter(values[2:])] * len(fields))
+    if fields == FIELDS:
+        records = list(starmap(VendorRecord, rows))
+    else:
+        records = [VendorRecord(**dict(zip(fields, row))) for row in rows]
+    return values[0], values[1], records
+
+
+def to_text(records):
+    # For JSON payloads, e.g. a coordinator node's ingest batches
+    return base64.b64encode(dumps(records)).decode("ascii")
+
+
+def from_text(text):
+    return loads(base64.b64decode(text))[2]
+
+
+def write_file(path, records, category="", location=""):
+    with open(path, "wb") as f:
+        f.write(dumps(records, category, location, compress=True))
+    return path
+
+
+def read_file(path):
+    """
+    (category, location, records) of a records file.
+    """
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def _synthetic(count):
+    # Fixture-site vendors, shaped like the scrapers' output
+    import fixture_site
+
+    vendors = []
+    for i in range(count):
+        vendor = fixture_site.vendor(0, "benchmark", i)
+        vendor["phone"] = vendor["phone"] or "Not Available"
+        vendor["snippet"] = "Caterers vendor in Fixture City"
+        vendors.append(vendor)
+    return vendors
+
+
+def _allocated(build):
+    # Bytes allocated by build() that are still alive afterwards
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def benchmark(count=100000):
+    """
+    Encode and decode `count` vendors with the JSON the scrapers wrote
+    (indented), compact JSON, pickle and the records format, and compare
+    the memory of vendor dicts with VendorRecords.
+    """
+    vendors = _synthetic(count)
+    dicts, dict_bytes = _allocated(lambda: [dict(v) for v in vendors])
+    records, record_bytes = _allocated(lambda: from_dicts(vendors))
+    print(f"{count} vendors in memory (containers only, strings shared): dicts {dict_bytes / count:.0f} "
+          f"bytes each, VendorRecords {record_bytes / count:.0f} bytes each")
+
+    def json_dumps(indent):
+        return lambda: json.dumps({"category": "c", "location": "l", "vendors": to_dicts(records)},
+                                  indent=indent).encode("utf-8")
+
+    def json_loads(data):
+        return from_dicts(json.loads(data)["vendors"])
+
+    formats = [
+        ("json indent=2", json_dumps(2), json_loads),
+        ("json compact", json_dumps(None), json_loads),
+        ("pickle dicts", lambda: pickle.dumps(to_dicts(records), pickle.HIGHEST_PROTOCOL),
+         lambda data: from_dicts(pickle.loads(data))),
+        ("records", lambda: dumps(records), lambda data: loads(data)[2]),
+        ("records zlib", lambda: dumps(records, compress=True), lambda data: loads(data)[2]),
+    ]
+    print(f"{'format':<15} {'encode':>9} {'decode':>9} {'size':>10} {'bytes/vendor':>13}")
+    for label, encode, decode in formats:
+        started = time.perf_counter()
+        data = encode()
+        encoded = time.perf_counter() - started
+        started = time.perf_counter()
+        decoded = decode(data)
+        seconds = time.perf_counter() - started
+        assert decoded == records, label
+        print(f"{label:<15} {encoded * 1000:7.0f}ms {seconds * 1000:7.0f}ms {len(data) / 1e6:8.2f}MB "
+              f"{len(data) / count:13.1f}")
+    del dicts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vendor records: benchmark, or print a records file as JSON.")
+    parser.add_argument("path", nargs="?", help="A records file to print as JSON")
+    parser.add_argument("--benchmark", type=int, metavar="VENDORS", help="Benchmark serialization of N vendors")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.path:
+        category, location, records = read_file(args.path)
+        print(json.dumps({"category": category, "location": location, "vendors": to_dicts(records)}, indent=2))
+    else:
+        parser.print_help()
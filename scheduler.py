@@ -1,90 +1,75 @@
 import schedule
 import time
-import subprocess
 import os
-import json
-import sqlite3
+import archive
 import database
+import dedupe
+import jobs
+import planner
 from datetime import datetime
 from dotenv import load_dotenv
-import sys
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
-# Ideally these could be loaded from a config file or arguments
-CATEGORIES = [
-    "Catering", "Photography", "Shamiyana", "Halls",
-    "Transport", "Pandits", "Textiles"
-]
-LOCATIONS = ["Bangalore, Karnataka"]
+# Categories, locations and sources come from crawl_matrix.json (CRAWL_MATRIX
+# overrides the path); see planner.load_matrix for the format
+MATRIX = planner.load_matrix()
+CATEGORIES = MATRIX["categories"]
+LOCATIONS = MATRIX["locations"]
+# Add "google_maps" to the matrix's sources to scrape Google Maps for every pair as well
+SOURCES = MATRIX["sources"]
+
+# Scrapes running at once across all sources
+WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "3"))
+# Crawl budget per run, in scrape minutes summed over all workers (unset: no limit).
+# The planner skips pairs that are not due either way.
+BUDGET_MINUTES = float(os.environ["SCHEDULER_BUDGET_MINUTES"]) if os.environ.get("SCHEDULER_BUDGET_MINUTES") else None
+
+
+def batch_name(day=None):
+    return f"schedule-{(day or datetime.now()).strftime('%Y-%m-%d')}"
+
 
 def job():
     print(f"\n[{datetime.now()}] Starting scheduled scraping job for {LOCATIONS}...")
     
     # Initialize DB (idempotent)
     database.init_db()
-    database.init_logs_db()
-
-    for location in LOCATIONS:
-        for category in CATEGORIES:
-            print(f"[{datetime.now()}] Scraping {category} in {location}...")
-            
-            try:
-                # Construct command to run Python scraper
-                cmd = [
-                    sys.executable, "scraper_agent.py",
-                    "--category", category,
-                    "--location", location
-                ]
-                
-                # Run command
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    sanitized_category = category.replace(' ', '_')
-                    sanitized_location = location.replace(' ', '_').replace(',', '').replace('/', '_')
-                    json_file = f"vendors_{sanitized_category}_{sanitized_location}.json"
-                    
-                    if os.path.exists(json_file):
-                        try:
-                            with open(json_file, "r") as f:
-                                data = json.load(f)
-                                
-                            new_count = 0
-                            for vendor in data.get("vendors", []):
-                                added = database.add_vendor(
-                                    vendor.get("name"),
-                                    vendor.get("phone"),
-                                    vendor.get("address"),
-                                    category,
-                                    location
-                                )
-                                if added:
-                                    new_count += 1
-                                    
-                            print(f"[{datetime.now()}] Success: Added {new_count} new vendors for {category}.")
-                            database.log_scraper_run(category, location, "Success", f"Added {new_count} new vendors")
-                        except json.JSONDecodeError:
-                             print(f"[{datetime.now()}] Error: JSON decode failed for {json_file}")
-                             database.log_scraper_run(category, location, "Failed", "JSON decode failed")
-                    else:
-                        print(f"[{datetime.now()}] Warning: Output file '{json_file}' not found.")
-                        database.log_scraper_run(category, location, "Warning", "Output file not found")
-                else:
-                    print(f"[{datetime.now()}] Error running skill for {category}: {result.stderr}")
-                    database.log_scraper_run(category, location, "Failed", result.stderr[:200]) # Limit msg length
-                    
-            except FileNotFoundError:
-                print(f"[{datetime.now()}] Error: 'openclaw' command not found. Ensure it is installed and in PATH.")
-                database.log_scraper_run(category, location, "Error", "openclaw command not found")
-            except Exception as e:
-                print(f"[{datetime.now()}] Exception occurred: {e}")
-                database.log_scraper_run(category, location, "Exception", str(e))
+
+    # One batch of queued jobs per day. If the scheduler was restarted, the
+    # batch already exists and only its unfinished or expired jobs run again.
+    batch = batch_name()
+    if jobs.batch_exists(batch):
+        print(f"[{datetime.now()}] Resuming {batch}.")
+    else:
+        # Most valuable pairs first; low-churn pairs are only re-checked when due
+        planned = planner.plan(planner.matrix_pairs(MATRIX),
+                               budget_seconds=BUDGET_MINUTES * 60 if BUDGET_MINUTES else None,
+                               runs_per_pair=len(SOURCES))
+        print(f"[{datetime.now()}] Planned {len(planned)} of {len(LOCATIONS) * len(CATEGORIES)} pairs.")
+        jobs.submit_batch(batch, [(pair["category"], pair["location"]) for pair in planned], SOURCES)
+
+    # Scraped vendors are ingested as they arrive; no JSON file needed
+    print(f"[{datetime.now()}] Running {batch} on {WORKERS} workers.")
+    # Per-source limits (ratelimit.LIMITS) are shared with every other worker claiming jobs
+    jobs.JobManager(WORKERS, batch=batch, write_json=False).drain()
+    report = jobs.batch_report(batch)
+    print(f"[{datetime.now()}] {report}")
+
+    resolved, merged, seconds = dedupe.resolve_new_vendors()
+    print(f"[{datetime.now()}] Entity resolution: {merged} of {resolved} new rows matched known vendors ({seconds:.1f}s).")
+
+    # Earlier days' partitions are complete; fold their per-run files together
+    try:
+        compacted = archive.compact(before=datetime.now().strftime("%Y-%m-%d"))
+        print(f"[{datetime.now()}] Archive: compacted {compacted} partitions.")
+    except Exception as e:
+        print(f"[{datetime.now()}] Archive compaction failed: {e}")
                 
     # Send email summary
-    summary_msg = f"Daily scraping job complete for {locations}. Check database logs for details."
+    summary_msg = f"Daily scraping job complete for {LOCATIONS}.\n\n{report}\n\nCheck database logs for details."
     send_email("Daily Scraper Report", summary_msg)
     
     print(f"[{datetime.now()}] Scheduled job completed.")
@@ -123,6 +108,11 @@ def send_email(subject, body):
 # Schedule the job every day at 08:00
 schedule.every().day.at("08:00").do(job)
 
+# Finish today's batch if a previous scheduler process died part-way through it
+database.init_db()
+if jobs.has_active_jobs(batch_name()):
+    job()
+
 print("Scheduler started. Job scheduled for 08:00 AM daily.")
 print("To enable email alerts, set GMAIL_USER and GMAIL_APP_PASSWORD environment variables.")
 print("Press Ctrl+C to exit.")
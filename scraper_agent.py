@@ -1,16 +1,45 @@
 import argparse
-import json
-import time
-import random
 import sys
+import time
+import browsers
+import database
+import known
+import normalize
+import pacing
+import pagestate
+import timings
 from playwright.sync_api import sync_playwright
 
-def scrape_justdial(category, location):
+
+JUSTDIAL_URL = "https://www.justdial.com"
+
+
+class ScrapeError(Exception):
+    pass
+
+
+def iter_justdial(category, location, target_count=300, early_stop=None, base_url=JUSTDIAL_URL, pacer=None,
+                  profile=None, metrics=None):
+    """
+    Scrape Justdial, yielding each vendor dict as soon as it is extracted.
+    Raises ScrapeError if the page breaks mid-scrape (debug HTML and a
+    screenshot are saved first), and pagestate.BlockedError as soon as
+    Justdial serves a CAPTCHA or block page. Closing the generator closes
+    the browser. early_stop (a known.EarlyStop) ends the scroll once a run
+    of cards are all vendors we already have. base_url and pacer (instead
+    of the shared Justdial pacer) let scraper_bench.py run it against the
+    local fixture site; profile overrides the source's browser profile
+    (see browsers.py). metrics (a timings.RunMetrics) receives the time spent
+    in each phase and counts of the cards seen and skipped.
+    """
     data = []
+    # Waits between actions adapt to how Justdial is responding
+    pacer = pacer or pacing.get_pacer("justdial")
+    metrics = metrics or timings.RunMetrics("scrape", "justdial", category, location)
     
     with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=False,
+        browser, context = browsers.launch(
+            p, "justdial", profile=profile,
             # Arguments to hide automation
             args=[
                 "--disable-blink-features=AutomationControlled",
@@ -22,30 +51,33 @@ def scrape_justdial(category, location):
                 "--ignore-certificate-errors",
                 "--ignore-certificate-errors-spki-list",
                 "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
+            ],
+            # Additional stealth scripts
+            init_scripts=[
+                "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})",
+                "window.navigator.chrome = { runtime: {} };",
+                "Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]})",
             ]
         )
-        context = browser.new_context(
-            viewport={"width": 1366, "height": 768}
-        )
-        
-        # Additional stealth scripts
-        context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        context.add_init_script("window.navigator.chrome = { runtime: {} };")
-        context.add_init_script("Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]})")
         
         page = context.new_page()
         
         # 1. Navigate
         print(f"Navigating to Justdial...")
-        page.goto("https://www.justdial.com/", timeout=60000)
+        with metrics.span("navigate"), pacer.timed():
+            page.goto(f"{base_url}/", timeout=60000)
         
         try:
+            # A blocked client gets the block page instead of the homepage
+            pagestate.check(page, "justdial", pacer)
+
             # 2. Search
             search_query = f"Wedding {category} in {location}"
             print(f"Searching for: {search_query}")
             
             # Priority 1: Use Search Box (Most reliable if selectors work)
             search_successful = False
+            search_started = time.monotonic()
             try:
                 print("Waiting for search box...")
                 # Try generic input if specific ones fail
@@ -55,27 +87,31 @@ def scrape_justdial(category, location):
                             page.query_selector("input[role='combobox']")
                 if input_box:
                     input_box.fill(search_query)
-                    time.sleep(1)
+                    pacer.wait("click")
                     page.keyboard.press("Enter")
                     print("Used search box. Submitted query.")
                     
-                    # Verify if search actually worked by waiting for result element
-                    try:
-                        print("Verifying search results...")
-                        page.wait_for_selector(".resultbox_title_anchor, .store-name, .cntanr", timeout=10000)
-                        search_successful = True
+                    # Verify if search actually worked; returns as soon as the page is recognisable
+                    print("Verifying search results...")
+                    state = pagestate.wait_for_state(page, "justdial", timeout=10)
+                    search_successful = state == pagestate.RESULTS
+                    if search_successful:
                         print("Search results verified.")
-                    except:
-                        print("Search verification failed (no results found). Triggering fallback.")
-                        search_successful = False
+                    else:
+                        print(f"Search verification failed (page state: {state}). Triggering fallback.")
                 else:
                     print("Search box not found.")
+            except pagestate.BlockedError:
+                raise
             except Exception as e:
                 print(f"Search box interaction failed: {e}")
+                metrics.count("search_errors")
+            metrics.record("search", time.monotonic() - search_started)
 
             # Priority 2: Direct URL (Fallback)
             if not search_successful:
                 print("Trying direct URL navigation as fallback...")
+                metrics.count("search_fallbacks")
                 # Map categories to Justdial slugs
                 slug_map = {
                     "Catering": "Caterers",
@@ -100,34 +136,29 @@ def scrape_justdial(category, location):
                      query_slug = f"Wedding-{cat_slug}"
                 
                 # Construct URL carefully
-                url = f"https://www.justdial.com/{city}/{query_slug}"
+                url = f"{base_url}/{city}/{query_slug}"
                 print(f"Navigating directly to URL: {url}")
                 try:
-                    page.goto(url, timeout=60000)
-                    page.wait_for_load_state("domcontentloaded")
+                    with metrics.span("fallback"), pacer.timed():
+                        page.goto(url, timeout=60000)
+                        page.wait_for_load_state("domcontentloaded")
                 except Exception as e:
                     print(f"Direct navigation failed: {e}")
 
             # 3. Wait for results
             print("Waiting for results to load...")
-            try:
-                # Wait explicitly for result containers
-                # Removed generic 'h2' from wait to ensure we don't proceed on homepage
-                page.wait_for_selector("div.result-box, li.cntanr, div.store-details, .resultbox_title_anchor", timeout=20000)
-            except Exception as w_err:
-                print(f"Warning: Wait for results timed out or page structure changed ({w_err})")
+            # Result containers only; a generic 'h2' would match the homepage
+            with metrics.span("wait_results"):
+                state = pagestate.wait_for_state(page, "justdial", timeout=20, pacer=pacer)
+            if state == pagestate.EMPTY:
+                print("Justdial has no listings for this search.")
+                return
+            if state == pagestate.UNKNOWN:
+                print("Warning: Wait for results timed out or page structure changed")
             
             # 4. Infinite Scroll and Extraction Loop
             data = []
-            target_count = 300 # Increased default target
             
-            BLACKLIST_NAMES = [
-                "Wedding Requisites", "Beauty & Spa", "Repairs & Services", "Daily Needs", 
-                "Bills & Recharge", "Travel Bookings", "Trending Searches", "Explore Top Tourist Places", 
-                "Popular Searches", "Cool Day Essentials", "Follow us on", "One-Stop for All Local Businesses",
-                "JD Mart", "Advertise", "Free Listing", "Login / Sign Up", "Recent Activity", "Seasonal"
-            ]
-
             # Helper for phone extraction
             def extract_phone_number(card_element):
                 try:
@@ -140,20 +171,8 @@ def scrape_justdial(category, location):
                             text = phone_el.get_attribute("title") or phone_el.get_attribute("aria-label") or ""
                         if text: return text
                     
-                    # Strategy 2: Regex on the whole card text
-                    # Mobile: (+91) 6-9xxxxxxxxx
-                    # Landline: 0xxxxx-xxxxxx (Std code 3-5 digits, number 6-8 digits)
-                    card_text = card_element.inner_text()
-                    
-                    # Try finding mobile match
-                    mob_match = re.search(r"(\+91[\-\s]?)?[6-9]\d{9}", card_text)
-                    if mob_match: return mob_match.group(0)
-                    
-                    # Try finding landline match (e.g. 08182 222222)
-                    land_match = re.search(r"\b0\d{2,4}[\-\s]?\d{6,8}\b", card_text)
-                    if land_match: return land_match.group(0)
-                        
-                    return "Not Available"
+                    # Strategy 2: first mobile, else landline number in the whole card text
+                    return normalize.find_phone(card_element.inner_text()) or "Not Available"
                 except:
                     return "Not Available"
 
@@ -165,6 +184,8 @@ def scrape_justdial(category, location):
             current_batch_results = [] # Initialize here
             
             while len(data) < target_count and scroll_attempts < max_scroll_attempts:
+                page_started = time.monotonic()
+                metrics.count("scrolls")
                 # Scroll Logic: Super Smooth Scroll
                 print(f"Scrolling smoothly... (Current count: {len(data)})")
                 
@@ -176,7 +197,7 @@ def scrape_justdial(category, location):
                 scroll_occurred = False
                 for _ in range(0, 40): # Fewer steps, slower
                     page.mouse.wheel(0, 200) # Small step
-                    time.sleep(random.uniform(0.4, 0.7)) # Slow read speed
+                    pacer.wait("step") # Read speed
                     
                     new_height = page.evaluate("document.body.scrollHeight")
                     if new_height > current_height:
@@ -189,9 +210,9 @@ def scrape_justdial(category, location):
                          # We hit bottom, try to jiggle
                          print("  (Hit apparent bottom, jiggling...)")
                          page.mouse.wheel(0, -200)
-                         time.sleep(1)
+                         pacer.wait("click")
                          page.mouse.wheel(0, 200)
-                         time.sleep(1)
+                         pacer.wait("click")
                          
                          # Check for Footer
                          footer = page.query_selector("footer, .footer, #footer")
@@ -208,8 +229,8 @@ def scrape_justdial(category, location):
 
                 print("Finished scroll step.")
                 
-                # 3. Wait for load (Use explicit wait requested by user + random buffer)
-                time.sleep(3 + random.uniform(0, 2)) 
+                # 3. Wait for load (paced; shorter while Justdial keeps up)
+                pacer.wait("load")
                 
                 # 4. Check for "Show More" / "Load More" button
                 try:
@@ -218,7 +239,7 @@ def scrape_justdial(category, location):
                      if show_more: 
                          print("Clicked 'Show More' button.")
                          show_more.click()
-                         time.sleep(2)
+                         pacer.wait("click")
                 except: pass
                 
                 # Start from top strategy to avoid broad matches
@@ -230,6 +251,11 @@ def scrape_justdial(category, location):
                      if show_more: show_more.click()
                 except: pass
                 
+                # Scrolling, waiting for more results and "Show More" so far; extraction from here
+                extract_started = time.monotonic()
+                metrics.record("scroll", extract_started - page_started)
+                extract_seconds = 0.0
+
                 # Start from top strategy to avoid broad matches
                 strategies = [
                     ("li.cntanr", "Classic List Item"),
@@ -250,6 +276,7 @@ def scrape_justdial(category, location):
                         break
                 
                 print(f"  - Found {len(current_batch_results)} items in DOM (Strategy: {strategy_name})")
+                metrics.count("cards_seen", len(current_batch_results))
                 
                 new_items_found = False
                 for card in current_batch_results:
@@ -281,20 +308,23 @@ def scrape_justdial(category, location):
                         # print(f"DEBUG: Raw extracted name: '{name}'")
 
                         # Clean name
-                        name = name.split('\n')[0].strip()
+                        name = normalize.clean_name(name)
                         
                         if name == "Unknown":
                             print(f"DEBUG: Skipped {name} (Name is Unknown)")
+                            metrics.count("unknown_names")
                             continue 
                             
-                        if any(b.lower() in name.lower() for b in BLACKLIST_NAMES):
+                        if normalize.is_blacklisted(name):
                             # print(f"DEBUG: Skipped {name} (Blacklisted)")
+                            metrics.count("blacklisted")
                             continue
                         
                         # Use a simple hash for deduplication
                         item_hash = f"{name}-{location}"
                         if item_hash in processed_hashes:
                             # print(f"DEBUG: Skipped {name} (Duplicate)")
+                            metrics.count("duplicates")
                             continue
                         
                         # Extract details
@@ -322,37 +352,66 @@ def scrape_justdial(category, location):
                         })
                         processed_hashes.add(item_hash)
                         new_items_found = True
+                        if early_stop:
+                            early_stop.see(name)
                         print(f"    + Added: {name} | Phone: {phone}")
+                        metrics.count("vendors")
+                        # The caller's ingest runs while we are suspended; leave it out of extraction
+                        extract_seconds += time.monotonic() - extract_started
+                        yield data[-1]
+                        extract_started = time.monotonic()
                         
                     except Exception as e:
                         print(f"DEBUG: Error extracting {name}: {e}")
+                        metrics.count("extract_errors")
                         continue
+                metrics.record("extract", extract_seconds + time.monotonic() - extract_started)
                 
                 if not new_items_found:
                      print("  - No new items found in this scroll.")
+                     # Stop at once if a challenge replaced the results
+                     pagestate.check(page, "justdial", pacer)
                      scroll_attempts += 1
                 else:
                      scroll_attempts = 0 # Reset
+                     # New results after a scroll: the site is keeping up
+                     pacer.ok()
                      
                 print(f"  - Total extracted: {len(data)}")
 
+                if early_stop:
+                    early_stop.page(time.monotonic() - page_started)
+                    if early_stop.done:
+                        # Everything further down was seen by an earlier run
+                        print(f"Early stop: {early_stop.stop(target_count)}.")
+                        break
+
             if len(data) == 0:
                 print("No data extracted. Check 'last_scrape.html'.")
                 # Save page content for debugging
                 with open("last_scrape.html", "w", encoding="utf-8") as f:
                     f.write(page.content())
 
+        except pagestate.BlockedError as e:
+            print(f"Blocked: {e}", file=sys.stderr)
+            with open("last_scrape_blocked.html", "w", encoding="utf-8") as f:
+                 f.write(page.content())
+            raise
         except Exception as e:
             print(f"Scraping error: {e}", file=sys.stderr)
             # Take screenshot and save HTML on error
             page.screenshot(path="debug_error.png")
             with open("last_scrape_error.html", "w", encoding="utf-8") as f:
                  f.write(page.content())
-            sys.exit(1) # Ensure app.py knows it failed
+            raise ScrapeError(str(e)) from e
+        finally:
+            pacer.save()
 
         browser.close()
-        
-    return data
+
+
+def scrape_justdial(category, location, early_stop=None, **options):
+    return list(iter_justdial(category, location, early_stop=early_stop, **options))
 
 
 
@@ -360,23 +419,28 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--category", required=True)
     parser.add_argument("--location", required=True)
+    parser.add_argument("--format", choices=["json", "records"], default="json",
+                        help="Save a JSON file (default) or a compact records file (see records.py)")
+    parser.add_argument("--stop-after-known", type=int, default=known.KNOWN_RUN_TO_STOP,
+                        help="Stop scrolling after this many known vendors in a row (0: scrape to the end)")
     args = parser.parse_args()
     
     print(f"Starting scraper for {args.category} in {args.location}")
+    early_stop = None
+    if args.stop_after_known:
+        database.init_db()
+        early_stop = known.EarlyStop(known.load(args.category, args.location), args.stop_after_known)
     
-    vendors = scrape_justdial(args.category, args.location)
-    
-    output = {
-        "category": args.category,
-        "location": args.location,
-        "vendors": vendors
-    }
-    # Save to JSON
-    sanitized_category = args.category.replace(' ', '_')
-    sanitized_location = args.location.replace(' ', '_').replace(',', '').replace('/', '_')
-    filename = f"vendors_{sanitized_category}_{sanitized_location}.json"
+    try:
+        vendors = scrape_justdial(args.category, args.location, early_stop)
+    except (ScrapeError, pagestate.BlockedError):
+        sys.exit(1)
     
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump({"category": args.category, "location": args.location, "vendors": vendors}, f, indent=2)
+    # Save to JSON or a records file
+    import pipeline
+    save = pipeline.save_records if args.format == "records" else pipeline.save_json
+    filename = save(args.category, args.location, vendors)
+    if early_stop and early_stop.stopped:
+        print(f"Early stop {early_stop.summary()}.")
         
     print(f"Successfully scraped {len(vendors)} vendors. Saved to {filename}")
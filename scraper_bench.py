@@ -0,0 +1,387 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+import browsers
+import database
+import enrich_agent
+import fixture_site
+import maps_scraper
+import pacing
+import scraper_agent
+
+# Offline scraper benchmark
+# Runs scrape_justdial, scrape_google_maps and enrich_data against the local
+# fixture site (fixture_site.py) in a scratch directory, so nothing touches
+# the real sites, the vendor database or the learned pacing. Per scenario
+# (scraper, layout, cards, latency, browser profile, concurrent scrapes) it
+# records items, wall time, items/s, active ms per item (wall time minus the
+# scraper's paced waits), scroll rounds, and the peak RSS and CPU time of
+# this process plus its Playwright drivers and browsers, in total and per
+# concurrent scrape. Each run is appended to RESULTS_FILE with the git
+# commit it measured; --compare lines the scenarios up across commits.
+
+RESULTS_FILE = "scraper_bench_results.jsonl"
+SCRAPERS = ["justdial", "google_maps", "enrich"]
+CATEGORY = "Catering"
+LOCATION = "Fixture City, Karnataka"
+# Scale of every scraper wait (1.0: the real base delays). Small, so runs
+# measure the scraper rather than its sleeps; still counted in the results.
+DEFAULT_PACE = 0.05
+RSS_SAMPLE_INTERVAL = 0.1
+# --compare flags changes larger than this against the previous commit
+REGRESSION_THRESHOLD = 0.10
+
+
+class BenchPacer(pacing.Pacer):
+    """
+    Pacer that keeps a fixed pace, never saves, and counts and times the
+    waits it makes.
+    """
+    def __init__(self, source, pace=DEFAULT_PACE):
+        super().__init__(source, pace)
+        self.waits = Counter()
+        self.waited = 0.0
+
+    def wait(self, kind):
+        seconds = super().wait(kind)
+        self.waits[kind] += 1
+        self.waited += seconds
+        return seconds
+
+    def _set_pace(self, pace, decision):
+        self.last_decision = decision
+
+    def _save(self):
+        pass
+
+
+def _tree_rss(root):
+    """
+    Resident bytes of `root` and all its descendants, from /proc.
+    """
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children, rss = {}, {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                # Fields after the parenthesised command: state, ppid, ... rss is the 24th field
+                fields = f.read().rsplit(b")", 1)[1].split()
+        except OSError:
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * page_size
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+def _cpu_seconds():
+    """
+    CPU time of this process and its reaped children (the Playwright
+    drivers, which reap their browsers), or None without the resource module.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class ResourceUsage:
+    """
+    Samples the memory of this process tree on a thread while in the with
+    block, and the CPU time spent in it. peak is in bytes; without /proc it
+    falls back to this process's own peak, and is None where neither is
+    available. cpu_seconds counts the drivers and browsers once they have
+    exited, so the scrapes must finish inside the block.
+    """
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = None
+        self.cpu_seconds = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu_started = None
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak or 0, _tree_rss(os.getpid()))
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self._cpu_started = _cpu_seconds()
+        if os.path.isdir("/proc/self"):
+            self._thread = threading.Thread(target=self._sample, name="peak-rss", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._cpu_started is not None:
+            self.cpu_seconds = _cpu_seconds() - self._cpu_started
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            return
+        try:
+            import resource
+        except ImportError:
+            return
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        self.peak = peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit():
+    """
+    (short commit hash, whether the tree has uncommitted changes), or
+    ("unknown", False) outside a git checkout.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(status.strip())
+
+
+def _seed_enrichment(site, vendors):
+    """
+    `vendors` phone-less vendors for enrich_data to look up on the fixture site.
+    """
+    database.init_db()
+    query = f"{CATEGORY} in {LOCATION}"
+    for i in range(vendors):
+        v = fixture_site.vendor(site.seed, query, i)
+        database.add_vendor(v["name"], "Not Available", v["address"], CATEGORY, LOCATION)
+
+
+def run_scenario(scraper, site, pace=DEFAULT_PACE, profile="server", enrich_vendors=20, concurrency=1):
+    """
+    Run one scraper `concurrency` times at once, each in its own thread and
+    browser, against a started FixtureSite. Returns the result dict
+    (without commit information).
+    """
+    source = "justdial" if scraper == "justdial" else "google_maps"
+    pacers = [BenchPacer(source, pace) for _ in range(concurrency)]
+    if scraper == "enrich":
+        _seed_enrichment(site, enrich_vendors)
+    requests_before = site.requests
+    errors = []
+    counts = [0] * concurrency
+
+    def scrape(i):
+        options = {"pacer": pacers[i], "profile": profile}
+        try:
+            if scraper == "justdial":
+                counts[i] = len(scraper_agent.scrape_justdial(CATEGORY, LOCATION, target_count=site.cards,
+                                                              base_url=site.justdial_url, **options))
+            elif scraper == "google_maps":
+                counts[i] = len(maps_scraper.scrape_google_maps(CATEGORY, LOCATION, target_count=site.cards,
+                                                                base_url=site.maps_url, **options))
+            else:
+                enrich_agent.enrich_data(CATEGORY, LOCATION, base_url=site.maps_url, **options)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    with ResourceUsage() as usage:
+        threads = [threading.Thread(target=scrape, args=(i,), name=f"bench-{i}") for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - started
+    if scraper == "enrich":
+        counts = [len(database.get_vendors(category=CATEGORY, location=LOCATION, with_phone=True))]
+    items = sum(counts)
+
+    layout = site.layout if scraper == "justdial" else site.maps_layout
+    cards = enrich_vendors if scraper == "enrich" else site.cards
+    # One "load" wait per Justdial scroll round, one "settle" per Maps scroll, one "page" per search
+    scroll_kind = {"justdial": "load", "google_maps": "settle", "enrich": "page"}[scraper]
+    # Per scrape: the scrapes run side by side, so each had the whole wall time
+    waited = sum(pacer.waited for pacer in pacers) / concurrency
+    per_scrape = items / concurrency
+    scenario = f"{scraper}/{layout}/{cards} cards/{site.latency:g}s latency/{profile}"
+    if concurrency > 1:
+        scenario += f" x{concurrency}"
+    return {
+        "scenario": scenario,
+        "scraper": scraper,
+        "layout": layout,
+        "cards": cards,
+        "page_size": site.page_size,
+        "latency": site.latency,
+        "pace": pace,
+        "profile": profile,
+        "concurrency": concurrency,
+        "items": items,
+        "wall_seconds": round(wall, 3),
+        "items_per_second": round(items / wall, 3) if wall else None,
+        "ms_per_card": round((wall - waited) * 1000 / per_scrape, 1) if items else None,
+        "scrolls": sum(pacer.waits[scroll_kind] for pacer in pacers),
+        "waited_seconds": round(waited, 3),
+        "peak_rss_mb": round(usage.peak / 2 ** 20, 1) if usage.peak else None,
+        "rss_mb_per_scrape": round(usage.peak / 2 ** 20 / concurrency, 1) if usage.peak else None,
+        "cpu_seconds": round(usage.cpu_seconds, 2) if usage.cpu_seconds is not None else None,
+        "cpu_seconds_per_scrape": round(usage.cpu_seconds / concurrency, 2) if usage.cpu_seconds is not None
+        else None,
+        "requests": site.requests - requests_before,
+        "error": "; ".join(errors) or None,
+    }
+
+
+def run(scrapers=SCRAPERS, cards=100, page_size=20, latencies=(0.0,), layouts=("classic",),
+        maps_layouts=("aria",), pace=DEFAULT_PACE, profiles=("server",), enrich_vendors=20, concurrency=1):
+    """
+    Run every scenario in a scratch working directory (the scrapers write
+    their debug files and the enrichment database there). Returns the
+    result dicts.
+    """
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="scraper_bench_") as tmp:
+        os.chdir(tmp)
+        try:
+            for latency in latencies:
+                for profile in profiles:
+                    for scraper in scrapers:
+                        variants = layouts if scraper == "justdial" else maps_layouts
+                        for layout in variants:
+                            site_options = {"layout": layout} if scraper == "justdial" else {"maps_layout": layout}
+                            with fixture_site.FixtureSite(cards, page_size, latency, **site_options) as site:
+                                result = run_scenario(scraper, site, pace, profile, enrich_vendors, concurrency)
+                            print(format_result(result))
+                            results.append(result)
+                            if os.path.exists(database.DB_NAME):
+                                # Each enrichment run starts from its own vendors
+                                os.remove(database.DB_NAME)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def format_result(result):
+    if result["error"]:
+        return f"{result['scenario']}: failed after {result['wall_seconds']:.1f}s ({result['error']})"
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] else "n/a"
+    ms = f"{result['ms_per_card']:.0f}" if result["ms_per_card"] is not None else "-"
+    line = (f"{result['scenario']}: {result['items']} items in {result['wall_seconds']:.1f}s "
+            f"({result['items_per_second']:.1f}/s), {ms} ms/item active, {result['scrolls']} scrolls, "
+            f"{result['waited_seconds']:.1f}s waiting, peak RSS {rss}")
+    if result["cpu_seconds"] is not None:
+        line += f", CPU {result['cpu_seconds']:.1f}s"
+    if result["concurrency"] > 1 and result["rss_mb_per_scrape"]:
+        line += f"; per scrape {result['rss_mb_per_scrape']:.0f} MB"
+        if result["cpu_seconds_per_scrape"] is not None:
+            line += f", {result['cpu_seconds_per_scrape']:.1f}s CPU"
+    return line
+
+
+def save_results(results, path=RESULTS_FILE):
+    commit, dirty = git_commit()
+    recorded_at = datetime.now().isoformat(timespec="seconds")
+    with open(path, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps({"commit": commit, "dirty": dirty, "recorded_at": recorded_at, **result}) + "\n")
+    return commit, dirty
+
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(results, last=5):
+    """
+    Per scenario, the latest run of each of the `last` most recently
+    measured commits, flagging changes beyond REGRESSION_THRESHOLD.
+    Returns the report lines.
+    """
+    by_scenario = {}
+    for result in results:
+        if result.get("error"):
+            continue
+        label = result["commit"] + ("+" if result.get("dirty") else "")
+        runs = by_scenario.setdefault(result["scenario"], {})
+        # Re-measuring a commit replaces its earlier run and moves it last
+        runs.pop(label, None)
+        runs[label] = result
+
+    lines = []
+    for scenario, runs in sorted(by_scenario.items()):
+        lines.append(scenario)
+        previous = None
+        for label, result in list(runs.items())[-last:]:
+            flags = []
+            if previous:
+                for key, worse_if_higher in [("items_per_second", False), ("ms_per_card", True),
+                                             ("peak_rss_mb", True), ("cpu_seconds", True)]:
+                    old, new = previous.get(key), result.get(key)
+                    if old and new is not None:
+                        change = (new - old) / old
+                        if (change > REGRESSION_THRESHOLD) if worse_if_higher else (change < -REGRESSION_THRESHOLD):
+                            flags.append(f"{key} {change:+.0%}")
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result.get("peak_rss_mb") else "n/a"
+            ms = f"{result['ms_per_card']:.0f}" if result.get("ms_per_card") is not None else "-"
+            cpu = f"{result['cpu_seconds']:.1f}s" if result.get("cpu_seconds") is not None else "n/a"
+            lines.append(f"  {label:<10} {result['items_per_second']:7.1f} items/s {ms:>6} ms/item  "
+                         f"{result['scrolls']:3} scrolls  {rss:>7}  CPU {cpu:>6}  {result['recorded_at']}"
+                         + (f"  REGRESSION: {', '.join(flags)}" if flags else ""))
+            previous = result
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against a local fixture site.")
+    parser.add_argument("--scrapers", nargs="+", choices=SCRAPERS, default=SCRAPERS)
+    parser.add_argument("--cards", type=int, default=100, help="Cards the fixture serves per search")
+    parser.add_argument("--page-size", type=int, default=20, help="Cards per infinite-scroll load")
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0], help="Seconds before each response")
+    parser.add_argument("--layouts", nargs="+", choices=fixture_site.JUSTDIAL_LAYOUTS, default=["classic"])
+    parser.add_argument("--maps-layouts", nargs="+", choices=fixture_site.MAPS_LAYOUTS, default=["aria"])
+    parser.add_argument("--enrich-vendors", type=int, default=20, help="Vendors enrich_data looks up")
+    parser.add_argument("--pace", type=float, default=DEFAULT_PACE, help="Scale of the scrapers' waits")
+    parser.add_argument("--profiles", nargs="+", choices=list(browsers.PROFILES), default=["server"],
+                        help="Browser profiles to run each scenario under")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Scrapes run at once per scenario, each with its own browser")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON-lines file the runs are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Print the results only")
+    parser.add_argument("--compare", action="store_true", help="Compare the stored runs across commits and exit")
+    parser.add_argument("--last", type=int, default=5, help="Commits shown by --compare")
+    args = parser.parse_args()
+
+    results_path = os.path.abspath(args.results)
+    if args.compare:
+        lines = compare(load_results(results_path), args.last)
+        print("\n".join(lines) if lines else f"No runs in {results_path} yet.")
+        sys.exit(0)
+
+    results = run(args.scrapers, args.cards, args.page_size, args.latency, args.layouts, args.maps_layouts,
+                  args.pace, args.profiles, args.enrich_vendors, args.concurrency)
+    if not args.no_save:
+        commit, dirty = save_results(results, results_path)
+        print(f"Saved {len(results)} results for {commit}{' (uncommitted changes)' if dirty else ''} "
+              f"to {results_path}.")
+    sys.exit(1 if any(result["error"] for result in results) else 0)
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import jobs
+import ratelimit
+
+LIMITS = {"justdial": {"concurrency": 2, "per_minute": 0}, "google_maps": {"concurrency": 1, "per_minute": 0}}
+
+
+class ClaimLimitTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._saved = database.DB_NAME, ratelimit.LIMITS
+        database.DB_NAME = os.path.join(self._tmp.name, "test.db")
+        ratelimit.LIMITS = ratelimit.merge_limits(LIMITS)
+        database.init_db()
+
+    def tearDown(self):
+        database.DB_NAME, ratelimit.LIMITS = self._saved
+        self._tmp.cleanup()
+
+    def submit(self, kind, count, source=None):
+        return [jobs.submit_job(kind, "Catering", f"Town {i}", source, notify=False) for i in range(count)]
+
+    def test_concurrency_cap_holds_across_owners(self):
+        self.submit("scrape", 3)
+        # Each owner stands for another process; the cap counts the jobs table
+        self.assertIsNotNone(jobs.claim_job("host-a:1:w0"))
+        self.assertIsNotNone(jobs.claim_job("host-b:2:w0"))
+        self.assertIsNone(jobs.claim_job("host-c:3:w0"))
+
+    def test_enrich_jobs_count_against_their_source(self):
+        self.submit("scrape", 1, "google_maps")
+        self.submit("enrich", 1)
+        self.assertEqual(jobs.claim_job("a")["kind"], "scrape")
+        self.assertIsNone(jobs.claim_job("b"))
+
+    def test_starts_are_spaced(self):
+        ratelimit.LIMITS = ratelimit.merge_limits({"justdial": {"concurrency": 2, "per_minute": 1}})
+        self.submit("scrape", 2)
+        self.assertIsNotNone(jobs.claim_job("a"))
+        self.assertIsNone(jobs.claim_job("b"))
+        # A minute later the second one may start
+        conn = sqlite3.connect(database.DB_NAME)
+        conn.execute("UPDATE source_health SET last_started_at = last_started_at - 60")
+        conn.commit()
+        conn.close()
+        self.assertIsNotNone(jobs.claim_job("b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# A coordinator and several node processes on this machine, scraping a fake
+# source so no browser is needed. This file is also their entry point:
+#   python tests/test_coordinator.py serve BATCH PORT
+#   python tests/test_coordinator.py node URL [--crash]
+PAIRS = [("Catering", f"Town {i}, Karnataka") for i in range(6)]
+VENDORS_PER_SHARD = 30
+LEASE_SECONDS = 3
+
+
+def _fake_source(crash):
+    def scrape(category, location, early_stop=None, metrics=None):
+        for i in range(VENDORS_PER_SHARD):
+            if crash and i == VENDORS_PER_SHARD // 2:
+                # Dies mid-shard without a word to the coordinator
+                os._exit(1)
+            time.sleep(0.02)
+            town = int(location.split(",")[0].split()[-1])
+            yield {"name": f"{location} Caterer {i}", "phone": f"98{town:03d}{i:05d}",
+                   "address": f"node {os.getpid()}", "rating": "4.0"}
+    return scrape
+
+
+def _serve(batch, port):
+    import coordinator
+    import database
+    import jobs
+
+    jobs.LEASE_SECONDS = LEASE_SECONDS
+    coordinator.EXPIRE_INTERVAL = 1.0
+    database.init_db()
+    jobs.submit_batch(batch, PAIRS, ["justdial"])
+    coordinator.serve(batch, port=int(port))
+
+
+def _node(url, crash=False):
+    import coordinator
+    import pipeline
+
+    coordinator.NODE_POLL_INTERVAL = 0.5
+    pipeline.SOURCES["justdial"] = _fake_source(crash)
+    coordinator.Node(url).run()
+
+
+class CoordinatorProcessesTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.env = dict(os.environ, SINGLE_WRITER="0", KNOWN_RUN_TO_STOP="0",
+                        SOURCE_LIMITS=json.dumps({"justdial": {"concurrency": 4, "per_minute": 0}}))
+        self.processes = []
+
+    def tearDown(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        self._tmp.cleanup()
+
+    def start(self, *args):
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *args], cwd=self._tmp.name,
+                                   env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes.append(process)
+        return process
+
+    def wait_for_port(self, port):
+        import socket
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        self.fail("coordinator did not start")
+
+    def test_shards_are_split_and_lost_leases_recovered(self):
+        import socket
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        url = f"http://127.0.0.1:{port}"
+        server = self.start("serve", "test-batch", str(port))
+        self.wait_for_port(port)
+
+        # This node leases a shard and dies halfway through it
+        crashed = self.start("node", url, "--crash")
+        self.assertEqual(crashed.wait(timeout=60), 1)
+        nodes = [self.start("node", url) for _ in range(3)]
+        self.assertEqual(server.wait(timeout=120), 0)
+        for node in nodes:
+            self.assertEqual(node.wait(timeout=30), 0)
+
+        conn = sqlite3.connect(os.path.join(self._tmp.name, "marriage_vendors.db"))
+        statuses = conn.execute("SELECT status, attempts FROM jobs WHERE batch = 'test-batch'").fetchall()
+        workers = conn.execute("SELECT COUNT(DISTINCT address) FROM vendors WHERE address != ?",
+                               (f"node {crashed.pid}",)).fetchone()[0]
+        vendors = conn.execute("SELECT COUNT(*) FROM vendors").fetchone()[0]
+        conn.close()
+        self.assertEqual([status for status, _ in statuses], ["succeeded"] * len(PAIRS))
+        # The crashed node's shard went to another node once its lease ran out
+        self.assertIn(2, [attempts for _, attempts in statuses])
+        # Every shard's vendors arrived, from more than one surviving node
+        self.assertEqual(vendors, len(PAIRS) * VENDORS_PER_SHARD)
+        self.assertGreater(workers, 1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        _serve(*sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "node":
+        _node(sys.argv[2], crash="--crash" in sys.argv)
+    else:
+        unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+CATEGORY, LOCATION = "Catering", "Mysore, Karnataka"
+
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._saved = database.DB_NAME, database.SINGLE_WRITER
+        database.DB_NAME = os.path.join(self._tmp.name, "test.db")
+        database.SINGLE_WRITER = False
+        database.init_db()
+
+    def tearDown(self):
+        database.DB_NAME, database.SINGLE_WRITER = self._saved
+        self._tmp.cleanup()
+
+    def ingest(self, vendors, run_id=None, pair=None):
+        run_id = run_id or database.start_scrape_run(CATEGORY, LOCATION)
+        return database.ingest_vendors(run_id, vendors, CATEGORY, LOCATION, pair)
+
+    def stored(self):
+        conn = sqlite3.connect(database.DB_NAME)
+        rows = conn.execute("SELECT name, phone_e164, address FROM vendors ORDER BY phone_e164").fetchall()
+        conn.close()
+        return rows
+
+    def test_same_name_different_phones_are_two_vendors(self):
+        first = {"name": "Sri Caterers", "phone": "98765 43210", "address": "1, MG Road"}
+        second = {"name": "Sri Caterers", "phone": "91234 56780", "address": "2, BH Road"}
+        self.assertEqual(self.ingest([first, second]), {"seen": 2, "new": 2, "changed": 0, "repeated": 0})
+        expected = [("Sri Caterers", "+919123456780", "2, BH Road"), ("Sri Caterers", "+919876543210", "1, MG Road")]
+        self.assertEqual(self.stored(), expected)
+
+        # Cards in the other order match their own rows; nothing flips
+        self.assertEqual(self.ingest([second, first]), {"seen": 2, "new": 0, "changed": 0, "repeated": 0})
+        self.assertEqual(self.stored(), expected)
+
+    def test_phone_fills_a_row_without_one(self):
+        self.ingest([{"name": "Sri Caterers", "phone": "Not Available", "address": "1, MG Road"}])
+        stats = self.ingest([{"name": "Sri Caterers", "phone": "98765 43210", "address": "1, MG Road"}])
+        self.assertEqual(stats, {"seen": 1, "new": 0, "changed": 1, "repeated": 0})
+        self.assertEqual(self.stored(), [("Sri Caterers", "+919876543210", "1, MG Road")])
+
+    def test_repeated_card_is_counted(self):
+        card = {"name": "Sri Caterers", "phone": "98765 43210", "address": "1, MG Road"}
+        self.assertEqual(self.ingest([card, dict(card)]), {"seen": 1, "new": 1, "changed": 0, "repeated": 1})
+
+    def test_batches_of_one_run_share_the_pair(self):
+        run_id = database.start_scrape_run(CATEGORY, LOCATION)
+        pair = database.PairRows()
+        first = {"name": "Sri Caterers", "phone": "98765 43210", "address": "1, MG Road"}
+        second = {"name": "Sri Caterers", "phone": "91234 56780", "address": "2, BH Road"}
+        self.ingest([first], run_id, pair)
+        loaded = pair.by_name
+        self.assertEqual(self.ingest([second, dict(first)], run_id, pair),
+                         {"seen": 1, "new": 1, "changed": 0, "repeated": 1})
+        self.assertIs(pair.by_name, loaded)
+        self.assertEqual(len(self.stored()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
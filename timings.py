@@ -0,0 +1,212 @@
+import argparse
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import database
+import writer
+
+# Run timings
+# Each scrape, Maps scrape and enrichment run carries a RunMetrics: the
+# scrapers wrap their phases (navigate, search, scroll, extract, ...) in
+# span() and count what they see (cards, duplicates, blacklisted names), and
+# the pipeline adds the ingest batches. At the end of the run the spans and
+# counters are written to run_metrics under one metric_runs row, linked to
+# the scrape run when there is one, as one op of the database writer.
+# get_phase_stats() and get_throughput() feed the Dashboard's run timings
+# panel; python timings.py prints the same.
+
+# Spans of the scrapers, in the order a run goes through them
+PHASES = ["navigate", "search", "fallback", "wait_results", "scroll", "extract", "lookup", "update", "ingest"]
+
+RUN_COLUMNS = ["id", "scrape_run_id", "kind", "source", "category", "location", "started_at", "seconds",
+               "items", "status"]
+
+
+class RunMetrics:
+    """
+    Timing spans and counters of one run. Not thread-safe: one run, one
+    thread (the pipeline's ingest runs between the scraper's yields).
+    """
+    def __init__(self, kind, source, category, location):
+        self.kind = kind
+        self.source = source
+        self.category = category
+        self.location = location
+        self.started_at = database._now()
+        self.spans = []
+        self.counts = Counter()
+        self._started = time.monotonic()
+
+    @contextmanager
+    def span(self, phase):
+        """
+        Time the block as one span of `phase`, whether or not it raises.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, time.monotonic() - started)
+
+    def record(self, phase, seconds):
+        # For phases timed by hand, e.g. extraction that yields to the caller mid-way
+        self.spans.append((phase, seconds))
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    @property
+    def seconds(self):
+        return time.monotonic() - self._started
+
+    def phase_totals(self):
+        totals = defaultdict(float)
+        for phase, seconds in self.spans:
+            totals[phase] += seconds
+        return dict(totals)
+
+    def summary(self):
+        """
+        Seconds per phase, e.g. "navigate 2.1s, scroll 41.0s, extract 3.2s".
+        """
+        totals = self.phase_totals()
+        order = PHASES + sorted(set(totals) - set(PHASES))
+        return ", ".join(f"{phase} {totals[phase]:.1f}s" for phase in order if phase in totals)
+
+    def to_dict(self):
+        return {"kind": self.kind, "source": self.source, "category": self.category, "location": self.location,
+                "started_at": self.started_at, "seconds": self.seconds, "spans": self.spans,
+                "counts": dict(self.counts)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        A RunMetrics sent by a coordinator node (see to_dict).
+        """
+        metrics = cls(data["kind"], data["source"], data["category"], data["location"])
+        metrics.started_at = data["started_at"]
+        metrics.spans = [tuple(span) for span in data["spans"]]
+        metrics.counts.update(data["counts"])
+        metrics._started = time.monotonic() - data["seconds"]
+        return metrics
+
+    def save(self, status, items=None, scrape_run_id=None):
+        """
+        Write the run and its spans and counters, through the database
+        writer. Returns the metric_runs id, or None if the database could
+        not take it; timings never fail a run.
+        """
+        items = self.counts.get("vendors", 0) if items is None else items
+        run = (scrape_run_id, self.kind, self.source, self.category, self.location, self.started_at,
+               self.seconds, items, status)
+        try:
+            return database._write(_save_run, run, list(self.spans), list(self.counts.items()))
+        except (sqlite3.Error, writer.WriterBusy) as e:
+            print(f"Could not save run timings: {e}")
+            return None
+
+
+def _save_run(c, run, spans, counts):
+    c.execute('''INSERT INTO metric_runs (scrape_run_id, kind, source, category, location, started_at,
+                                          seconds, items, status)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', run)
+    metric_run_id = c.lastrowid
+    c.executemany("INSERT INTO run_metrics (metric_run_id, kind, name, value) VALUES (?, 'span', ?, ?)",
+                  [(metric_run_id, phase, seconds) for phase, seconds in spans])
+    c.executemany("INSERT INTO run_metrics (metric_run_id, kind, name, value) VALUES (?, 'count', ?, ?)",
+                  [(metric_run_id, name, value) for name, value in counts])
+    return metric_run_id
+
+
+def _percentile(values, q):
+    # Nearest-rank percentile of sorted values
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+
+def get_phase_stats(since=None, source=None):
+    """
+    Latency distribution of every phase over the runs started since `since`,
+    as dicts with source, phase, spans, runs, p50, p90, max and total
+    (seconds), in PHASES order per source.
+    """
+    query = '''SELECT r.source, m.name, m.metric_run_id, m.value FROM run_metrics m
+               JOIN metric_runs r ON r.id = m.metric_run_id WHERE m.kind = 'span' '''
+    params = []
+    if since:
+        query += " AND r.started_at >= ?"
+        params.append(since)
+    if source:
+        query += " AND r.source = ?"
+        params.append(source)
+    conn = sqlite3.connect(database.DB_NAME)
+    c = conn.cursor()
+    c.execute(query, params)
+    rows = c.fetchall()
+    conn.close()
+
+    spans = defaultdict(list)
+    runs = defaultdict(set)
+    for row_source, phase, metric_run_id, seconds in rows:
+        spans[row_source, phase].append(seconds)
+        runs[row_source, phase].add(metric_run_id)
+    order = {phase: i for i, phase in enumerate(PHASES)}
+    stats = []
+    for (row_source, phase), values in sorted(spans.items(), key=lambda item: (item[0][0],
+                                                                               order.get(item[0][1], len(order)),
+                                                                               item[0][1])):
+        values.sort()
+        stats.append({"source": row_source, "phase": phase, "spans": len(values),
+                      "runs": len(runs[row_source, phase]), "p50": _percentile(values, 0.5),
+                      "p90": _percentile(values, 0.9), "max": values[-1], "total": sum(values)})
+    return stats
+
+
+def get_throughput(since=None, limit=500):
+    """
+    Finished runs, oldest first, as dicts with RUN_COLUMNS plus
+    items_per_minute and counts (the run's counters).
+    """
+    query = f"SELECT {', '.join(RUN_COLUMNS)} FROM metric_runs"
+    params = []
+    if since:
+        query += " WHERE started_at >= ?"
+        params.append(since)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    conn = sqlite3.connect(database.DB_NAME)
+    c = conn.cursor()
+    c.execute(query, params)
+    runs = [dict(zip(RUN_COLUMNS, row)) for row in reversed(c.fetchall())]
+    counts = defaultdict(dict)
+    if runs:
+        placeholders = ", ".join("?" * len(runs))
+        c.execute(f'''SELECT metric_run_id, name, value FROM run_metrics
+                      WHERE kind = 'count' AND metric_run_id IN ({placeholders})''', [run["id"] for run in runs])
+        for metric_run_id, name, value in c.fetchall():
+            counts[metric_run_id][name] = int(value)
+    conn.close()
+    for run in runs:
+        run["items_per_minute"] = run["items"] * 60 / run["seconds"] if run["seconds"] else None
+        run["counts"] = counts.get(run["id"], {})
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show per-phase run timings.")
+    parser.add_argument("--since", help="Only runs started at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--source", help="Only runs of this source")
+    args = parser.parse_args()
+
+    database.init_db()
+    stats = get_phase_stats(args.since, args.source)
+    if not stats:
+        print("No run timings recorded yet.")
+    for row in stats:
+        print(f"{row['source']:<12} {row['phase']:<13} {row['spans']:>6} spans in {row['runs']:>4} runs: "
+              f"p50 {row['p50']:6.2f}s, p90 {row['p90']:6.2f}s, max {row['max']:6.2f}s, total {row['total']:8.1f}s")
+    runs = [run for run in get_throughput(args.since) if not args.source or run["source"] == args.source]
+    if runs:
+        rates = [run["items_per_minute"] for run in runs if run["items_per_minute"] is not None]
+        print(f"{len(runs)} runs, {sum(run['items'] for run in runs)} items, "
+              f"median {sorted(rates)[len(rates) // 2] if rates else 0:.1f} items/min")
@@ -0,0 +1,283 @@
+import argparse
+import atexit
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+import database
+
+# Single database writer
+# Scrapers, the enrichment agent and the job workers of one process used to
+# open their own connections and commit separately, so parallel runs hit
+# "database is locked" and lost writes. With database.SINGLE_WRITER (the
+# default) their vendor batches, enrichment updates, scrape-run updates and
+# log events are queued here instead. One thread owns the only write
+# connection and commits whatever is waiting in one transaction, of up to
+# MAX_TRANSACTION_OPS ops. Each op runs in its own savepoint, so a failing
+# op only fails its own producer. The queue holds QUEUE_SIZE ops; producers
+# block while it is full (backpressure), and the time they waited is counted.
+# Other processes still have their own writer; between processes SQLite's
+# lock and the connection timeout apply.
+#   python writer.py --benchmark 8    N threads writing directly vs. through the writer
+
+QUEUE_SIZE = 200
+MAX_TRANSACTION_OPS = 50
+# Seconds the writer waits for more ops before committing a partial transaction
+BATCH_WINDOW = 0.01
+# Seconds a producer blocks on a full queue before giving up
+PUT_TIMEOUT = 120
+# Seconds another process may hold the database lock before a commit fails
+LOCK_TIMEOUT = 30
+# Commit latencies kept for the percentiles in stats()
+LATENCY_SAMPLES = 500
+
+
+class WriterBusy(Exception):
+    pass
+
+
+class Writer:
+    """
+    The writer thread and its queue. submit(op, *args) queues op(cursor,
+    *args) and returns a Future with its result; background ops (log
+    events) print their failure, as nobody waits for them.
+    """
+    def __init__(self, queue_size=QUEUE_SIZE, max_ops=MAX_TRANSACTION_OPS, window=BATCH_WINDOW):
+        self.max_ops = max_ops
+        self.window = window
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._conn = None
+        self._conn_key = None
+        self._commit_latencies = []
+        self._stats = {"ops": 0, "failed_ops": 0, "transactions": 0, "failed_transactions": 0,
+                       "producer_waits": 0, "producer_wait_seconds": 0.0, "max_depth": 0}
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, op, *args, background=False):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("writer ops cannot queue further writes")
+        future = Future()
+        item = (op, args, future, background)
+        with self._lock:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Backpressure: the producer waits for the writer to catch up
+            started = time.monotonic()
+            try:
+                self._queue.put(item, timeout=PUT_TIMEOUT)
+            except queue.Full:
+                self._done(1)
+                raise WriterBusy(f"write queue full for {PUT_TIMEOUT}s") from None
+            finally:
+                with self._lock:
+                    self._stats["producer_waits"] += 1
+                    self._stats["producer_wait_seconds"] += time.monotonic() - started
+        with self._lock:
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._queue.qsize())
+        return future
+
+    def _done(self, count):
+        with self._lock:
+            self._pending -= count
+            if not self._pending:
+                self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Block until every queued op is committed (or failed). Returns False
+        if that took longer than `timeout` seconds.
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def _connection(self):
+        # Reconnect when DB_NAME changes or the file is replaced (e.g. deleted and re-created)
+        path = os.path.abspath(database.DB_NAME)
+        database.migrate(path)
+        key = (path, os.stat(path).st_ino)
+        if key != self._conn_key:
+            if self._conn:
+                self._conn.close()
+            # Only this thread uses it; close() may come from another
+            self._conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn_key = key
+        return self._conn
+
+    def _take(self):
+        # The first op waits as long as it takes; the rest of the transaction only BATCH_WINDOW
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(items) < self.max_ops:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._take()
+            results = []
+            started = time.monotonic()
+            try:
+                c = self._connection().cursor()
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    for op, args, _, _ in items:
+                        c.execute("SAVEPOINT op")
+                        try:
+                            results.append((op(c, *args), None))
+                        except Exception as e:
+                            c.execute("ROLLBACK TO op")
+                            results.append((None, e))
+                        c.execute("RELEASE op")
+                    c.execute("COMMIT")
+                except Exception:
+                    c.execute("ROLLBACK")
+                    raise
+            except Exception as e:
+                # Nothing in the transaction was written
+                results = [(None, e)] * len(items)
+                with self._lock:
+                    self._stats["failed_transactions"] += 1
+            finished = time.monotonic()
+
+            with self._lock:
+                self._stats["transactions"] += 1
+                self._stats["ops"] += len(items)
+                self._commit_latencies.append(finished - started)
+                del self._commit_latencies[:-LATENCY_SAMPLES]
+            for (op, args, future, background), (result, error) in zip(items, results):
+                if error is None:
+                    future.set_result(result)
+                    continue
+                with self._lock:
+                    self._stats["failed_ops"] += 1
+                future.set_exception(error)
+                if background:
+                    # Nobody waits for a log event to raise to
+                    print(f"Background write {op.__name__} failed: {error}")
+            self._done(len(items))
+
+    def stats(self):
+        """
+        Queue depth, ops and transactions so far, producer waits on a full
+        queue and commit latency percentiles (seconds).
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._commit_latencies)
+        stats["depth"] = self._queue.qsize()
+        stats["capacity"] = self._queue.maxsize
+        stats["ops_per_transaction"] = stats["ops"] / stats["transactions"] if stats["transactions"] else None
+        for name, q in [("commit_p50", 0.5), ("commit_p90", 0.9), ("commit_max", 1.0)]:
+            stats[name] = latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+        return stats
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    The process-wide Writer, started on first use.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = Writer()
+            atexit.register(_flush_at_exit)
+        return _writer
+
+
+def _flush_at_exit():
+    # Commit queued log events before the interpreter exits
+    if not _writer.flush(30):
+        print("Queued database writes were still pending at exit.")
+
+
+def get_stats():
+    """
+    stats() of this process's writer, or None if nothing has written yet.
+    """
+    return _writer.stats() if _writer else None
+
+
+def _benchmark_op(c, thread, i, rows=25):
+    # About the size of one ingest batch
+    c.executemany("INSERT INTO scraper_logs (timestamp, category, location, status, message) VALUES (?, ?, ?, ?, ?)",
+                  [(database._now(), f"thread {thread}", "bench", "Success", f"write {i}.{row}")
+                   for row in range(rows)])
+
+
+def benchmark(threads, writes=200, lock_timeout=1.0):
+    """
+    `threads` threads each make `writes` batch-sized writes, first every one
+    on its own connection (giving up after lock_timeout seconds locked, as
+    the scrapers' connections did after the default 5), then through the
+    writer, in a scratch database.
+    """
+    with tempfile.TemporaryDirectory(prefix="writer_bench_") as tmp:
+        database.DB_NAME = os.path.join(tmp, "bench.db")
+        database.init_db()
+
+        def direct(thread):
+            for i in range(writes):
+                try:
+                    conn = sqlite3.connect(database.DB_NAME, timeout=lock_timeout)
+                    _benchmark_op(conn.cursor(), thread, i)
+                    conn.commit()
+                    conn.close()
+                except sqlite3.OperationalError:
+                    errors.append(thread)
+
+        def queued(thread):
+            for i in range(writes):
+                get_writer().submit(_benchmark_op, thread, i).result()
+
+        for label, target in [("direct connections", direct), ("single writer", queued)]:
+            errors = []
+            workers = [threading.Thread(target=target, args=(t,)) for t in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            seconds = time.perf_counter() - started
+            total = threads * writes
+            print(f"{label:<20} {total} writes in {seconds:.2f}s ({(total - len(errors)) / seconds:,.0f}/s), "
+                  f"{len(errors)} lost to 'database is locked'")
+        stats = get_writer().stats()
+        print(f"Writer: {stats['transactions']} transactions ({stats['ops_per_transaction']:.1f} ops each), "
+              f"commit p50 {stats['commit_p50'] * 1000:.1f} ms, p90 {stats['commit_p90'] * 1000:.1f} ms, "
+              f"max queue depth {stats['max_depth']}, {stats['producer_waits']} producer waits")
+        if _writer._conn:
+            _writer._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the single database writer.")
+    parser.add_argument("--benchmark", type=int, metavar="THREADS", default=8,
+                        help="Concurrent writer threads (default 8)")
+    parser.add_argument("--writes", type=int, default=200, help="Writes per thread")
+    parser.add_argument("--lock-timeout", type=float, default=1.0,
+                        help="Seconds a direct connection waits for the lock")
+    args = parser.parse_args()
+    benchmark(args.benchmark, args.writes, args.lock_timeout)